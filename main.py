@@ -1,39 +1,115 @@
-from utils.api_controller import ApiController
-from patches import patch_linked_dir, patch_predict_dataset
-import yaml
-from model.anomaly_model_training import create_dataset, train_model
-from model.classifier_model_training import train_svm_end_to_end
-from model.inference_loop import run_inference
+import multiprocessing as mp
+import os
 import time
 import threading
 
+import yaml
+
+from model.inference_worker import (
+    build_server,
+    camera_stream_kwargs,
+    start_camera,
+    stop_uploads,
+    worker_main,
+)
+from utils.camera_stream import BufferedVideoStream
 from utils.logger import logger
+from utils.shm_ring import ShmChannel, ShmFramePublisher
+
+
+def _start_processes(config: dict, proc_cfg: dict, stop_ev):
+    """
+    Captura aqui (streams + publicadores shm); inferência em processos: os POs
+    são distribuídos em round-robin entre os workers. Só descritores cruzam
+    a fronteira entre processos.
+    """
+    cameras = config["cameras"]
+    ctx = mp.get_context("spawn")
+    n_workers = max(
+        1, min(len(cameras), int(proc_cfg.get("workers") or os.cpu_count() or 1))
+    )
+    groups: list[list[tuple[dict, ShmChannel]]] = [[] for _ in range(n_workers)]
+    captures = []
+    for i, camera in enumerate(cameras):
+        stream = BufferedVideoStream(**camera_stream_kwargs(camera))
+        stream.start()
+        channel = ShmChannel(ctx, camera["po"], max_queue=proc_cfg.get("max_queue", 2))
+        publisher = ShmFramePublisher(
+            stream, channel, n_slots=proc_cfg.get("ring_slots", 4)
+        )
+        publisher.start()
+        captures.append((stream, publisher))
+        groups[i % n_workers].append((camera, channel))
+
+    procs = [
+        _spawn_worker(ctx, config, group, stop_ev, k) for k, group in enumerate(groups)
+    ]
+    return procs, groups, captures
+
+
+def _spawn_worker(ctx, config: dict, group, stop_ev, k: int):
+    proc = ctx.Process(
+        target=worker_main,
+        args=(config, [c for c, _ in group], [ch for _, ch in group], stop_ev),
+        name=f"inference_worker_{k}",
+        daemon=True,
+    )
+    proc.start()
+    return proc
+
+
+def _check_workers(config: dict, procs: list, groups: list, stop_ev) -> None:
+    """Worker que morreu (ex.: falha ao carregar o modelo) é reiniciado com os mesmos POs."""
+    ctx = mp.get_context("spawn")
+    for k, proc in enumerate(procs):
+        if proc.is_alive() or stop_ev.is_set():
+            continue
+        pos = [c["po"] for c, _ in groups[k]]
+        logger.error(
+            f"[{proc.name}] processo de inferência terminou "
+            f"(exitcode={proc.exitcode}); POs {pos} sem inferência, reiniciando"
+        )
+        # captura parada até o worker novo retomar (ninguém consome o anel)
+        for _, channel in groups[k]:
+            channel.paused.set()
+        procs[k] = _spawn_worker(ctx, config, groups[k], stop_ev, k)
 
 
 def main():
     with open("config.yaml", "r") as f:
         config = yaml.safe_load(f)
 
+    # from model.classifier_model_training import train_svm_end_to_end
     # train_svm_end_to_end(api, [1, 2, 3], base_url_prefix=config["api"]["url"])
 
-    stop_ev = threading.Event()
-    for camera in config["cameras"]:
-
-        thread = threading.Thread(
-            target=run_inference,
-            args=(
-                camera["url"],
-                camera["po"],
-                f"model/Patchcore/teste1/weights/lightning/model.ckpt",
-                ApiController(config=config["api"]),
-                "model/svm/svm_model.joblib",
-                stop_ev,
-            ),
-            daemon=True,
-            name=f"inference_{camera['po']}",
-        )
-        thread.start()
+    inference_cfg = config.get("inference", {}) or {}
+    proc_cfg = inference_cfg.get("processes", {}) or {}
+
+    server = None
+    uploaders = []
+    spools = []
+    procs = []
+    groups = []
+    captures = []
+    if proc_cfg.get("enabled", False):
+        # inferência em processos separados (um ModelServer por processo)
+        stop_ev = mp.get_context("spawn").Event()
+        procs, groups, captures = _start_processes(config, proc_cfg, stop_ev)
+    else:
+        # um único serviço de modelos para todas as câmeras (memória constante por PO)
+        server = build_server(inference_cfg)
+        server.start()
+
+        stop_ev = threading.Event()
+        for camera in config["cameras"]:
+            _, uploader, spool = start_camera(config, camera, server, stop_ev)
+            if uploader is not None:
+                uploaders.append(uploader)
+            if spool is not None:
+                spools.append(spool)
 
+    # from patches import patch_linked_dir, patch_predict_dataset
+    # from model.anomaly_model_training import create_dataset, train_model
     # dataset_path = create_dataset(
     #     duration_sec=config["train_duration_sec"],
     #     stream=stream,
@@ -49,8 +125,21 @@ def main():
     try:
         while True:
             time.sleep(5)
+            _check_workers(config, procs, groups, stop_ev)
     except KeyboardInterrupt:
         logger.info("Interrompido pelo usuário")
+    finally:
+        stop_ev.set()
+        for proc in procs:
+            proc.join(timeout=10.0)
+            if proc.is_alive():
+                proc.terminate()
+        for stream, publisher in captures:
+            publisher.stop()
+            stream.stop()
+        if server is not None:
+            server.stop()
+        stop_uploads(uploaders, spools)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,421 @@
+# anomaly_runner.py
+# Inferência "direta" do Patchcore: chama o forward do LightningModule em um
+# tensor preallocado, sem Engine/DataLoader/callbacks do Lightning por frame.
+
+from __future__ import annotations
+
+import contextlib
+import io
+import json
+import os
+import threading
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import cv2
+import numpy as np
+import torch
+
+from model.knn_search import build_knn_backend, install_knn_backend
+from utils.logger import logger
+from utils.quantization import static_quantize_fx
+
+DEFAULT_INPUT_SIZE = (256, 256)  # (h, w) padrão do pre_processor do Patchcore
+
+
+def _silenced():
+    """Context manager p/ engolir prints residuais do anomalib/lightning."""
+    stack = contextlib.ExitStack()
+    stack.enter_context(contextlib.redirect_stdout(io.StringIO()))
+    stack.enter_context(contextlib.redirect_stderr(io.StringIO()))
+    return stack
+
+
+def _resize_into(dst: np.ndarray, frame_rgb: np.ndarray) -> None:
+    """Resize (INTER_AREA) de um frame RGB/MONO uint8 direto no buffer dst [h,w,3]."""
+    h, w = dst.shape[:2]
+    img = frame_rgb
+    if img.ndim == 2:
+        img = cv2.cvtColor(img, cv2.COLOR_GRAY2RGB)
+    if img.shape[:2] == (h, w):
+        np.copyto(dst, img)
+    else:
+        cv2.resize(img, (w, h), dst=dst, interpolation=cv2.INTER_AREA)
+
+
+class PatchcoreRunner:
+    """
+    Carrega o Patchcore uma vez e roda o forward direto (pre_processor ->
+    PatchcoreModel -> post_processor), devolvendo pred_score e anomaly_map.
+
+    - input_size: (h, w) em que o frame é redimensionado antes do forward
+      (igual ao Resize do pre_processor, então o Resize interno vira no-op).
+    - max_batch: tamanho do tensor de entrada preallocado.
+    - knn_backend: busca no memory bank ("exact", "chunked", "ivf", "hnsw" ou
+      "native" = original do anomalib); ver model.knn_search.
+    - quantize: backbone em INT8 (PTQ estática, só CPU) calibrado com
+      calib_frames (RGB uint8, ex.: load_calibration_frames do dataset).
+
+    Thread-safe: o tensor de entrada é compartilhado, então predict_* serializa
+    com um lock.
+
+    Os feature maps do backbone (ex.: layer2/layer3) são capturados por hook e
+    devolvidos em "features" ({layer: [C,h,w]}), para que o embedding do SVM
+    reaproveite a mesma passada da ResNet (feature_source="patchcore").
+    """
+
+    def __init__(
+        self,
+        ckpt_path: str,
+        device: Optional[str] = None,
+        backbone: str = "resnet50",
+        input_size: Tuple[int, int] = DEFAULT_INPUT_SIZE,
+        max_batch: int = 1,
+        knn_backend: str = "exact",
+        knn_params: Optional[Dict] = None,
+        quantize: bool = False,
+        calib_frames: Optional[Sequence[np.ndarray]] = None,
+    ):
+        # import tardio: só quem usa o Patchcore em torch paga o custo do anomalib
+        from anomalib.models import Patchcore
+
+        self.device = device or ("cuda" if torch.cuda.is_available() else "cpu")
+        self.ckpt_path = ckpt_path
+        self.input_size = (int(input_size[0]), int(input_size[1]))
+        self.max_batch = max(1, int(max_batch))
+
+        with _silenced():
+            model = Patchcore.load_from_checkpoint(
+                checkpoint_path=ckpt_path, backbone=backbone
+            )
+        model.visualizer = None
+        self.model = model.to(self.device).eval()
+
+        # busca kNN plugável (índice aproximado é construído/persistido aqui, 1x);
+        # "native" mantém o nearest_neighbors original do anomalib (export ONNX)
+        self.knn = None
+        if knn_backend != "native":
+            self.knn = build_knn_backend(
+                knn_backend,
+                self.model.model.memory_bank,
+                ckpt_path=ckpt_path,
+                **(knn_params or {}),
+            )
+            install_knn_backend(self.model.model, self.knn)
+
+        # hook no extrator do Patchcore: saída é {layer: [B,C,h,w]}
+        self._feat_buf: Optional[Dict[str, torch.Tensor]] = None
+        self._hook_handle = self.model.model.feature_extractor.register_forward_hook(
+            self._hook_capture
+        )
+
+        h, w = self.input_size
+        self._input = torch.empty(
+            (self.max_batch, 3, h, w), dtype=torch.float32, device=self.device
+        )
+        # staging uint8 [B,h,w,3]: o resize escreve direto aqui
+        self._stage = np.empty((self.max_batch, h, w, 3), dtype=np.uint8)
+        self._lock = threading.Lock()
+
+        self.quantized = False
+        if quantize:
+            self._quantize_backbone(calib_frames or [])
+
+    def _hook_capture(self, _module, _inp, out):
+        self._feat_buf = {k: v.detach() for k, v in out.items()}
+
+    def close(self):
+        try:
+            if self._hook_handle is not None:
+                self._hook_handle.remove()
+        except Exception:
+            pass
+        self._hook_handle = None
+
+    @staticmethod
+    def _split_features(
+        feats: Optional[Dict[str, torch.Tensor]], n: int
+    ) -> List[Optional[Dict[str, torch.Tensor]]]:
+        if not feats:
+            return [None] * n
+        return [{k: v[i] for k, v in feats.items()} for i in range(n)]
+
+    # ===== INT8 =====
+    def _backbone_inputs(self, frames_rgb: Sequence[np.ndarray]) -> List[torch.Tensor]:
+        """Entradas do backbone (já normalizadas) com o mesmo preprocess do predict."""
+        out = []
+        with torch.no_grad(), self._lock:
+            for fr in frames_rgb:
+                self._fill_slot(0, fr)
+                x = self._input[:1]
+                if self.model.pre_processor is not None:
+                    x = self.model.pre_processor(x)
+                out.append(x.detach().cpu().clone())
+        return out
+
+    def _quantize_backbone(self, calib_frames: Sequence[np.ndarray]) -> None:
+        if not self.device.startswith("cpu"):
+            logger.warning("[quant] INT8 só em CPU; mantendo backbone fp32.")
+            return
+        if not calib_frames:
+            logger.warning("[quant] sem frames de calibração; mantendo backbone fp32.")
+            return
+        tfe = self.model.model.feature_extractor
+        try:
+            tfe.feature_extractor = static_quantize_fx(
+                tfe.feature_extractor, self._backbone_inputs(calib_frames)
+            )
+            self.quantized = True
+        except Exception as e:
+            logger.warning(f"[quant] falha ao quantizar backbone do Patchcore: {e}")
+
+    # ===== preprocess =====
+    def _fill_slot(self, i: int, frame_rgb: np.ndarray) -> None:
+        """Resize (uint8, cv2) + cópia p/ o slot i do tensor preallocado em [0,1]."""
+        _resize_into(self._stage[i], frame_rgb)
+        src = torch.from_numpy(self._stage[i]).permute(2, 0, 1)
+        self._input[i].copy_(src, non_blocking=True).div_(255.0)
+
+    # ===== forward =====
+    @torch.inference_mode()
+    def predict_batch(self, frames_rgb: Sequence[np.ndarray]) -> List[Dict]:
+        """
+        Roda o forward em até max_batch frames RGB (uint8).
+        Retorna uma lista de dicts
+        {"pred_score": float, "anomaly_map": np.ndarray[h,w], "features": {layer: [C,h,w]}}.
+        """
+        n = len(frames_rgb)
+        if n == 0:
+            return []
+        if n > self.max_batch:
+            raise ValueError(f"batch {n} > max_batch {self.max_batch}")
+
+        with self._lock:
+            for i, fr in enumerate(frames_rgb):
+                self._fill_slot(i, fr)
+            self._feat_buf = None
+            out = self.model(self._input[:n])
+            scores = out.pred_score.detach().float().reshape(n, -1)[:, 0].cpu().numpy()
+            maps = out.anomaly_map.detach().float().cpu().numpy()
+            feats = self._split_features(self._feat_buf, n)
+            self._feat_buf = None
+
+        maps = maps.reshape(n, maps.shape[-2], maps.shape[-1])
+        return [
+            {
+                "pred_score": float(scores[i]),
+                "anomaly_map": maps[i],
+                "features": feats[i],
+            }
+            for i in range(n)
+        ]
+
+    @torch.inference_mode()
+    def extract_features(
+        self, frames_rgb: Sequence[np.ndarray]
+    ) -> List[Dict[str, torch.Tensor]]:
+        """
+        Só pre_processor + backbone do Patchcore (sem kNN), com o MESMO
+        preprocess do predict. Usado no treino do SVM com feature_source="patchcore".
+        """
+        n = len(frames_rgb)
+        if n > self.max_batch:
+            raise ValueError(f"batch {n} > max_batch {self.max_batch}")
+        with self._lock:
+            for i, fr in enumerate(frames_rgb):
+                self._fill_slot(i, fr)
+            x = self._input[:n]
+            if self.model.pre_processor is not None:
+                x = self.model.pre_processor(x)
+            self._feat_buf = None
+            self.model.model.feature_extractor(x)
+            feats = self._split_features(self._feat_buf, n)
+            self._feat_buf = None
+        return feats
+
+    def predict(self, frame_rgb: np.ndarray) -> Dict:
+        return self.predict_batch([frame_rgb])[0]
+
+    def warmup(self) -> None:
+        h, w = self.input_size
+        self.predict(np.zeros((h, w, 3), dtype=np.uint8))
+
+
+# ----------------- Runtimes exportados (sem anomalib/lightning) -----------------
+def export_meta_path(model_path: str) -> str:
+    """Sidecar com input_size/feature_layers gerado por model.export_runtime."""
+    return os.path.splitext(model_path)[0] + ".export.json"
+
+
+def exported_model_path(ckpt_path: str, runtime: str) -> str:
+    """model.ckpt -> model.onnx / model.xml (mesma pasta)."""
+    ext = {"onnx": ".onnx", "openvino": ".xml"}[runtime]
+    return os.path.splitext(ckpt_path)[0] + ext
+
+
+class _ExportedRunner:
+    """
+    Base dos runners ONNX Runtime/OpenVINO. O grafo exportado recebe o frame
+    uint8 RGB [B,H,W,3] (normalização embutida) e devolve pred_score,
+    anomaly_map e os feature maps do backbone ("feat_<layer>").
+    """
+
+    def __init__(self, model_path: str, max_batch: int = 1):
+        if not os.path.exists(model_path):
+            raise FileNotFoundError(
+                f"Modelo exportado não encontrado em '{model_path}'. "
+                "Gere com: python -m model.export_runtime --ckpt <model.ckpt>"
+            )
+        with open(export_meta_path(model_path), "r", encoding="utf-8") as f:
+            meta = json.load(f)
+        self.model_path = model_path
+        self.input_size = (int(meta["input_size"][0]), int(meta["input_size"][1]))
+        self.feature_layers: List[str] = list(meta.get("feature_layers", []))
+        self.max_batch = max(1, int(max_batch))
+
+        h, w = self.input_size
+        self._input = np.empty((self.max_batch, h, w, 3), dtype=np.uint8)
+        self._lock = threading.Lock()
+
+    def _infer(self, x: np.ndarray) -> Dict[str, np.ndarray]:
+        raise NotImplementedError
+
+    def _run(self, frames_rgb: Sequence[np.ndarray]) -> Dict[str, np.ndarray]:
+        n = len(frames_rgb)
+        if n > self.max_batch:
+            raise ValueError(f"batch {n} > max_batch {self.max_batch}")
+        with self._lock:
+            for i, fr in enumerate(frames_rgb):
+                _resize_into(self._input[i], fr)
+            return self._infer(self._input[:n])
+
+    def _features(self, out: Dict[str, np.ndarray], i: int):
+        if not self.feature_layers:
+            return None
+        return {
+            layer: torch.from_numpy(np.ascontiguousarray(out[f"feat_{layer}"][i]))
+            for layer in self.feature_layers
+        }
+
+    def predict_batch(self, frames_rgb: Sequence[np.ndarray]) -> List[Dict]:
+        n = len(frames_rgb)
+        if n == 0:
+            return []
+        out = self._run(frames_rgb)
+        scores = np.asarray(out["pred_score"], dtype=np.float32).reshape(n, -1)[:, 0]
+        maps = np.asarray(out["anomaly_map"], dtype=np.float32)
+        maps = maps.reshape(n, maps.shape[-2], maps.shape[-1])
+        return [
+            {
+                "pred_score": float(scores[i]),
+                "anomaly_map": maps[i],
+                "features": self._features(out, i),
+            }
+            for i in range(n)
+        ]
+
+    def extract_features(self, frames_rgb: Sequence[np.ndarray]) -> List[Dict]:
+        # o grafo exportado é um só: features saem junto com o score
+        out = self._run(frames_rgb)
+        return [self._features(out, i) for i in range(len(frames_rgb))]
+
+    def predict(self, frame_rgb: np.ndarray) -> Dict:
+        return self.predict_batch([frame_rgb])[0]
+
+    def warmup(self) -> None:
+        h, w = self.input_size
+        self.predict(np.zeros((h, w, 3), dtype=np.uint8))
+
+    def close(self):
+        pass
+
+
+class OnnxRunner(_ExportedRunner):
+    """Patchcore exportado (memory bank embutido) rodando no ONNX Runtime (CPU)."""
+
+    def __init__(
+        self, model_path: str, max_batch: int = 1, num_threads: Optional[int] = None
+    ):
+        super().__init__(model_path, max_batch=max_batch)
+        import onnxruntime as ort
+
+        so = ort.SessionOptions()
+        so.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if num_threads:
+            so.intra_op_num_threads = int(num_threads)
+        self.session = ort.InferenceSession(
+            model_path, sess_options=so, providers=["CPUExecutionProvider"]
+        )
+        self._input_name = self.session.get_inputs()[0].name
+        self._output_names = [o.name for o in self.session.get_outputs()]
+
+    def _infer(self, x):
+        outs = self.session.run(self._output_names, {self._input_name: x})
+        return dict(zip(self._output_names, outs))
+
+
+class OpenVinoRunner(_ExportedRunner):
+    """Patchcore exportado em OpenVINO IR (model.xml/.bin) no plugin CPU."""
+
+    def __init__(
+        self, model_path: str, max_batch: int = 1, num_threads: Optional[int] = None
+    ):
+        super().__init__(model_path, max_batch=max_batch)
+        import openvino as ov
+
+        config = {"PERFORMANCE_HINT": "LATENCY"}
+        if num_threads:
+            config["INFERENCE_NUM_THREADS"] = int(num_threads)
+        self.compiled = ov.Core().compile_model(model_path, "CPU", config)
+        self._request = self.compiled.create_infer_request()
+
+    def _infer(self, x):
+        res = self._request.infer({0: x})
+        return {o.get_any_name(): res[o] for o in self.compiled.outputs}
+
+
+RUNTIMES = ("torch", "onnx", "openvino")
+
+
+def build_anomaly_runner(
+    ckpt_path: str,
+    runtime: str = "torch",
+    device: Optional[str] = None,
+    backbone: str = "resnet50",
+    max_batch: int = 1,
+    knn_backend: str = "exact",
+    knn_params: Optional[Dict] = None,
+    num_threads: Optional[int] = None,
+    quantize: bool = False,
+    calib_frames: Optional[Sequence[np.ndarray]] = None,
+):
+    """
+    runtime:
+      - "torch": PatchcoreRunner (anomalib + PyTorch eager)
+      - "onnx" / "openvino": modelo exportado ao lado do model.ckpt
+        (model.onnx / model.xml), sem importar anomalib/lightning
+    """
+    runtime = (runtime or "torch").lower().strip()
+    if runtime == "torch":
+        return PatchcoreRunner(
+            ckpt_path,
+            device=device,
+            backbone=backbone,
+            max_batch=max_batch,
+            knn_backend=knn_backend,
+            knn_params=knn_params,
+            quantize=quantize,
+            calib_frames=calib_frames,
+        )
+    if runtime == "onnx":
+        return OnnxRunner(
+            exported_model_path(ckpt_path, "onnx"),
+            max_batch=max_batch,
+            num_threads=num_threads,
+        )
+    if runtime == "openvino":
+        return OpenVinoRunner(
+            exported_model_path(ckpt_path, "openvino"),
+            max_batch=max_batch,
+            num_threads=num_threads,
+        )
+    raise ValueError(f"runtime deve ser um de {RUNTIMES}")
@@ -22,6 +22,7 @@ from utils.logger import logger
 
 # >>> módulo compartilhado de features (novo)
 from utils.feature_extractor import (
+    PatchcoreFeature,
     ResNetFeature,
     normalize_polygon,
     resolve_image_url,
@@ -46,13 +47,21 @@ def train_svm_end_to_end(
     save_model_to: str | None = "model/svm/model.joblib",
     save_artifacts: bool = False,
     artifacts_dir: str = "dataset",
+    feature_source: str = "resnet",
+    anomaly_ckpt_path: str | None = None,
+    batch_size: int = 16,
 ):
     """
     Faz TUDO em uma chamada:
       1) lista anotações dos POs (folder='anomalias')
       2) constrói X,y em memória (com/sem fundo)
       3) treina SVM com GridSearchCV
-      4) salva modelo e (opcionalmente) manifest/class_map/metrics
+      4) salva modelo + model_meta.json e (opcionalmente) manifest/class_map
+
+    feature_source:
+      - "resnet": embedding do layer4 de uma ResNet50 dedicada (2048-d)
+      - "patchcore": embedding pooled do backbone do Patchcore em
+        anomaly_ckpt_path (mesmos feature maps da inferência online)
 
     Retorna: (modelo_pipeline, meta_dict)
     """
@@ -75,6 +84,9 @@ def train_svm_end_to_end(
         normal_name=normal_name,
         margin_cells=margin_cells,
         device=None,
+        feature_source=feature_source,
+        anomaly_ckpt_path=anomaly_ckpt_path,
+        batch_size=batch_size,
     )
 
     # ============
@@ -82,6 +94,9 @@ def train_svm_end_to_end(
     # ============
     model, meta = _train_svm(X, y, use_pca=use_pca, random_state=random_state)
     meta["class_map"] = class_map
+    meta["feature_source"] = feature_source
+    # vai junto no .joblib: sem o model_meta.json a inferência ainda sabe a origem
+    model.feature_source_ = feature_source
 
     # ===========================
     # 4) Salvar artefatos (opt.)
@@ -100,12 +115,8 @@ def train_svm_end_to_end(
         with open(cm_path, "w", encoding="utf-8") as f:
             json.dump(class_map, f, ensure_ascii=False, indent=2)
 
-        # meta.json (na mesma pasta do modelo, se houver)
-        meta_dir = os.path.dirname(save_model_to or artifacts_dir) or "."
-        os.makedirs(meta_dir, exist_ok=True)
-        meta_path = os.path.join(meta_dir, "model_meta.json")
-        with open(meta_path, "w", encoding="utf-8") as f:
-            json.dump(meta, f, ensure_ascii=False, indent=2)
+        if not save_model_to:
+            _write_meta(meta, artifacts_dir)
 
     # ========================
     # 5) Salvar modelo (opt.)
@@ -114,6 +125,8 @@ def train_svm_end_to_end(
         model_dir = os.path.dirname(save_model_to) or "."
         os.makedirs(model_dir, exist_ok=True)
         dump(model, save_model_to)
+        # model_meta.json sempre ao lado do modelo (class_map + feature_source)
+        _write_meta(meta, model_dir)
         logger.info(f"Modelo salvo em: {save_model_to}")
 
     return model, meta
@@ -122,6 +135,14 @@ def train_svm_end_to_end(
 # ---------------------------------------------------------------------
 # Helpers internos (manifest, construção de X/y e treino SVM)
 # ---------------------------------------------------------------------
+def _write_meta(meta: Dict, meta_dir: str) -> str:
+    os.makedirs(meta_dir, exist_ok=True)
+    meta_path = os.path.join(meta_dir, "model_meta.json")
+    with open(meta_path, "w", encoding="utf-8") as f:
+        json.dump(meta, f, ensure_ascii=False, indent=2)
+    return meta_path
+
+
 def _collect_manifest_in_memory(
     api: ApiController,
     po_list: List[int],
@@ -179,18 +200,38 @@ def _build_xy(
     normal_name: str = "normal",
     margin_cells: int = 1,
     device: Optional[str] = None,
+    feature_source: str = "resnet",
+    anomaly_ckpt_path: str | None = None,
+    batch_size: int = 16,
 ) -> Tuple[np.ndarray, np.ndarray, Dict[str, str]]:
     """
     Constrói X,y a partir das linhas do manifest (em memória).
     Se include_background=True, adiciona amostras de fundo como 'normal_id'.
-    Retorna: X [N, 2048], y [N], class_map {id->name}
+    feature_source="patchcore" usa o backbone do checkpoint em anomaly_ckpt_path
+    (mesmas features que a inferência reaproveita do Patchcore).
+    batch_size: imagens por forward do extrator (todas as anotações de cada
+    imagem vão juntas no mesmo lote).
+    Retorna: X [N, D], y [N], class_map {id->name}
     """
-    extractor = ResNetFeature(device=device)
+    if feature_source == "patchcore":
+        if not anomaly_ckpt_path:
+            raise ValueError("feature_source='patchcore' requer anomaly_ckpt_path.")
+        # import tardio: só o modo patchcore precisa do anomalib
+        from model.anomaly_runner import PatchcoreRunner
+
+        extractor = PatchcoreFeature(PatchcoreRunner(anomaly_ckpt_path, device=device))
+    elif feature_source == "resnet":
+        extractor = ResNetFeature(device=device)
+    else:
+        raise ValueError("feature_source deve ser 'resnet' ou 'patchcore'")
     X_list: List[np.ndarray] = []
     y_list: List[int] = []
     class_map: Dict[str, str] = {}
 
+    # anotações agrupadas por imagem: cada forward leva até batch_size imagens
+    # com todos os polígonos de cada uma
     dropped = 0
+    by_image: Dict[str, List[Tuple[List[List[float]], int, str]]] = {}
     for r in rows:
         url = r.get("image_url")
         raw_poly = r.get("polygon_norm") or r.get("polygon")
@@ -200,31 +241,46 @@ def _build_xy(
         if not url or cid is None or poly is None:
             dropped += 1
             continue
-
         full = resolve_image_url(url, base_url_prefix=base_url_prefix)
-        try:
-            img = load_image(full)
+        by_image.setdefault(full, []).append((poly, int(cid), cname))
+
+    items = list(by_image.items())
+    step = max(1, int(batch_size))
+    for i in range(0, len(items), step):
+        imgs, polys_per_img, anns = [], [], []
+        for full, img_anns in items[i : i + step]:
+            try:
+                imgs.append(load_image(full))
+            except Exception as e:
+                logger.warning(f"Pulando {full}: {e}")
+                dropped += len(img_anns)
+                continue
+            polys_per_img.append([a[0] for a in img_anns])
+            anns.extend(img_anns)
+        if not imgs:
+            continue
 
+        try:
             if include_background:
-                emb_poly, emb_bg = extractor.region_and_background_embeddings(
-                    img, poly, margin_cells=margin_cells
+                emb_poly, emb_bg = extractor.batch_region_and_background_embeddings(
+                    imgs, polys_per_img, margin_cells=margin_cells
                 )
-                # poly
-                X_list.append(emb_poly.astype(np.float32))
-                y_list.append(int(cid))
-                # background
-                X_list.append(emb_bg.astype(np.float32))
-                y_list.append(int(normal_id))
             else:
-                emb = extractor.region_embedding(img, poly)
-                X_list.append(emb.astype(np.float32))
-                y_list.append(int(cid))
-
-            class_map[str(int(cid))] = cname
-
+                emb_poly = extractor.batch_region_embeddings(imgs, polys_per_img)
         except Exception as e:
-            logger.warning(f"Pulando {full}: {e}")
-            dropped += 1
+            logger.warning(f"Pulando lote de {len(imgs)} imagem(ns): {e}")
+            dropped += len(anns)
+            continue
+
+        for k, (_, cid, cname) in enumerate(anns):
+            # poly
+            X_list.append(emb_poly[k].astype(np.float32))
+            y_list.append(cid)
+            if include_background:
+                # background
+                X_list.append(emb_bg[k].astype(np.float32))
+                y_list.append(int(normal_id))
+            class_map[str(cid)] = cname
 
     if include_background:
         class_map[str(normal_id)] = normal_name
@@ -0,0 +1,151 @@
+# export_runtime.py
+# Exporta o Patchcore treinado (model.ckpt) para runtimes de CPU:
+#   - ONNX (ONNX Runtime): model.onnx
+#   - OpenVINO IR: model.xml / model.bin
+# O memory bank vai embutido no grafo (buffer -> constante) e o preprocess
+# (uint8 HWC -> float CHW, normalização) também, então o runtime só faz resize.
+#
+# Uso:
+#   python -m model.export_runtime --ckpt model/Patchcore/teste1/weights/lightning/model.ckpt
+#   python -m model.export_runtime --ckpt ... --format openvino
+
+from __future__ import annotations
+
+import argparse
+import json
+import os
+from typing import List, Optional, Tuple
+
+import numpy as np
+import torch
+
+from model.anomaly_runner import (
+    DEFAULT_INPUT_SIZE,
+    PatchcoreRunner,
+    export_meta_path,
+    exported_model_path,
+)
+from utils.logger import logger
+
+
+class _ExportWrapper(torch.nn.Module):
+    """
+    image uint8 RGB [B,H,W,3] -> (pred_score [B], anomaly_map [B,1,H,W], feat_<layer>...)
+    """
+
+    def __init__(self, runner: PatchcoreRunner, layers: List[str]):
+        super().__init__()
+        self.model = runner.model
+        self.layers = layers
+        self._feats = None
+        self._hook = self.model.model.feature_extractor.register_forward_hook(
+            self._capture
+        )
+
+    def _capture(self, _module, _inp, out):
+        self._feats = out
+
+    def forward(self, image: torch.Tensor):
+        x = image.permute(0, 3, 1, 2).float() / 255.0
+        out = self.model(x)
+        feats = self._feats
+        return (
+            out.pred_score.reshape(-1),
+            out.anomaly_map,
+            *[feats[layer] for layer in self.layers],
+        )
+
+
+def export_onnx(
+    ckpt_path: str,
+    out_path: Optional[str] = None,
+    input_size: Tuple[int, int] = DEFAULT_INPUT_SIZE,
+    opset: int = 17,
+    backbone: str = "resnet50",
+) -> str:
+    """Exporta para ONNX (batch dinâmico) + sidecar .export.json. Retorna o caminho."""
+    out_path = out_path or exported_model_path(ckpt_path, "onnx")
+    # "native": nearest_neighbors original do anomalib (exportável)
+    runner = PatchcoreRunner(
+        ckpt_path,
+        device="cpu",
+        backbone=backbone,
+        input_size=input_size,
+        knn_backend="native",
+    )
+    h, w = runner.input_size
+    layers = list(runner.extract_features([np.zeros((h, w, 3), np.uint8)])[0].keys())
+
+    wrapper = _ExportWrapper(runner, layers).eval()
+    dummy = torch.zeros((1, h, w, 3), dtype=torch.uint8)
+    output_names = ["pred_score", "anomaly_map"] + [f"feat_{l}" for l in layers]
+    dynamic_axes = {name: {0: "batch"} for name in ["image"] + output_names}
+
+    with torch.no_grad():
+        torch.onnx.export(
+            wrapper,
+            (dummy,),
+            out_path,
+            opset_version=opset,
+            input_names=["image"],
+            output_names=output_names,
+            dynamic_axes=dynamic_axes,
+        )
+    _write_meta(out_path, ckpt_path, (h, w), layers, "onnx")
+    logger.info(f"[export] ONNX salvo em: {out_path}")
+    return out_path
+
+
+def export_openvino(
+    ckpt_path: str,
+    onnx_path: Optional[str] = None,
+    out_path: Optional[str] = None,
+) -> str:
+    """Converte o ONNX (gera se faltar) para OpenVINO IR em fp32."""
+    import openvino as ov
+
+    onnx_path = onnx_path or exported_model_path(ckpt_path, "onnx")
+    if not os.path.exists(onnx_path):
+        export_onnx(ckpt_path, out_path=onnx_path)
+    out_path = out_path or exported_model_path(ckpt_path, "openvino")
+
+    ov_model = ov.convert_model(onnx_path)
+    ov.save_model(ov_model, out_path, compress_to_fp16=False)
+
+    with open(export_meta_path(onnx_path), "r", encoding="utf-8") as f:
+        meta = json.load(f)
+    _write_meta(
+        out_path, ckpt_path, meta["input_size"], meta["feature_layers"], "openvino"
+    )
+    logger.info(f"[export] OpenVINO IR salvo em: {out_path}")
+    return out_path
+
+
+def _write_meta(model_path, ckpt_path, input_size, layers, fmt):
+    meta = {
+        "format": fmt,
+        "source_ckpt": os.path.abspath(ckpt_path),
+        "input_size": [int(input_size[0]), int(input_size[1])],
+        "input": "image uint8 RGB [B,H,W,3]",
+        "feature_layers": list(layers),
+    }
+    with open(export_meta_path(model_path), "w", encoding="utf-8") as f:
+        json.dump(meta, f, ensure_ascii=False, indent=2)
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Exporta Patchcore para ONNX/OpenVINO.")
+    ap.add_argument("--ckpt", required=True, help="model.ckpt do Patchcore")
+    ap.add_argument("--format", choices=["onnx", "openvino", "all"], default="all")
+    ap.add_argument("--size", type=int, nargs=2, default=list(DEFAULT_INPUT_SIZE))
+    args = ap.parse_args()
+
+    onnx_path = None
+    if args.format in ("onnx", "all"):
+        onnx_path = export_onnx(args.ckpt, input_size=tuple(args.size))
+    if args.format in ("openvino", "all"):
+        export_openvino(args.ckpt, onnx_path=onnx_path)
+
+
+if __name__ == "__main__":
+    main()
@@ -12,21 +12,18 @@ import cv2
 import torch
 import numpy as np
 import logging
-from joblib import load
-from anomalib.data.predict import PredictDataset
-from anomalib.engine import Engine
-from anomalib.models import Patchcore
-from torch.utils.data import DataLoader
-from torchvision.transforms.functional import to_tensor
-from lightning.pytorch.callbacks import TQDMProgressBar
 
 from utils.api_controller import ApiController
 from utils.camera_stream import BufferedVideoStream
+from utils.change_gate import ChangeGate
 from utils.logger import logger
 from utils.state_watcher import StateWatcher
+from utils.upload_queue import AsyncUploader
 
-# >>> extras: extrator de features compartilhado
-from utils.feature_extractor import ResNetFeature, embed_region_from_frame_rgb
+# >>> serviço de modelos compartilhado (Patchcore direto, ResNetFeature, SVM)
+from model.model_server import ModelServer
+from model.pipeline import Pipeline, Stage
+from model.postprocess import AnomalyPostprocessor, anomaly_map_to_numpy
 
 # 1) reduzir verbosidade do Lightning
 os.environ["LIGHTNING_LOG_LEVEL"] = "ERROR"  # respeitado pelo lightning
@@ -48,16 +45,45 @@ _silent_out = contextlib.redirect_stdout(io.StringIO())
 _silent_err = contextlib.redirect_stderr(io.StringIO())
 
 
+# ---------- caminho antigo (Engine.predict) ----------
+# imports tardios: os runtimes onnx/openvino não devem carregar anomalib/lightning
+def _load_engine(anomaly_ckpt_path: str, device: str):
+    from patches import patch_linked_dir, patch_predict_dataset  # noqa: F401
+    from anomalib.engine import Engine
+    from anomalib.models import Patchcore
+    from lightning.pytorch.callbacks import TQDMProgressBar
+
+    with _silent_out, _silent_err:
+        model = Patchcore.load_from_checkpoint(
+            checkpoint_path=anomaly_ckpt_path, backbone="resnet50"
+        )
+    model.visualizer = None
+    model = model.to(device).eval()
+    engine = Engine(callbacks=[TQDMProgressBar(refresh_rate=0)], logger=False)
+    return model, engine
+
+
+def _engine_loader(frame_rgb: np.ndarray):
+    from anomalib.data.predict import PredictDataset
+    from torch.utils.data import DataLoader
+    from torchvision.transforms.functional import to_tensor
+
+    tensor = (to_tensor(frame_rgb) * 255).to(torch.uint8)
+    dataset = PredictDataset(images=[tensor])
+    return DataLoader(dataset, collate_fn=dataset.collate_fn)
+
+
 def _save_debug_artifacts(
     base_dir: str,
     po: int,
     frame_rgb: np.ndarray,
     poly_norm: list[list[float]],
-    anomaly_map_t: torch.Tensor | None,
+    anomaly_map_t: torch.Tensor | np.ndarray | None,
     anom_score: float | None,
     pred_class_id: int | None,
     pred_class_name: str | None,
     pred_confidence: float | None,
+    extra_polys: list[list[list[float]]] | None = None,
 ):
     ts = datetime.now().strftime("%Y-%m-%d_%H-%M-%S.%f")[:-3]
     out_dir = os.path.join(base_dir, f"PO_{po}", ts)
@@ -73,6 +99,10 @@ def _save_debug_artifacts(
     if poly_norm:
         pts = np.array([[int(x * W), int(y * H)] for x, y in poly_norm], dtype=np.int32)
         cv2.polylines(overlay, [pts], isClosed=True, color=(255, 0, 0), thickness=2)
+    # demais regiões (top-K) em outra cor
+    for poly in extra_polys or []:
+        pts = np.array([[int(x * W), int(y * H)] for x, y in poly], dtype=np.int32)
+        cv2.polylines(overlay, [pts], isClosed=True, color=(255, 200, 0), thickness=2)
 
     y_cursor = 24
 
@@ -101,10 +131,7 @@ def _save_debug_artifacts(
     )
 
     if anomaly_map_t is not None:
-        amap = anomaly_map_t.detach().float().cpu().numpy()
-        if amap.ndim == 3:
-            amap = amap.squeeze(0)
-        amap = np.clip(amap, 0.0, 1.0)
+        amap = np.clip(anomaly_map_to_numpy(anomaly_map_t), 0.0, 1.0)
         amap_u8 = (amap * 255).astype(np.uint8)
         amap_u8 = cv2.resize(amap_u8, (W, H), interpolation=cv2.INTER_LINEAR)
         heat = cv2.applyColorMap(amap_u8, cv2.COLORMAP_JET)
@@ -114,6 +141,7 @@ def _save_debug_artifacts(
         "timestamp": ts,
         "po": po,
         "polygon_norm": poly_norm,
+        "extra_polygons_norm": extra_polys or [],
         "anom_score": float(anom_score) if anom_score is not None else None,
         "pred_class_id": int(pred_class_id) if pred_class_id is not None else None,
         "pred_class_name": pred_class_name,
@@ -139,142 +167,336 @@ def run_inference(
     detect_threshold: float = 0.8,
     save_debug: bool = True,
     debug_dir: str | None = "debug_runs",
+    inference_mode: str = "direct",
+    server: ModelServer | None = None,
+    gate: dict | None = None,
+    pipeline: dict | None = None,
+    uploader: AsyncUploader | None = None,
+    stream_opts: dict | None = None,
+    stream=None,
+    postprocess: dict | None = None,
 ):
-    device = "cuda" if torch.cuda.is_available() else "cpu"
-    if stop_event is None:
-        stop_event = threading.Event()
+    """
+    inference_mode:
+      - "direct": forward direto no runner do ModelServer (torch/onnx/openvino)
+      - "engine": caminho antigo via Engine.predict (PredictDataset/DataLoader por frame)
 
-    # ---------- Modelo / Engine (anomaly via Engine.predict) ----------
-    with _silent_out, _silent_err:
-        model = Patchcore.load_from_checkpoint(
-            checkpoint_path=anomaly_ckpt_path, backbone="resnet50"
-        )
-    model.visualizer = None
-    model = model.to(device).eval()
-    engine = Engine(callbacks=[TQDMProgressBar(refresh_rate=0)], logger=False)
+    server: ModelServer compartilhado entre POs (main.py). Se None, cria um
+    serviço privado para este PO.
 
-    # ---------- Classificador (SVM) ----------
-    if svm_meta_path is None:
-        svm_meta_path = os.path.join(
-            os.path.dirname(svm_model_path) or ".", "model_meta.json"
-        )
-    try:
-        clf = load(svm_model_path)  # pipeline: scaler -> (pca) -> svc
-    except Exception as e:
-        raise RuntimeError(f"Falha ao carregar SVM em '{svm_model_path}': {e}")
+    gate: kwargs do ChangeGate (+ "enabled"). Frames sem mudança em relação ao
+    último frame pontuado reaproveitam o score anterior, sem rodar o Patchcore.
 
-    class_map: dict[str, str] = {}
-    try:
-        with open(svm_meta_path, "r", encoding="utf-8") as f:
-            meta = json.load(f)
-        class_map = meta.get("class_map", {}) or {}
-    except Exception:
-        logger.warning(
-            f"Não foi possível carregar class_map em '{svm_meta_path}'. Usando nomes padrão."
-        )
+    pipeline: {"enabled", "workers": {estágio: n}, "queue_size"}. Se habilitado,
+    preprocess -> infer -> post -> upload rodam em estágios com filas limitadas
+    (model.pipeline); a inferência tem sempre 1 worker e descarta o frame mais
+    antigo. Sem ele, os estágios rodam em sequência na thread do loop.
 
-    extractor = ResNetFeature(device=device, use_half=True)
-    try:
-        extractor.warmup()
-    except Exception:
-        pass
+    uploader: AsyncUploader (utils.upload_queue) para enviar as detecções a
+    /anomalias/upload em background. Se None, nada é enviado.
+
+    stream_opts: kwargs do BufferedVideoStream para esta câmera (config.yaml,
+    cameras[].stream), ex. backend mvsdk com ROI/binning/formato do ISP.
+
+    stream: fonte de frames já pronta (ex. utils.shm_ring.ShmFrameReader, com a
+    captura em outro processo). Se None, abre um BufferedVideoStream em cam_url.
+
+    postprocess: kwargs do AnomalyPostprocessor (model.postprocess), ex. tau,
+    tau_strong, min_area_frac, work_size, top_k. Com top_k > 1 cada região
+    vira uma detecção (um envio por região, mesmo JPEG).
+
+    Latência "glass-to-result" (chegada do frame no host -> fim do estágio de
+    upload) e frames descartados (lacunas no seq do stream) saem no log do PO.
+    """
+    device = "cuda" if torch.cuda.is_available() else "cpu"
+    if stop_event is None:
+        stop_event = threading.Event()
+
+    inference_mode = inference_mode.lower().strip()
+    if inference_mode not in ("direct", "engine"):
+        raise ValueError("inference_mode deve ser 'direct' ou 'engine'")
+
+    # ---------- Serviço de modelos (compartilhado entre POs) ----------
+    own_server = server is None
+    if own_server:
+        server = ModelServer(device=device)
+        server.start()
+
+    # ---------- Modelo anomalia ----------
+    model = engine = None
+    if inference_mode == "direct":
+        server.get_runner(anomaly_ckpt_path)  # carrega 1x (ou reaproveita)
+    else:
+        model, engine = _load_engine(anomaly_ckpt_path, device)
+
+    # ---------- Classificador (SVM) + extrator ----------
+    clf, clf_meta = server.get_classifier(svm_model_path, svm_meta_path)
+    class_map: dict[str, str] = clf_meta["class_map"]
+    # "patchcore": embedding do SVM reaproveita os feature maps do Patchcore
+    # (sem segunda ResNet50); precisa bater com o modo usado no treino
+    feature_source = clf_meta["feature_source"]
+    if feature_source == "resnet":
+        server.get_extractor()
 
     # ---------- Stream e estado ----------
-    stream = BufferedVideoStream(backend="opencv", source=cam_url, start_paused=True)
+    if stream is None:
+        stream_kwargs = {"backend": "opencv", "source": cam_url, "start_paused": True}
+        stream_kwargs.update(stream_opts or {})
+        stream = BufferedVideoStream(**stream_kwargs)
     watcher = StateWatcher(api, po, interval=3.0)
     stream.start()
     watcher.start()
 
+    gate_cfg = dict(gate or {})
+    change_gate = ChangeGate(**gate_cfg) if gate_cfg.pop("enabled", False) else None
+    last_score: float | None = None
+
     was_running = False
     THRESH = float(detect_threshold)
     logger.info("Iniciando loop")
 
-    # função local de polígono (mesma da sua versão)
-    def extract_anomaly_polygon(
-        anomaly_map_t: torch.Tensor,
-        frame_shape,
-        tau: float = 0.6,
-        tau_strong: float = 0.8,
-        min_area_frac: float = 0.001,
-        approx_eps_frac: float = 0.005,
-        morph_kernel: int = 3,
-        morph_iters: int = 1,
-        min_box_frac: float = 0.06,
-        min_box_px: int = 32,
-    ) -> list[list[float]]:
-        H, W = frame_shape[:2]
-
-        def _norm(poly_px: np.ndarray) -> list[list[float]]:
-            xs = poly_px[:, 0].astype(np.float32) / max(1, W)
-            ys = poly_px[:, 1].astype(np.float32) / max(1, H)
-            pts = np.stack([xs, ys], axis=1)
-            pts = np.clip(pts, 0.0, 1.0)
-            return [[float(x), float(y)] for x, y in pts]
-
-        am = anomaly_map_t.detach().float().cpu().numpy()
-        if am.ndim == 3:
-            am = am.squeeze(0)
-        am = np.clip(am, 0.0, 1.0).astype(np.float32)
-        am_resized = cv2.resize(am, (W, H), interpolation=cv2.INTER_LINEAR)
-
-        _, _, _, maxLoc = cv2.minMaxLoc(am_resized)
-
-        thr_val = int(round(tau * 255))
-        _, binary = cv2.threshold(
-            (am_resized * 255).astype(np.uint8), thr_val, 255, cv2.THRESH_BINARY
-        )
-        if morph_kernel >= 3 and morph_kernel % 2 == 1 and morph_iters > 0:
-            k = cv2.getStructuringElement(cv2.MORPH_RECT, (morph_kernel, morph_kernel))
-            binary = cv2.morphologyEx(binary, cv2.MORPH_OPEN, k, iterations=morph_iters)
-            binary = cv2.morphologyEx(
-                binary, cv2.MORPH_CLOSE, k, iterations=morph_iters
-            )
+    # pós-processo configurado 1x por PO; buffers de trabalho por thread
+    # (o estágio post do pipeline pode ter vários workers)
+    post_cfg = dict(postprocess or {})
+    post_local = threading.local()
+
+    def get_postprocessor() -> AnomalyPostprocessor:
+        pp = getattr(post_local, "pp", None)
+        if pp is None:
+            pp = post_local.pp = AnomalyPostprocessor(**post_cfg)
+        return pp
+
+    # ===== estágios (um frame = um dict "ctx" que passa de estágio em estágio) =====
+    def stage_preprocess(ctx: dict) -> dict:
+        t0 = time.perf_counter()
+        # MONO8 (ISP da câmera em mono) -> 3 canais para o Patchcore
+        code = cv2.COLOR_GRAY2RGB if ctx["frame"].ndim == 2 else cv2.COLOR_BGR2RGB
+        ctx["frame_rgb"] = cv2.cvtColor(ctx["frame"], code)
+        if engine is not None:
+            ctx["loader"] = _engine_loader(ctx["frame_rgb"])
+        ctx["pre_ms"] = (time.perf_counter() - t0) * 1000.0
+        return ctx
+
+    def stage_infer(ctx: dict) -> dict:
+        # inferência (anomalia): forward direto ou via Engine
+        t0 = time.perf_counter()
+        preds: list[tuple[float, torch.Tensor | np.ndarray]] = []
+        ctx["batch_size"] = 1
+        ctx["backbone_feats"] = None
+        if engine is None:
+            res = server.infer(po, anomaly_ckpt_path, ctx["frame_rgb"])
+            preds.append((res["pred_score"], res["anomaly_map"]))
+            ctx["backbone_feats"] = res.get("features")
+            ctx["batch_size"] = res.get("batch_size", 1)
+        else:
+            with torch.inference_mode(), _silent_out, _silent_err:
+                predictions = engine.predict(
+                    model=model, dataloaders=ctx.pop("loader"), return_predictions=True
+                )
+            for batch in predictions:
+                for sel_score, anomaly_map in zip(batch.pred_score, batch.anomaly_map):
+                    preds.append((float(sel_score.detach().cpu().item()), anomaly_map))
+        ctx["preds"] = preds
+        ctx["anom_ms"] = (time.perf_counter() - t0) * 1000.0
+        return ctx
+
+    def stage_post(ctx: dict) -> dict:
+        # pós-processo + classificação (se houver detecção): até top_k regiões
+        # por frame, classificadas num único embedding em lote + predict_proba
+        nonlocal last_score
+        ctx["dets"] = []
+        ctx["post_ms"] = 0.0
+        ctx["class_ms"] = 0.0
+        preds = ctx["preds"]
+
+        for score, anomaly_map in preds:
+            if score < THRESH:
+                continue
 
-        cnts, _ = cv2.findContours(binary, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
-        area_min = W * H * float(min_area_frac)
+            t_post_0 = time.perf_counter()
+            regions = get_postprocessor().regions(anomaly_map, ctx["frame"].shape)
+            polys = [r["poly_norm"] for r in regions]
+            t_post_1 = time.perf_counter()
 
-        best = None
-        for c in cnts or []:
-            x, y, w, h = cv2.boundingRect(c)
-            if (w * h) < area_min:
-                continue
-            mask = np.zeros((H, W), np.uint8)
-            cv2.drawContours(mask, [c], -1, 255, -1)
-            mean_val = cv2.mean(am_resized, mask=mask)[0]
-            _, local_max, _, _ = cv2.minMaxLoc(am_resized, mask=mask)
-            if local_max < tau_strong:
-                continue
-            contains_peak = cv2.pointPolygonTest(c, maxLoc, False) >= 0
-            score = (1 if contains_peak else 0, float(mean_val))
-            if (best is None) or (score > best[0]):
-                best = (score, c)
-
-        if best is None:
-            px, py = int(maxLoc[0]), int(maxLoc[1])
-            size = max(min_box_px, int(round(min(H, W) * min_box_frac)))
-            w = h = size
-            x1 = max(0, min(px - w // 2, W - 1))
-            y1 = max(0, min(py - h // 2, H - 1))
-            x2 = max(x1 + 1, min(x1 + w, W))
-            y2 = max(y1 + 1, min(y1 + h, H))
-            poly_px = np.array([[x1, y1], [x2, y1], [x2, y2], [x1, y2]], dtype=np.int32)
-            return _norm(poly_px)
-
-        c = best[1]
-        peri = cv2.arcLength(c, True)
-        eps = max(1.0, approx_eps_frac * peri)
-        approx = cv2.approxPolyDP(c, eps, True)
-        if approx is None or len(approx) < 3:
-            x, y, w, h = cv2.boundingRect(c)
-            poly_px = np.array(
-                [[x, y], [x + w, y], [x + w, y + h], [x, y + h]], dtype=np.int32
+            # --- classificação SVM (opcional) ---
+            classes: list[tuple[int | None, str | None, float | None]] = [
+                (None, None, None)
+            ] * len(polys)
+            try:
+                embs = server.embed_regions(
+                    ctx["frame_rgb"],
+                    polys,
+                    feature_source=feature_source,
+                    features=ctx["backbone_feats"],
+                    ckpt_path=anomaly_ckpt_path,
+                )
+                proba = clf.predict_proba(embs)
+                idx = np.argmax(proba, axis=1)
+                # só substitui os padrões se todas as regiões foram classificadas
+                found = []
+                for k, i in enumerate(idx):
+                    cls_id = int(clf.classes_[i])
+                    # guardamos só o que vamos enviar
+                    found.append(
+                        (
+                            cls_id,
+                            class_map.get(str(cls_id), f"class_{cls_id}"),
+                            float(proba[k, i]),
+                        )
+                    )
+                if len(found) == len(polys):
+                    classes = found
+            except Exception as e:
+                logger.error(f"[PO {po}] erro na classificação SVM: {e}")
+            t_class_1 = time.perf_counter()
+
+            for region, (cls_id, cls_name, conf) in zip(regions, classes):
+                ctx["dets"].append(
+                    {
+                        "score": score,
+                        "region_score": region["score"],
+                        "poly_norm": region["poly_norm"],
+                        "anomaly_map": anomaly_map,
+                        "class_id": cls_id,
+                        "class_name": cls_name,
+                        "confidence": conf,
+                    }
+                )
+            ctx["post_ms"] = (t_post_1 - t_post_0) * 1000.0
+            ctx["class_ms"] = (t_class_1 - t_post_1) * 1000.0
+            break
+
+        if preds:
+            last_score = preds[0][0]
+        return ctx
+
+    def stage_upload(ctx: dict) -> None:
+        # payload + JPEG (+ debug) e a linha de métricas do frame;
+        # um envio por região, com o JPEG do frame codificado uma vez só
+        dets = ctx["dets"]
+        api_ms = 0.0
+        if dets:
+            t_api_0 = time.perf_counter()
+            ok, enc_jpg = cv2.imencode(
+                ".jpg", ctx["frame"], [cv2.IMWRITE_JPEG_QUALITY, 80]
+            )
+            jpg_bytes = enc_jpg.tobytes() if ok else None
+            ts = (
+                datetime.now(timezone.utc)
+                .isoformat(timespec="milliseconds")
+                .replace("+00:00", "Z")
+            )
+            for det in dets:
+                payload = {
+                    "po": po,
+                    "score_global": det["score"],  # a API converte para anomalyScore
+                    "timestamp": ts,
+                    "polygon_norm": json.dumps(det["poly_norm"]),
+                }
+                # adiciona os novos campos apenas se existirem
+                if det["class_name"] is not None:
+                    payload["classPred"] = det["class_name"]
+                if (det["confidence"] is not None) and np.isfinite(det["confidence"]):
+                    # pode mandar float direto; será lido como string no form e parseado no server
+                    payload["predConf"] = float(det["confidence"])
+
+                if jpg_bytes is not None and uploader is not None:
+                    # só enfileira: rede, retries e 429 ficam nos workers do uploader
+                    uploader.enqueue_frame(
+                        files={"imagem": ("frame.jpg", jpg_bytes, "image/jpeg")},
+                        data=payload,
+                    )
+            api_ms = (time.perf_counter() - t_api_0) * 1000.0
+
+            if save_debug and debug_dir:
+                det = dets[0]
+                try:
+                    out_dir = _save_debug_artifacts(
+                        base_dir=debug_dir,
+                        po=po,
+                        frame_rgb=ctx["frame_rgb"],
+                        poly_norm=det["poly_norm"],
+                        anomaly_map_t=det["anomaly_map"],
+                        anom_score=det["score"],
+                        pred_class_id=det["class_id"],
+                        pred_class_name=det["class_name"],
+                        pred_confidence=det["confidence"],
+                        extra_polys=[d["poly_norm"] for d in dets[1:]],
+                    )
+                    logger.info(f"[PO {po}] debug salvo em: {out_dir}")
+                except Exception as ioe:
+                    logger.warning(f"[PO {po}] falha ao salvar debug: {ioe}")
+
+        # ===== métricas (sempre logar) =====
+        total_ms = (time.perf_counter() - ctx["t0"]) * 1000.0
+        glass_ms = (time.monotonic() - ctx["cap_ts"]) * 1000.0
+        waits = ctx.get("stage_wait_ms")
+        logger.info(
+            (
+                f"[PO {po}] | glass={glass_ms:.2f}ms seq={ctx['seq']} "
+                f"dropped={frames_dropped}/{frames_seen + frames_dropped} "
+                f"total={total_ms:.2f}ms read={ctx['read_ms']:.2f}ms "
+                f"preprocess={ctx['pre_ms']:.2f}ms anomaly_inf={ctx['anom_ms']:.2f}ms "
+                f"post_process={ctx['post_ms']:.2f}ms class_inf={ctx['class_ms']:.2f}ms api={api_ms:.2f}ms "
+                f"batch={ctx['batch_size']}/{server.max_batch}"
+                + (f" regions={len(dets)}" if dets else "")
+                + (f" queue_wait={sum(waits.values()):.2f}ms" if waits else "")
+                + (
+                    f" skip_rate={change_gate.skip_rate:.1%}"
+                    if change_gate is not None
+                    else ""
+                )
             )
-            return _norm(poly_px)
+        )
 
-        poly_px = approx.reshape(-1, 2).astype(np.int32)
-        poly_px[:, 0] = np.clip(poly_px[:, 0], 0, W - 1)
-        poly_px[:, 1] = np.clip(poly_px[:, 1], 0, H - 1)
-        return _norm(poly_px)
+        for k, det in enumerate(dets):
+            if det["class_id"] is None:
+                continue
+            logger.info(
+                f"[PO {po}] classificação[{k}]: id={det['class_id']} "
+                f"name={det['class_name']} conf={det['confidence']:.3f} "
+                f"(anom_score={det['score']:.3f} region={det['region_score']:.3f})"
+            )
+        return None
+
+    stages = (stage_preprocess, stage_infer, stage_post, stage_upload)
+
+    # ---------- Pipeline (opcional): um pool de workers por estágio ----------
+    pipeline_cfg = dict(pipeline or {})
+    pipe: Pipeline | None = None
+    if pipeline_cfg.get("enabled", False):
+        workers = pipeline_cfg.get("workers", {}) or {}
+        if workers.get("infer", 1) != 1:
+            logger.warning(
+                f"[PO {po}] pipeline.workers.infer ignorado: a inferência usa 1 worker"
+            )
+        qsize = int(pipeline_cfg.get("queue_size", 2))
+        pipe = Pipeline(
+            [
+                Stage(
+                    "preprocess", stage_preprocess, workers.get("preprocess", 1), qsize
+                ),
+                # só a inferência descarta: o frame mais novo substitui o que espera.
+                # 1 worker: o ModelServer guarda 1 frame pendente por PO e um
+                # submit novo cancela o anterior (2 workers se cancelariam)
+                Stage(
+                    "infer",
+                    stage_infer,
+                    1,
+                    queue_size=1,
+                    drop_oldest=True,
+                ),
+                Stage("post", stage_post, workers.get("post", 1), qsize),
+                Stage("upload", stage_upload, workers.get("upload", 1), qsize),
+            ],
+            name=f"po{po}",
+        )
+        pipe.start()
+    status_every = float(pipeline_cfg.get("status_interval_sec", 5.0))
+    last_status = time.monotonic()
+    prev_seq: int | None = None
+    frames_seen = 0
+    frames_dropped = 0
 
     try:
         while not stop_event.is_set():
@@ -282,178 +504,63 @@ def run_inference(
                 if watcher.get_state():
                     if not was_running:
                         stream.resume()
+                        if change_gate is not None:
+                            change_gate.reset()
                         time.sleep(0.1)
                         was_running = True
 
                     t_total_0 = time.perf_counter()
 
                     # 1) leitura
-                    t_read_0 = time.perf_counter()
-                    frame = stream.read(timeout=0.2)
+                    rec = stream.read_record(timeout=0.2)
                     t_read_1 = time.perf_counter()
-                    if frame is None:
+                    if rec is None:
+                        continue
+                    frame = rec.frame
+                    if prev_seq is None or rec.seq > prev_seq:
+                        if prev_seq is not None:
+                            # lacuna no seq: frames que não chegaram até aqui
+                            frames_dropped += rec.seq - prev_seq - 1
+                        frames_seen += 1
+                        prev_seq = rec.seq
+                    elif pipe is not None:
+                        # sem frame novo o stream devolve o último: não re-enfileira
                         continue
 
-                    # 2) preprocess
-                    t_pre_0 = time.perf_counter()
-                    frame_rgb = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-                    tensor = (to_tensor(frame_rgb) * 255).to(torch.uint8)
-                    dataset = PredictDataset(images=[tensor])
-                    loader = DataLoader(
-                        dataset,
-                        collate_fn=dataset.collate_fn,
-                    )
-                    t_pre_1 = time.perf_counter()
-
-                    # 3) inferência (anomalia) via Engine
-                    t_anom_0 = time.perf_counter()
-                    with torch.inference_mode(), _silent_out, _silent_err:
-                        predictions = engine.predict(
-                            model=model, dataloaders=loader, return_predictions=True
-                        )
-                    t_anom_1 = time.perf_counter()
-
-                    # 4+5) pós-processo + classificação (se houver detecção)
-                    t_post_0 = time.perf_counter()
-                    t_post_1 = t_post_0
-                    t_class_0 = t_post_0
-                    t_class_1 = t_post_0
-
-                    pred_class_id = None
-                    pred_class_name = None
-                    pred_confidence = None
-                    score = None
-                    poly_norm = None
-                    last_anomaly_map = None
-                    api_ms = 0.0
-
-                    for batch in predictions:
-                        for sel_score, anomaly_map in zip(
-                            batch.pred_score, batch.anomaly_map
-                        ):
-                            score = float(sel_score.detach().cpu().item())
-                            if score < THRESH:
-                                continue
-
-                            t_post_0 = time.perf_counter()
-                            poly_norm = extract_anomaly_polygon(
-                                anomaly_map, frame.shape
-                            )
-                            last_anomaly_map = anomaly_map
-                            t_post_1 = time.perf_counter()
-
-                            # --- classificação SVM (opcional) ---
-                            t_class_0 = time.perf_counter()
-                            pred_class_name = None
-                            pred_confidence = None
-                            try:
-                                emb = embed_region_from_frame_rgb(
-                                    frame_rgb, poly_norm, extractor
-                                )
-                                proba = clf.predict_proba([emb])[0]
-                                idx = int(np.argmax(proba))
-                                cls_id = int(clf.classes_[idx])
-                                cls_name = class_map.get(str(cls_id), f"class_{cls_id}")
-                                conf = float(proba[idx])
-
-                                # guardamos só o que vamos enviar
-                                pred_class_name = cls_name
-                                pred_confidence = conf
-                                pred_class_id = cls_id
-                            except Exception as e:
-                                logger.error(
-                                    f"[PO {po}] erro na classificação SVM: {e}"
-                                )
-                            t_class_1 = time.perf_counter()
-
-                            # --- envio para a API ---
-                            t_api_0 = time.perf_counter()
-                            payload = {
-                                "po": po,
-                                "score_global": score,  # a API converte para anomalyScore
-                                "timestamp": datetime.now(timezone.utc)
-                                .isoformat(timespec="milliseconds")
-                                .replace("+00:00", "Z"),
-                                "polygon_norm": json.dumps(poly_norm),
-                            }
-                            # adiciona os novos campos apenas se existirem
-                            if pred_class_name is not None:
-                                payload["classPred"] = pred_class_name
-                            if (pred_confidence is not None) and np.isfinite(
-                                pred_confidence
-                            ):
-                                # pode mandar float direto; será lido como string no form e parseado no server
-                                payload["predConf"] = float(pred_confidence)
-
-                            ok, enc_jpg = cv2.imencode(
-                                ".jpg", frame, [cv2.IMWRITE_JPEG_QUALITY, 80]
-                            )
-                            # if ok:
-                            #     _ = api.send_frame(
-                            #         files={
-                            #             "imagem": (
-                            #                 "frame.jpg",
-                            #                 enc_jpg.tobytes(),
-                            #                 "image/jpeg",
-                            #             )
-                            #         },
-                            #         data=payload,
-                            #     )
-                            t_api_1 = time.perf_counter()
-                            api_ms = (t_api_1 - t_api_0) * 1000.0
-
-                            if save_debug and debug_dir:
-                                try:
-                                    out_dir = _save_debug_artifacts(
-                                        base_dir=debug_dir,
-                                        po=po,
-                                        frame_rgb=frame_rgb,
-                                        poly_norm=poly_norm,
-                                        anomaly_map_t=last_anomaly_map,
-                                        anom_score=score,
-                                        pred_class_id=pred_class_id,
-                                        pred_class_name=pred_class_name,
-                                        pred_confidence=pred_confidence,
-                                    )
-                                    logger.info(f"[PO {po}] debug salvo em: {out_dir}")
-                                except Exception as ioe:
-                                    logger.warning(
-                                        f"[PO {po}] falha ao salvar debug: {ioe}"
-                                    )
-
-                            break
-                        break
-
-                    # ===== métricas (sempre logar) =====
-                    t_total_1 = time.perf_counter()
-                    read_ms = (t_read_1 - t_read_0) * 1000.0
-                    pre_ms = (t_pre_1 - t_pre_0) * 1000.0
-                    anom_ms = (t_anom_1 - t_anom_0) * 1000.0
-                    post_ms = (
-                        (t_post_1 - t_post_0) * 1000.0 if poly_norm is not None else 0.0
-                    )
-                    class_ms = (t_class_1 - t_class_0) * 1000.0
-                    total_ms = (t_total_1 - t_total_0) * 1000.0
-
-                    logger.info(
-                        (
-                            f"[PO {po}] | total={total_ms:.2f}ms read={read_ms:.2f}ms "
-                            f"preprocess={pre_ms:.2f}ms anomaly_inf={anom_ms:.2f}ms "
-                            f"post_process={post_ms:.2f}ms class_inf={class_ms:.2f}ms api={api_ms:.2f}ms"
-                        )
-                    )
-
-                    if pred_class_id is not None:
+                    # 1b) gate de mudança: cena parada -> reaproveita o score
+                    if change_gate is not None and not change_gate.check(frame):
+                        gate_ms = (time.perf_counter() - t_read_1) * 1000.0
                         logger.info(
-                            f"[PO {po}] classificação: id={pred_class_id} "
-                            f"name={pred_class_name} conf={pred_confidence:.3f} "
-                            f"(anom_score={score:.3f})"
+                            f"[PO {po}] | gated read={(t_read_1 - t_total_0) * 1000.0:.2f}ms "
+                            f"gate={gate_ms:.2f}ms score_reused="
+                            f"{'-' if last_score is None else f'{last_score:.3f}'} "
+                            f"skip_rate={change_gate.skip_rate:.1%}"
                         )
+                        continue
+
+                    ctx = {
+                        "frame": frame,
+                        "seq": rec.seq,
+                        "cap_ts": rec.ts,
+                        "t0": t_total_0,
+                        "read_ms": (t_read_1 - t_total_0) * 1000.0,
+                    }
+                    if pipe is None:
+                        # 2..5) sequencial, na própria thread
+                        for stage in stages:
+                            ctx = stage(ctx)
+                    else:
+                        pipe.submit(ctx)
+                        now = time.monotonic()
+                        if (now - last_status) >= status_every:
+                            last_status = now
+                            logger.info(f"[PO {po}] pipeline | {pipe.status_line()}")
 
                 else:
                     if was_running:
                         stream.pause()
                         was_running = False
+                        prev_seq = None
                     time.sleep(0.1)
 
             except Exception as e:
@@ -461,6 +568,11 @@ def run_inference(
                 time.sleep(0.5)
 
     finally:
+        if pipe is not None:
+            try:
+                pipe.stop()
+            except Exception:
+                pass
         try:
             stream.pause()
         except Exception:
@@ -473,8 +585,9 @@ def run_inference(
             watcher.stop()
         except Exception:
             pass
-        try:
-            extractor.close()
-        except Exception:
-            pass
+        if own_server:
+            try:
+                server.stop()
+            except Exception:
+                pass
         logger.info(f"[PO {po}] Loop finalizado.")
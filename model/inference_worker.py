@@ -0,0 +1,140 @@
+# inference_worker.py
+# Montagem de uma câmera (ApiController + uploader/spool + thread com o
+# run_inference) e o processo de inferência do modo multi-processo: a captura
+# fica no processo principal e publica os frames em anéis de shared memory
+# (utils.shm_ring); cada processo de inferência atende um grupo de POs com o
+# seu próprio ModelServer, fora do GIL dos demais.
+
+from __future__ import annotations
+
+import os
+import threading
+
+from model.inference_loop import run_inference
+from model.model_server import ModelServer
+from utils.api_controller import ApiController
+from utils.logger import logger
+from utils.shm_ring import ShmChannel, ShmFrameReader
+from utils.upload_queue import AsyncUploader
+from utils.upload_spool import DetectionSpool
+
+ANOMALY_CKPT_PATH = "model/Patchcore/teste1/weights/lightning/model.ckpt"
+SVM_MODEL_PATH = "model/svm/svm_model.joblib"
+
+
+def build_server(inference_cfg: dict) -> ModelServer:
+    knn_cfg = inference_cfg.get("knn", {}) or {}
+    return ModelServer(
+        max_batch=inference_cfg.get("max_batch", 1),
+        max_wait_ms=inference_cfg.get("max_wait_ms", 5.0),
+        knn_backend=knn_cfg.get("backend", "exact"),
+        knn_params=knn_cfg.get("params"),
+        runtime=inference_cfg.get("runtime", "torch"),
+        quantize=inference_cfg.get("quantize"),
+    )
+
+
+def camera_stream_kwargs(camera: dict) -> dict:
+    """kwargs do BufferedVideoStream (mesmos padrões do run_inference)."""
+    kwargs = {"backend": "opencv", "source": camera["url"], "start_paused": True}
+    kwargs.update(camera.get("stream") or {})
+    return kwargs
+
+
+def start_camera(
+    config: dict,
+    camera: dict,
+    server: ModelServer,
+    stop_ev,
+    stream=None,
+) -> tuple[threading.Thread, AsyncUploader | None, DetectionSpool | None]:
+    """ApiController + envio (opcional) + thread do run_inference para um PO."""
+    inference_cfg = config.get("inference", {}) or {}
+    upload_cfg = dict(config.get("upload", {}) or {})
+    upload_enabled = upload_cfg.pop("enabled", False)
+    spool_cfg = dict(upload_cfg.pop("spool", {}) or {})
+    spool_enabled = spool_cfg.pop("enabled", False)
+    spool_dir = spool_cfg.pop("dir", "spool")
+    po = camera["po"]
+
+    api = ApiController(config=config["api"])
+    uploader = spool = None
+    if upload_enabled:
+        if spool_enabled:
+            # o que não sair (API fora / fila cheia) fica no disco e é reenviado
+            spool = DetectionSpool(
+                api,
+                path=os.path.join(spool_dir, f"po_{po}.db"),
+                name=f"spool_{po}",
+                **spool_cfg,
+            ).start()
+        # envio em background: a thread de inferência só enfileira
+        uploader = AsyncUploader(
+            api, name=f"uploader_{po}", spool=spool, **upload_cfg
+        ).start()
+
+    thread = threading.Thread(
+        target=run_inference,
+        args=(
+            camera["url"],
+            po,
+            ANOMALY_CKPT_PATH,
+            api,
+            SVM_MODEL_PATH,
+            stop_ev,
+        ),
+        kwargs={
+            "inference_mode": inference_cfg.get("mode", "direct"),
+            "server": server,
+            "gate": inference_cfg.get("gate"),
+            "pipeline": inference_cfg.get("pipeline"),
+            "uploader": uploader,
+            "stream_opts": camera.get("stream"),
+            "stream": stream,
+            "postprocess": inference_cfg.get("postprocess"),
+        },
+        daemon=True,
+        name=f"inference_{po}",
+    )
+    thread.start()
+    return thread, uploader, spool
+
+
+def stop_uploads(uploaders: list[AsyncUploader], spools: list[DetectionSpool]) -> None:
+    # uploader antes do spool: as pendências do stop() vão para o disco
+    for uploader in uploaders:
+        uploader.stop()
+    for spool in spools:
+        spool.stop()
+
+
+def worker_main(config: dict, cameras: list[dict], channels: list[ShmChannel], stop_ev):
+    """Entrada do processo de inferência (spawn): um ModelServer por processo."""
+    pos = [c["po"] for c in cameras]
+    logger.info(f"[worker {os.getpid()}] POs {pos}")
+    server = build_server(config.get("inference", {}) or {})
+    server.start()
+
+    threads: list[threading.Thread] = []
+    uploaders: list[AsyncUploader] = []
+    spools: list[DetectionSpool] = []
+    try:
+        for camera, channel in zip(cameras, channels):
+            thread, uploader, spool = start_camera(
+                config, camera, server, stop_ev, stream=ShmFrameReader(channel)
+            )
+            threads.append(thread)
+            if uploader is not None:
+                uploaders.append(uploader)
+            if spool is not None:
+                spools.append(spool)
+        stop_ev.wait()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        stop_ev.set()
+        for thread in threads:
+            thread.join(timeout=5.0)
+        server.stop()
+        stop_uploads(uploaders, spools)
+        logger.info(f"[worker {os.getpid()}] finalizado")
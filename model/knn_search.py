@@ -0,0 +1,324 @@
+# knn_search.py
+# Backends de busca de vizinho mais próximo para o memory bank do Patchcore.
+#
+#   - "exact":   torch.cdist contra o memory bank inteiro (referência)
+#   - "chunked": exato, mas em blocos do memory bank (pico de memória limitado)
+#   - "ivf":     faiss IndexIVFFlat (aproximado), persistido ao lado do model.ckpt
+#   - "hnsw":    faiss IndexHNSWFlat (aproximado), persistido ao lado do model.ckpt
+#
+# Uso:
+#   python -m model.knn_search --ckpt model/.../model.ckpt --images dataset/teste1
+# gera o relatório recall@1 x latência de cada backend.
+
+from __future__ import annotations
+
+import argparse
+import glob
+import os
+import time
+from typing import Dict, List, Optional, Tuple
+
+import cv2
+import numpy as np
+import torch
+
+from utils.logger import logger
+
+# faiss é opcional; só necessário para "ivf"/"hnsw"
+_HAS_FAISS = False
+try:
+    import faiss  # type: ignore
+
+    _HAS_FAISS = True
+except Exception:
+    _HAS_FAISS = False
+
+KNN_BACKENDS = ("exact", "chunked", "ivf", "hnsw")
+
+
+class _BaseSearch:
+    """Contrato: search(embedding [N,D], k) no formato de PatchcoreModel.nearest_neighbors."""
+
+    name: str = "base"
+
+    def search(
+        self, embedding: torch.Tensor, n_neighbors: int
+    ) -> Tuple[torch.Tensor, torch.Tensor]:
+        raise NotImplementedError
+
+    @staticmethod
+    def _squeeze_k1(
+        dists: torch.Tensor, idx: torch.Tensor, n_neighbors: int
+    ) -> Tuple[torch.Tensor, torch.Tensor]:
+        # o Patchcore espera [N] quando k == 1 e [N,k] caso contrário
+        if n_neighbors == 1:
+            return dists[:, 0], idx[:, 0]
+        return dists, idx
+
+
+class ExactSearch(_BaseSearch):
+    name = "exact"
+
+    def __init__(self, memory_bank: torch.Tensor):
+        self.memory_bank = memory_bank
+
+    def search(self, embedding, n_neighbors):
+        dists = torch.cdist(embedding, self.memory_bank)
+        if n_neighbors == 1:
+            return dists.min(1)
+        return dists.topk(k=n_neighbors, largest=False, dim=1)
+
+
+class ChunkedExactSearch(_BaseSearch):
+    """Exato, percorrendo o memory bank em blocos e mantendo o top-k corrente."""
+
+    name = "chunked"
+
+    def __init__(self, memory_bank: torch.Tensor, chunk_size: int = 8192):
+        self.memory_bank = memory_bank
+        self.chunk_size = max(1, int(chunk_size))
+
+    def search(self, embedding, n_neighbors):
+        best_d: Optional[torch.Tensor] = None
+        best_i: Optional[torch.Tensor] = None
+        for start in range(0, self.memory_bank.shape[0], self.chunk_size):
+            block = self.memory_bank[start : start + self.chunk_size]
+            d = torch.cdist(embedding, block)
+            k = min(n_neighbors, d.shape[1])
+            d, i = d.topk(k=k, largest=False, dim=1)
+            i = i + start
+            if best_d is None:
+                best_d, best_i = d, i
+            else:
+                cat_d = torch.cat([best_d, d], dim=1)
+                cat_i = torch.cat([best_i, i], dim=1)
+                k = min(n_neighbors, cat_d.shape[1])
+                best_d, pos = cat_d.topk(k=k, largest=False, dim=1)
+                best_i = cat_i.gather(1, pos)
+        return self._squeeze_k1(best_d, best_i, n_neighbors)
+
+
+class FaissSearch(_BaseSearch):
+    """
+    Índice faiss (IVF ou HNSW) construído uma vez no load e persistido em
+    "<model.ckpt>.<kind>.faiss". Reconstruído se o arquivo for mais antigo que o
+    checkpoint ou não bater com o memory bank.
+    """
+
+    def __init__(
+        self,
+        memory_bank: torch.Tensor,
+        kind: str = "ivf",
+        index_path: Optional[str] = None,
+        nlist: Optional[int] = None,
+        nprobe: int = 8,
+        hnsw_m: int = 32,
+        ef_search: int = 64,
+        ef_construction: int = 80,
+    ):
+        if not _HAS_FAISS:
+            raise RuntimeError(
+                "faiss não disponível: instale faiss-cpu para 'ivf'/'hnsw'."
+            )
+        if kind not in ("ivf", "hnsw"):
+            raise ValueError("kind deve ser 'ivf' ou 'hnsw'")
+        self.name = kind
+        self.device = memory_bank.device
+        bank = memory_bank.detach().float().cpu().numpy()
+        bank = np.ascontiguousarray(bank)
+        n, d = bank.shape
+
+        index = self._load(index_path, n, d)
+        if index is None:
+            t0 = time.perf_counter()
+            if kind == "ivf":
+                nlist = int(nlist or max(1, min(4096, int(4 * np.sqrt(n)))))
+                quantizer = faiss.IndexFlatL2(d)
+                index = faiss.IndexIVFFlat(quantizer, d, nlist)
+                index.train(bank)
+            else:
+                index = faiss.IndexHNSWFlat(d, int(hnsw_m))
+                index.hnsw.efConstruction = int(ef_construction)
+            index.add(bank)
+            logger.info(
+                f"[knn] índice {kind} construído em {(time.perf_counter() - t0):.1f}s "
+                f"(n={n}, d={d})"
+            )
+            if index_path:
+                try:
+                    faiss.write_index(index, index_path)
+                except Exception as e:
+                    logger.warning(f"[knn] falha ao salvar índice em {index_path}: {e}")
+
+        if kind == "ivf":
+            index.nprobe = int(nprobe)
+        else:
+            index.hnsw.efSearch = int(ef_search)
+        self.index = index
+
+    @staticmethod
+    def _load(index_path: Optional[str], n: int, d: int):
+        if not index_path or not os.path.exists(index_path):
+            return None
+        ckpt_path = index_path.rsplit(".", 2)[0]
+        try:
+            if os.path.exists(ckpt_path) and os.path.getmtime(
+                index_path
+            ) < os.path.getmtime(ckpt_path):
+                return None
+            index = faiss.read_index(index_path)
+        except Exception:
+            return None
+        if index.ntotal != n or index.d != d:
+            return None
+        return index
+
+    def search(self, embedding, n_neighbors):
+        q = np.ascontiguousarray(embedding.detach().float().cpu().numpy())
+        d2, idx = self.index.search(q, int(n_neighbors))
+        dists = torch.from_numpy(np.sqrt(np.maximum(d2, 0.0))).to(self.device)
+        idx = torch.from_numpy(np.maximum(idx, 0)).to(self.device)
+        return self._squeeze_k1(dists, idx, n_neighbors)
+
+
+def build_knn_backend(
+    kind: str,
+    memory_bank: torch.Tensor,
+    ckpt_path: Optional[str] = None,
+    **params,
+) -> _BaseSearch:
+    kind = (kind or "exact").lower().strip()
+    if kind == "exact":
+        return ExactSearch(memory_bank)
+    if kind == "chunked":
+        return ChunkedExactSearch(
+            memory_bank, chunk_size=params.get("chunk_size", 8192)
+        )
+    if kind in ("ivf", "hnsw"):
+        index_path = f"{ckpt_path}.{kind}.faiss" if ckpt_path else None
+        keys = ("nlist", "nprobe", "hnsw_m", "ef_search", "ef_construction")
+        return FaissSearch(
+            memory_bank,
+            kind=kind,
+            index_path=index_path,
+            **{k: v for k, v in params.items() if k in keys},
+        )
+    raise ValueError(f"knn backend deve ser um de {KNN_BACKENDS}")
+
+
+def install_knn_backend(patchcore_model: torch.nn.Module, backend: _BaseSearch) -> None:
+    """Substitui PatchcoreModel.nearest_neighbors (só nesta instância) pelo backend."""
+    patchcore_model.nearest_neighbors = backend.search
+    patchcore_model.knn_backend = backend.name
+
+
+# ----------------- Relatório recall x latência -----------------
+@torch.inference_mode()
+def _patch_embeddings(runner, frames_rgb: List[np.ndarray]) -> torch.Tensor:
+    """Embeddings de patch [N*h*w, D] exatamente como o PatchcoreModel.forward gera."""
+    pm = runner.model.model
+    out = []
+    for fr in frames_rgb:
+        feats = runner.extract_features([fr])[0]
+        feats = {k: pm.feature_pooler(v.unsqueeze(0)) for k, v in feats.items()}
+        emb = pm.generate_embedding(feats)
+        out.append(pm.reshape_embedding(emb))
+    return torch.cat(out, dim=0)
+
+
+def knn_report(
+    ckpt_path: str,
+    images_dir: str,
+    backends: Tuple[str, ...] = KNN_BACKENDS,
+    max_images: int = 20,
+    repeats: int = 3,
+    device: str = "cpu",
+    **params,
+) -> List[Dict]:
+    """
+    Compara cada backend contra o "exact" em embeddings de frames reais:
+      - recall@1: fração de patches com o mesmo vizinho do exato
+      - score_err: erro relativo médio do score de imagem (max das distâncias)
+      - ms_per_image: latência média da busca por imagem
+    """
+    from model.anomaly_runner import PatchcoreRunner
+
+    paths = sorted(
+        p
+        for ext in ("*.jpg", "*.jpeg", "*.png", "*.bmp")
+        for p in glob.glob(os.path.join(images_dir, ext))
+    )[:max_images]
+    if not paths:
+        raise RuntimeError(f"Nenhuma imagem em '{images_dir}'.")
+    frames = [cv2.cvtColor(cv2.imread(p), cv2.COLOR_BGR2RGB) for p in paths]
+
+    runner = PatchcoreRunner(ckpt_path, device=device)
+    bank = runner.model.model.memory_bank
+    emb = _patch_embeddings(runner, frames)
+    per_image = emb.shape[0] // len(frames)
+
+    ref_d, ref_i = ExactSearch(bank).search(emb, 1)
+    ref_score = ref_d.reshape(len(frames), per_image).max(dim=1).values
+
+    rows: List[Dict] = []
+    for kind in backends:
+        try:
+            t0 = time.perf_counter()
+            backend = build_knn_backend(kind, bank, ckpt_path=ckpt_path, **params)
+            build_s = time.perf_counter() - t0
+        except Exception as e:
+            logger.warning(f"[knn] backend '{kind}' indisponível: {e}")
+            continue
+
+        t0 = time.perf_counter()
+        for _ in range(repeats):
+            d, i = backend.search(emb, 1)
+        ms = (time.perf_counter() - t0) * 1000.0 / (repeats * len(frames))
+
+        score = d.reshape(len(frames), per_image).max(dim=1).values
+        rows.append(
+            {
+                "backend": kind,
+                "recall@1": float((i == ref_i).float().mean()),
+                "score_err": float(
+                    ((score - ref_score).abs() / ref_score.clamp_min(1e-6)).mean()
+                ),
+                "ms_per_image": ms,
+                "build_s": build_s,
+                "memory_bank": int(bank.shape[0]),
+            }
+        )
+
+    for r in rows:
+        logger.info(
+            f"[knn] {r['backend']:>8} | recall@1={r['recall@1']:.4f} "
+            f"score_err={r['score_err']:.4%} | {r['ms_per_image']:.2f} ms/img "
+            f"| build={r['build_s']:.1f}s (bank={r['memory_bank']})"
+        )
+    return rows
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Relatório recall x latência do kNN.")
+    ap.add_argument("--ckpt", required=True, help="model.ckpt do Patchcore")
+    ap.add_argument("--images", required=True, help="pasta com frames de teste")
+    ap.add_argument("--backends", default=",".join(KNN_BACKENDS))
+    ap.add_argument("--max-images", type=int, default=20)
+    ap.add_argument("--nprobe", type=int, default=8)
+    ap.add_argument("--ef-search", type=int, default=64)
+    ap.add_argument("--chunk-size", type=int, default=8192)
+    args = ap.parse_args()
+
+    knn_report(
+        args.ckpt,
+        args.images,
+        backends=tuple(b.strip() for b in args.backends.split(",") if b.strip()),
+        max_images=args.max_images,
+        nprobe=args.nprobe,
+        ef_search=args.ef_search,
+        chunk_size=args.chunk_size,
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,393 @@
+# model_server.py
+# Serviço de modelos compartilhado entre as threads de câmera (POs):
+# cada checkpoint (Patchcore, ResNetFeature, SVM) é carregado UMA vez.
+
+from __future__ import annotations
+
+import json
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+from typing import Any, Deque, Dict, List, Optional, Tuple
+
+import numpy as np
+import torch
+from joblib import load
+
+from model.anomaly_runner import build_anomaly_runner
+from utils.feature_extractor import (
+    ResNetFeature,
+    embed_region_from_frame_rgb,
+    embed_regions_from_frame_rgb,
+    region_embedding_from_feature_maps,
+    region_embeddings_from_feature_maps,
+)
+from utils.logger import logger
+from utils.quantization import load_calibration_frames
+
+
+def load_classifier(
+    svm_model_path: str, svm_meta_path: Optional[str] = None
+) -> Tuple[Any, Dict[str, Any]]:
+    """
+    Carrega o pipeline SVM (scaler -> (pca) -> svc) e o model_meta.json.
+    O meta sempre tem "class_map" e "feature_source" ("resnet" por padrão).
+    """
+    if svm_meta_path is None:
+        svm_meta_path = os.path.join(
+            os.path.dirname(svm_model_path) or ".", "model_meta.json"
+        )
+    try:
+        clf = load(svm_model_path)
+    except Exception as e:
+        raise RuntimeError(f"Falha ao carregar SVM em '{svm_model_path}': {e}")
+
+    meta: Dict[str, Any] = {}
+    try:
+        with open(svm_meta_path, "r", encoding="utf-8") as f:
+            meta = json.load(f) or {}
+    except Exception:
+        logger.warning(
+            f"Não foi possível carregar class_map em '{svm_meta_path}'. Usando nomes padrão."
+        )
+    meta["class_map"] = meta.get("class_map", {}) or {}
+    # meta antigo/ausente: origem gravada no próprio .joblib, senão "resnet"
+    meta["feature_source"] = (
+        meta.get("feature_source") or getattr(clf, "feature_source_", None) or "resnet"
+    )
+    return clf, meta
+
+
+class ModelServer(threading.Thread):
+    """
+    Serviço de inferência em processo, compartilhado por todas as câmeras.
+
+    - Patchcore: um runner por checkpoint (cache por caminho); runtime
+      "torch" (PatchcoreRunner), "onnx" ou "openvino" (modelo exportado)
+    - ResNetFeature: uma única instância (protegida por lock)
+    - SVM: um pipeline por caminho (predict_proba é só leitura)
+
+    As threads de PO chamam submit()/infer(); uma thread worker atende as
+    filas por PO em round-robin (cada PO tem no máximo 1 frame pendente; um
+    frame novo substitui o antigo), então nenhum PO monopoliza o modelo.
+
+    Micro-batching: frames de POs diferentes (mesmo checkpoint) que chegam
+    dentro de max_wait_ms vão num único forward de até max_batch frames.
+    max_batch=1 desliga o batching.
+    """
+
+    def __init__(
+        self,
+        device: Optional[str] = None,
+        backbone: str = "resnet50",
+        max_batch: int = 1,
+        max_wait_ms: float = 5.0,
+        knn_backend: str = "exact",
+        knn_params: Optional[Dict] = None,
+        runtime: str = "torch",
+        quantize: Optional[Dict] = None,
+    ):
+        super().__init__(daemon=True, name="model_server")
+        self.device = device or ("cuda" if torch.cuda.is_available() else "cpu")
+        self.backbone = backbone
+        self.max_batch = max(1, int(max_batch))
+        self.max_wait_ms = max(0.0, float(max_wait_ms))
+        self.knn_backend = knn_backend
+        self.knn_params = dict(knn_params or {})
+        self.runtime = runtime
+        # INT8 (CPU): {"enabled": bool, "calib_dir": str, "calib_frames": int}
+        self.quantize = dict(quantize or {})
+        self._calib: Optional[List[np.ndarray]] = None
+
+        self._load_lock = threading.Lock()
+        self._runners: Dict[str, Any] = {}
+        self._classifiers: Dict[Tuple[str, Optional[str]], Tuple[Any, Dict]] = {}
+        self._extractor: Optional[ResNetFeature] = None
+        self._extractor_lock = threading.Lock()
+
+        # filas por PO + ordem de atendimento (round-robin)
+        self._cv = threading.Condition()
+        self._pending: Dict[int, Deque[Tuple[str, np.ndarray, Future]]] = {}
+        self._rr: Deque[int] = deque()
+        self._stop_event = threading.Event()
+
+        # métricas
+        self._served: Dict[int, int] = {}
+        self._replaced: Dict[int, int] = {}
+        self._infer_ms_ema: Optional[float] = None
+        self._batches = 0
+        self._batched_frames = 0
+        self._fill_ema: Optional[float] = None
+
+    # ===== modelos (lazy, carregados 1x) =====
+    def _quant_enabled(self) -> bool:
+        return bool(self.quantize.get("enabled"))
+
+    def _calib_frames(self) -> List[np.ndarray]:
+        """Frames de calibração INT8 (lidos 1x, compartilhados pelos backbones)."""
+        if self._calib is None:
+            self._calib = []
+            calib_dir = self.quantize.get("calib_dir")
+            if calib_dir:
+                try:
+                    self._calib, _ = load_calibration_frames(
+                        calib_dir,
+                        max_frames=int(self.quantize.get("calib_frames", 32)),
+                        holdout_frac=0.0,
+                    )
+                except Exception as e:
+                    logger.warning(f"[ModelServer] calibração INT8 indisponível: {e}")
+        return self._calib
+
+    def get_runner(self, ckpt_path: str):
+        key = os.path.abspath(ckpt_path)
+        with self._load_lock:
+            runner = self._runners.get(key)
+            if runner is None:
+                logger.info(
+                    f"[ModelServer] carregando Patchcore ({self.runtime}): {ckpt_path}"
+                )
+                runner = build_anomaly_runner(
+                    ckpt_path,
+                    runtime=self.runtime,
+                    device=self.device,
+                    backbone=self.backbone,
+                    max_batch=self.max_batch,
+                    knn_backend=self.knn_backend,
+                    knn_params=self.knn_params,
+                    quantize=self._quant_enabled(),
+                    calib_frames=(
+                        self._calib_frames() if self._quant_enabled() else None
+                    ),
+                )
+                try:
+                    runner.warmup()
+                except Exception:
+                    pass
+                self._runners[key] = runner
+            return runner
+
+    def get_classifier(
+        self, svm_model_path: str, svm_meta_path: Optional[str] = None
+    ) -> Tuple[Any, Dict[str, Any]]:
+        key = (os.path.abspath(svm_model_path), svm_meta_path)
+        with self._load_lock:
+            if key not in self._classifiers:
+                self._classifiers[key] = load_classifier(svm_model_path, svm_meta_path)
+            return self._classifiers[key]
+
+    def get_extractor(self) -> ResNetFeature:
+        with self._load_lock:
+            if self._extractor is None:
+                self._extractor = ResNetFeature(
+                    device=self.device,
+                    use_half=True,
+                    quantize=self._quant_enabled(),
+                    calib_frames=(
+                        self._calib_frames() if self._quant_enabled() else None
+                    ),
+                )
+                try:
+                    self._extractor.warmup()
+                except Exception:
+                    pass
+            return self._extractor
+
+    def embed_region(
+        self,
+        frame_rgb: np.ndarray,
+        poly_norm: List[List[float]],
+        feature_source: str = "resnet",
+        features: Optional[Dict[str, torch.Tensor]] = None,
+        ckpt_path: Optional[str] = None,
+    ) -> np.ndarray:
+        """
+        Embedding da região para o SVM.
+          - "resnet": ResNetFeature compartilhado (hook não é thread-safe -> lock)
+          - "patchcore": pooled nos feature maps que o Patchcore já calculou
+            (features do resultado de infer); sem eles, roda só o backbone.
+        """
+        if feature_source == "patchcore":
+            if features is None:
+                features = self.get_runner(ckpt_path).extract_features([frame_rgb])[0]
+            return region_embedding_from_feature_maps(features, poly_norm)
+
+        extractor = self.get_extractor()
+        with self._extractor_lock:
+            return embed_region_from_frame_rgb(frame_rgb, poly_norm, extractor)
+
+    def embed_regions(
+        self,
+        frame_rgb: np.ndarray,
+        polys: List[List[List[float]]],
+        feature_source: str = "resnet",
+        features: Optional[Dict[str, torch.Tensor]] = None,
+        ckpt_path: Optional[str] = None,
+    ) -> np.ndarray:
+        """embed_region para K regiões do mesmo frame: 1 forward no máximo -> (K, D)."""
+        if feature_source == "patchcore":
+            if features is None:
+                features = self.get_runner(ckpt_path).extract_features([frame_rgb])[0]
+            return region_embeddings_from_feature_maps(features, polys)
+
+        extractor = self.get_extractor()
+        with self._extractor_lock:
+            return embed_regions_from_frame_rgb(frame_rgb, polys, extractor)
+
+    # ===== submissão =====
+    def submit(self, po: int, ckpt_path: str, frame_rgb: np.ndarray) -> Future:
+        """
+        Enfileira um frame do PO; o resultado é
+        {"pred_score", "anomaly_map", "features", "batch_size"}.
+        """
+        fut: Future = Future()
+        with self._cv:
+            q = self._pending.setdefault(po, deque())
+            if q:
+                # drop-oldest por PO: o frame anterior ainda não foi atendido
+                _, _, old = q.popleft()
+                old.cancel()
+                self._replaced[po] = self._replaced.get(po, 0) + 1
+            q.append((ckpt_path, frame_rgb, fut))
+            if po not in self._rr:
+                self._rr.append(po)
+            self._cv.notify()
+        return fut
+
+    def infer(
+        self,
+        po: int,
+        ckpt_path: str,
+        frame_rgb: np.ndarray,
+        timeout: Optional[float] = None,
+    ) -> Dict:
+        return self.submit(po, ckpt_path, frame_rgb).result(timeout=timeout)
+
+    # ===== worker =====
+    def _pop_next(
+        self, ckpt_path: Optional[str] = None
+    ) -> Optional[Tuple[int, str, np.ndarray, Future]]:
+        """Próximo PO na ordem round-robin (opcionalmente só do mesmo checkpoint)."""
+        for po in self._rr:
+            q = self._pending[po]
+            if ckpt_path is None or q[0][0] == ckpt_path:
+                self._rr.remove(po)
+                ckpt, frame_rgb, fut = q.popleft()
+                return po, ckpt, frame_rgb, fut
+        return None
+
+    def _next_batch(self) -> Optional[List[Tuple[int, str, np.ndarray, Future]]]:
+        with self._cv:
+            while not self._rr and not self._stop_event.is_set():
+                self._cv.wait(timeout=0.5)
+            if self._stop_event.is_set():
+                return None
+
+            batch = [self._pop_next()]
+            ckpt_path = batch[0][1]
+            deadline = time.monotonic() + self.max_wait_ms / 1000.0
+            while len(batch) < self.max_batch:
+                item = self._pop_next(ckpt_path)
+                if item is not None:
+                    batch.append(item)
+                    continue
+                # todos os POs conhecidos já estão no batch: não adianta esperar
+                if len(batch) >= len(self._pending):
+                    break
+                remaining = deadline - time.monotonic()
+                if remaining <= 0 or self._stop_event.is_set():
+                    break
+                self._cv.wait(timeout=remaining)
+            return batch
+
+    def run(self):
+        while not self._stop_event.is_set():
+            batch = self._next_batch()
+            if batch is None:
+                break
+            batch = [it for it in batch if it[3].set_running_or_notify_cancel()]
+            if not batch:
+                continue
+            ckpt_path = batch[0][1]
+            try:
+                t0 = time.perf_counter()
+                results = self.get_runner(ckpt_path).predict_batch(
+                    [it[2] for it in batch]
+                )
+                dt = (time.perf_counter() - t0) * 1000.0
+            except Exception as e:
+                for it in batch:
+                    it[3].set_exception(e)
+                continue
+
+            n = len(batch)
+            fill = n / self.max_batch
+            self._infer_ms_ema = (
+                dt
+                if self._infer_ms_ema is None
+                else 0.9 * self._infer_ms_ema + 0.1 * dt
+            )
+            self._fill_ema = (
+                fill if self._fill_ema is None else 0.9 * self._fill_ema + 0.1 * fill
+            )
+            self._batches += 1
+            self._batched_frames += n
+            for (po, _, _, fut), res in zip(batch, results):
+                self._served[po] = self._served.get(po, 0) + 1
+                res["batch_size"] = n
+                fut.set_result(res)
+
+        # acorda quem ainda estiver esperando
+        with self._cv:
+            for q in self._pending.values():
+                while q:
+                    q.popleft()[2].cancel()
+            self._rr.clear()
+
+    def stop(self):
+        self._stop_event.set()
+        with self._cv:
+            self._cv.notify_all()
+        if self.is_alive():
+            self.join(timeout=2.0)
+        with self._load_lock:
+            if self._extractor is not None:
+                try:
+                    self._extractor.close()
+                except Exception:
+                    pass
+
+    def get_status(self) -> dict:
+        with self._cv:
+            pending = {po: len(q) for po, q in self._pending.items()}
+        return {
+            "alive": self.is_alive(),
+            "device": self.device,
+            "runtime": self.runtime,
+            "int8": self._quant_enabled(),
+            "runners": list(self._runners.keys()),
+            "extractor_loaded": self._extractor is not None,
+            "pending": pending,
+            "served": dict(self._served),
+            "replaced": dict(self._replaced),
+            "infer_ms_ema": self._infer_ms_ema,
+            "knn_backend": self.knn_backend,
+            "max_batch": self.max_batch,
+            "max_wait_ms": self.max_wait_ms,
+            "batches": self._batches,
+            "batch_fill_avg": (
+                self._batched_frames / (self._batches * self.max_batch)
+                if self._batches
+                else None
+            ),
+            "batch_fill_ema": self._fill_ema,
+        }
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.stop()
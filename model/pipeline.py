@@ -0,0 +1,185 @@
+# pipeline.py
+# Pipeline em estágios para o loop de inferência:
+#   captura -> preprocess -> infer -> post -> upload
+# Cada estágio tem uma fila de entrada limitada e um pool de workers; o item
+# (dict do frame) passa de um estágio para o próximo. Filas cheias fazem
+# backpressure, exceto nos estágios com drop_oldest (inferência), que descartam
+# o frame mais antigo para a latência não crescer.
+
+from __future__ import annotations
+
+import queue
+import threading
+import time
+from typing import Callable, List, Optional
+
+from utils.logger import logger
+
+
+class Stage:
+    """
+    fn(item) -> item | None. None encerra o item neste estágio (não repassa).
+    Métricas: profundidade da fila, espera na fila e tempo de processamento (EMA).
+    """
+
+    def __init__(
+        self,
+        name: str,
+        fn: Callable[[dict], Optional[dict]],
+        workers: int = 1,
+        queue_size: int = 2,
+        drop_oldest: bool = False,
+    ):
+        self.name = name
+        self.fn = fn
+        self.workers = max(1, int(workers))
+        self.queue_size = max(1, int(queue_size))
+        self.drop_oldest = bool(drop_oldest)
+        self.next: Optional[Stage] = None
+
+        self._q: queue.Queue = queue.Queue(maxsize=self.queue_size)
+        self._stop_event = threading.Event()
+        self._threads: List[threading.Thread] = []
+
+        self._mlock = threading.Lock()
+        self.processed = 0
+        self.dropped = 0
+        self.errors = 0
+        self.max_depth = 0
+        self._wait_ms_ema: Optional[float] = None
+        self._proc_ms_ema: Optional[float] = None
+
+    # ===== fila =====
+    def put(self, item: dict) -> bool:
+        entry = (time.perf_counter(), item)
+        if self.drop_oldest:
+            while True:
+                try:
+                    self._q.put_nowait(entry)
+                    break
+                except queue.Full:
+                    try:
+                        self._q.get_nowait()
+                        with self._mlock:
+                            self.dropped += 1
+                    except queue.Empty:
+                        pass
+        else:
+            # backpressure: espera vaga (ou stop)
+            while True:
+                if self._stop_event.is_set():
+                    return False
+                try:
+                    self._q.put(entry, timeout=0.1)
+                    break
+                except queue.Full:
+                    continue
+        depth = self._q.qsize()
+        with self._mlock:
+            if depth > self.max_depth:
+                self.max_depth = depth
+        return True
+
+    # ===== workers =====
+    def _worker(self):
+        while not self._stop_event.is_set():
+            try:
+                enq_ts, item = self._q.get(timeout=0.1)
+            except queue.Empty:
+                continue
+
+            t0 = time.perf_counter()
+            wait_ms = (t0 - enq_ts) * 1000.0
+            item.setdefault("stage_wait_ms", {})[self.name] = wait_ms
+            try:
+                out = self.fn(item)
+            except Exception as e:
+                with self._mlock:
+                    self.errors += 1
+                logger.error(f"[pipeline:{self.name}] erro: {e}")
+                continue
+            proc_ms = (time.perf_counter() - t0) * 1000.0
+
+            with self._mlock:
+                self.processed += 1
+                self._wait_ms_ema = (
+                    wait_ms
+                    if self._wait_ms_ema is None
+                    else 0.9 * self._wait_ms_ema + 0.1 * wait_ms
+                )
+                self._proc_ms_ema = (
+                    proc_ms
+                    if self._proc_ms_ema is None
+                    else 0.9 * self._proc_ms_ema + 0.1 * proc_ms
+                )
+
+            if out is not None and self.next is not None:
+                self.next.put(out)
+
+    def start(self, prefix: str = ""):
+        for i in range(self.workers):
+            t = threading.Thread(
+                target=self._worker, name=f"{prefix}{self.name}_{i}", daemon=True
+            )
+            t.start()
+            self._threads.append(t)
+
+    def stop(self, timeout: float = 2.0):
+        self._stop_event.set()
+        for t in self._threads:
+            t.join(timeout=timeout)
+        self._threads.clear()
+
+    def get_status(self) -> dict:
+        with self._mlock:
+            return {
+                "depth": self._q.qsize(),
+                "capacity": self.queue_size,
+                "max_depth": self.max_depth,
+                "workers": self.workers,
+                "wait_ms_ema": self._wait_ms_ema,
+                "proc_ms_ema": self._proc_ms_ema,
+                "processed": self.processed,
+                "dropped": self.dropped,
+                "errors": self.errors,
+            }
+
+
+class Pipeline:
+    """Encadeia os estágios na ordem dada; submit() entra pelo primeiro."""
+
+    def __init__(self, stages: List[Stage], name: str = "pipeline"):
+        if not stages:
+            raise ValueError("pipeline sem estágios")
+        self.name = name
+        self.stages = stages
+        for a, b in zip(stages, stages[1:]):
+            a.next = b
+
+    def start(self):
+        for s in self.stages:
+            s.start(prefix=f"{self.name}_")
+
+    def submit(self, item: dict) -> bool:
+        return self.stages[0].put(item)
+
+    def stop(self, timeout: float = 2.0):
+        # na ordem do fluxo: os estágios de cima param de alimentar os de baixo
+        for s in self.stages:
+            s.stop(timeout=timeout)
+
+    def get_status(self) -> dict:
+        return {s.name: s.get_status() for s in self.stages}
+
+    def status_line(self) -> str:
+        parts = []
+        for name, st in self.get_status().items():
+            wait = st["wait_ms_ema"]
+            proc = st["proc_ms_ema"]
+            parts.append(
+                f"{name} q={st['depth']}/{st['capacity']} "
+                f"wait={'-' if wait is None else f'{wait:.1f}'}ms "
+                f"proc={'-' if proc is None else f'{proc:.1f}'}ms"
+                + (f" drop={st['dropped']}" if st["dropped"] else "")
+            )
+        return " | ".join(parts)
@@ -0,0 +1,340 @@
+# postprocess.py
+# Pós-processamento do mapa de anomalia: mapa -> polígono normalizado da região
+# anômala. Configurado uma vez por PO (tau, kernels, área mínima, resolução de
+# trabalho) e com buffers de trabalho reaproveitados entre chamadas; usado pelo
+# loop de inferência e por ferramentas offline.
+#
+# Uso (benchmark isolado, mapa sintético ou .npy):
+#   python -m model.postprocess --map-size 256 --frame 2448x2048 --iters 500
+
+from __future__ import annotations
+
+import argparse
+import time
+from typing import Optional, Tuple
+
+import cv2
+import numpy as np
+
+
+def anomaly_map_to_numpy(anomaly_map) -> np.ndarray:
+    """Aceita torch.Tensor (Engine) ou np.ndarray (inferência direta) -> float32 [H,W]."""
+    if hasattr(anomaly_map, "detach"):
+        anomaly_map = anomaly_map.detach().float().cpu().numpy()
+    am = np.asarray(anomaly_map, dtype=np.float32)
+    if am.ndim == 3:
+        am = am.squeeze(0)
+    return am
+
+
+class AnomalyPostprocessor:
+    """
+    Limiar (tau) + morfologia + componentes conexos na resolução do mapa (ou
+    work_size = lado maior de trabalho). Vence o componente que contém o pico
+    (e depois o de maior média) entre os que passam por min_area_frac e têm
+    máximo >= tau_strong; sem nenhum, caixa de min_box_* px centrada no pico.
+    regions() devolve até top_k regiões ranqueadas; __call__ só o polígono da 1ª.
+
+    Buffers (mapa, binário, morfologia, rótulos, máscara) são alocados no 1º
+    mapa de cada tamanho e reaproveitados (buffer_allocs conta só isso). O mapa
+    é recortado em [0, 1] direto do buffer do tensor/ndarray para o buffer de
+    trabalho (tensor na GPU ou não-float32: uma cópia, feita pelo torch).
+    Alocações que sobram por chamada, todas O(componentes), não O(mapa):
+    stats/centroids do connectedComponentsWithStats, os contornos e os dicts
+    de saída. Não é thread-safe: uma instância por thread.
+    """
+
+    def __init__(
+        self,
+        frame_shape: Optional[Tuple[int, ...]] = None,
+        tau: float = 0.6,
+        tau_strong: float = 0.8,
+        min_area_frac: float = 0.001,
+        approx_eps_frac: float = 0.005,
+        morph_kernel: int = 3,
+        morph_iters: int = 1,
+        min_box_frac: float = 0.06,
+        min_box_px: int = 32,
+        work_size: Optional[int] = None,
+        top_k: int = 1,
+    ):
+        self.frame_shape = tuple(frame_shape) if frame_shape else None
+        self.tau = float(tau)
+        self.tau_strong = float(tau_strong)
+        self.min_area_frac = float(min_area_frac)
+        self.approx_eps_frac = float(approx_eps_frac)
+        self.morph_iters = int(morph_iters)
+        self.min_box_frac = float(min_box_frac)
+        self.min_box_px = int(min_box_px)
+        self.work_size = int(work_size) if work_size else None
+        self.top_k = max(1, int(top_k))
+
+        # u8 = trunc(am * 255) > round(tau * 255)  <=>  am * 255 >= limiar + 1
+        self._thr = (int(round(self.tau * 255)) + 1) / 255.0
+        self._kernel = (
+            cv2.getStructuringElement(cv2.MORPH_RECT, (morph_kernel, morph_kernel))
+            if morph_kernel >= 3 and morph_kernel % 2 == 1 and self.morph_iters > 0
+            else None
+        )
+
+        self._shape: Optional[Tuple[int, int]] = None
+        self.calls = 0
+        self.buffer_allocs = 0
+
+    # ===== buffers =====
+    def _ensure(self, h: int, w: int) -> None:
+        if self._shape == (h, w):
+            return
+        self._shape = (h, w)
+        self._map = np.empty((h, w), np.float32)
+        self._bin = np.empty((h, w), np.uint8)
+        self._tmp = np.empty((h, w), np.uint8)
+        self._labels = np.empty((h, w), np.int32)
+        self._comp = np.empty((h, w), np.bool_)
+        self._src = None  # origem do resize quando o mapa precisa de cópia
+        self.buffer_allocs += 1
+
+    def _src_buffer(self, sh: int, sw: int) -> np.ndarray:
+        if self._src is None or self._src.shape != (sh, sw):
+            self._src = np.empty((sh, sw), np.float32)
+            self.buffer_allocs += 1
+        return self._src
+
+    def _work_map(self, anomaly_map) -> np.ndarray:
+        sh, sw = (int(v) for v in anomaly_map.shape[-2:])
+        f = self.work_size / max(sh, sw) if self.work_size else 1.0
+        resize = f != 1.0
+        if resize:
+            self._ensure(max(1, round(sh * f)), max(1, round(sw * f)))
+        else:
+            self._ensure(sh, sw)
+
+        if hasattr(anomaly_map, "detach"):
+            import torch
+
+            t = anomaly_map.detach().reshape(sh, sw)
+            if t.device.type == "cpu" and t.dtype == torch.float32:
+                src = t.numpy()  # view, sem cópia
+            else:
+                # GPU / half: uma cópia (com conversão) direto para o buffer
+                src = self._src_buffer(sh, sw) if resize else self._map
+                torch.from_numpy(src).copy_(t)
+        else:
+            src = np.asarray(anomaly_map).reshape(sh, sw)
+
+        if resize:
+            if src.dtype != np.float32:
+                buf = self._src_buffer(sh, sw)
+                np.copyto(buf, src, casting="same_kind")
+                src = buf
+            cv2.resize(
+                src,
+                (self._shape[1], self._shape[0]),
+                dst=self._map,
+                interpolation=cv2.INTER_AREA if f < 1.0 else cv2.INTER_LINEAR,
+            )
+            src = self._map
+        np.clip(src, 0.0, 1.0, out=self._map)
+        return self._map
+
+    # ===== API =====
+    def regions(
+        self, anomaly_map, frame_shape: Optional[Tuple[int, ...]] = None
+    ) -> list[dict]:
+        """
+        Até top_k regiões, da melhor para a pior (contém o pico, depois média):
+        {"poly_norm", "score" (máximo), "mean", "area_frac", "contains_peak"}.
+        Sem região qualificada: 1 caixa em torno do pico.
+        """
+        self.calls += 1
+        H, W = (frame_shape or self.frame_shape)[:2]
+        am = self._work_map(anomaly_map)
+        h, w = am.shape
+
+        _, peak_val, _, maxLoc = cv2.minMaxLoc(am)
+
+        cv2.compare(am, self._thr, cv2.CMP_GE, dst=self._bin)
+        binary = self._bin
+        if self._kernel is not None:
+            cv2.morphologyEx(
+                binary,
+                cv2.MORPH_OPEN,
+                self._kernel,
+                dst=self._tmp,
+                iterations=self.morph_iters,
+            )
+            cv2.morphologyEx(
+                self._tmp,
+                cv2.MORPH_CLOSE,
+                self._kernel,
+                dst=binary,
+                iterations=self.morph_iters,
+            )
+
+        n, labels, stats, _ = cv2.connectedComponentsWithStats(
+            binary, labels=self._labels, connectivity=8, ltype=cv2.CV_32S
+        )
+        peak_label = int(labels[maxLoc[1], maxLoc[0]])
+        if peak_label == 0 and n > 1:
+            # a abertura apagou o pixel do pico (borda do componente): vale o
+            # pixel mais quente que sobrou na máscara
+            _, _, _, loc = cv2.minMaxLoc(am, mask=binary)
+            peak_label = int(labels[loc[1], loc[0]])
+        # máximo/média só dos candidatos (área da caixa), no recorte de cada um
+        cands = []
+        min_box = w * h * self.min_area_frac
+        for lbl in range(1, n):
+            x, y, bw, bh, area = (int(v) for v in stats[lbl])
+            if bw * bh < min_box:
+                continue
+            comp = self._component_mask(labels, x, y, bw, bh, lbl)
+            roi = am[y : y + bh, x : x + bw]
+            _, mx, _, _ = cv2.minMaxLoc(roi, mask=comp)
+            if mx < self.tau_strong:
+                continue
+            mean = cv2.mean(roi, mask=comp)[0]
+            cands.append((lbl == peak_label, mean, mx, area, lbl))
+        # contém o pico, depois a média (ordem decrescente)
+        cands.sort(key=lambda c: (c[0], c[1]), reverse=True)
+        ranked = cands[: self.top_k]
+
+        if not ranked:
+            return [
+                {
+                    "poly_norm": self._peak_box(maxLoc, h, w, H, W),
+                    "score": float(peak_val),
+                    "mean": float(peak_val),
+                    "area_frac": 0.0,
+                    "contains_peak": True,
+                }
+            ]
+
+        out = []
+        for is_peak, mean, mx, area, lbl in ranked:
+            out.append(
+                {
+                    "poly_norm": self._component_polygon(labels, stats[lbl], lbl, h, w),
+                    "score": float(mx),
+                    "mean": float(mean),
+                    "area_frac": area / (w * h),
+                    "contains_peak": is_peak,
+                }
+            )
+        return out
+
+    def __call__(
+        self, anomaly_map, frame_shape: Optional[Tuple[int, ...]] = None
+    ) -> list[list[float]]:
+        """Só o polígono da melhor região."""
+        return self.regions(anomaly_map, frame_shape)[0]["poly_norm"]
+
+    def _component_mask(
+        self, labels: np.ndarray, x: int, y: int, bw: int, bh: int, lbl: int
+    ) -> np.ndarray:
+        """Máscara uint8 do componente no recorte da caixa (view do buffer)."""
+        comp = self._comp[y : y + bh, x : x + bw]
+        np.equal(labels[y : y + bh, x : x + bw], lbl, out=comp)
+        return comp.view(np.uint8)
+
+    def _component_polygon(
+        self, labels: np.ndarray, stat: np.ndarray, lbl: int, h: int, w: int
+    ) -> list[list[float]]:
+        x, y, bw, bh = (int(v) for v in stat[:4])
+        # contorno só do recorte do componente
+        cnts, _ = cv2.findContours(
+            self._component_mask(labels, x, y, bw, bh, lbl),
+            cv2.RETR_EXTERNAL,
+            cv2.CHAIN_APPROX_SIMPLE,
+            offset=(x, y),
+        )
+        c = max(cnts, key=cv2.contourArea)
+        peri = cv2.arcLength(c, True)
+        eps = max(1.0, self.approx_eps_frac * peri)
+        approx = cv2.approxPolyDP(c, eps, True)
+        if approx is None or len(approx) < 3:
+            poly_px = np.array(
+                [[x, y], [x + bw - 1, y], [x + bw - 1, y + bh - 1], [x, y + bh - 1]],
+                dtype=np.int32,
+            )
+        else:
+            poly_px = approx.reshape(-1, 2)
+        return self._norm(poly_px, h, w)
+
+    @staticmethod
+    def _norm(poly_px: np.ndarray, h: int, w: int) -> list[list[float]]:
+        # centro do pixel de trabalho -> [0, 1]
+        pts = (poly_px.astype(np.float32) + 0.5) / np.array([w, h], dtype=np.float32)
+        pts = np.clip(pts, 0.0, 1.0)
+        return [[float(x), float(y)] for x, y in pts]
+
+    def _peak_box(self, maxLoc, h: int, w: int, H: int, W: int) -> list[list[float]]:
+        # caixa mínima (em pixels do frame) centrada no pico
+        px = int((maxLoc[0] + 0.5) * W / w)
+        py = int((maxLoc[1] + 0.5) * H / h)
+        size = max(self.min_box_px, int(round(min(H, W) * self.min_box_frac)))
+        x1 = max(0, min(px - size // 2, W - 1))
+        y1 = max(0, min(py - size // 2, H - 1))
+        x2 = max(x1 + 1, min(x1 + size, W))
+        y2 = max(y1 + 1, min(y1 + size, H))
+        box = np.array([[x1, y1], [x2, y1], [x2, y2], [x1, y2]], dtype=np.float32)
+        box /= np.array([W, H], dtype=np.float32)
+        return [[float(x), float(y)] for x, y in np.clip(box, 0.0, 1.0)]
+
+    def get_status(self) -> dict:
+        return {
+            "calls": self.calls,
+            "buffer_allocs": self.buffer_allocs,
+            "work_shape": self._shape,
+        }
+
+
+def _synthetic_map(size: int, n_blobs: int = 3, seed: int = 0) -> np.ndarray:
+    rng = np.random.default_rng(seed)
+    am = rng.random((size, size), dtype=np.float32) * 0.3
+    for _ in range(n_blobs):
+        cx, cy = rng.integers(0, size, 2)
+        r = int(rng.integers(size // 32 + 1, size // 8 + 2))
+        cv2.circle(am, (int(cx), int(cy)), r, float(rng.uniform(0.7, 1.0)), -1)
+    return cv2.GaussianBlur(am, (0, 0), max(1.0, size / 128))
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Benchmark do pós-processamento.")
+    ap.add_argument("--map", default=None, help=".npy com um mapa de anomalia")
+    ap.add_argument("--map-size", type=int, default=256, help="mapa sintético NxN")
+    ap.add_argument("--frame", default="2448x2048", help="LxA do frame")
+    ap.add_argument("--iters", type=int, default=500)
+    ap.add_argument("--work-size", type=int, default=0)
+    ap.add_argument("--tau", type=float, default=0.6)
+    ap.add_argument("--tau-strong", type=float, default=0.8)
+    ap.add_argument("--top-k", type=int, default=1)
+    args = ap.parse_args()
+
+    am = (
+        anomaly_map_to_numpy(np.load(args.map))
+        if args.map
+        else _synthetic_map(args.map_size)
+    )
+    fw, fh = (int(v) for v in args.frame.lower().split("x"))
+    pp = AnomalyPostprocessor(
+        frame_shape=(fh, fw),
+        tau=args.tau,
+        tau_strong=args.tau_strong,
+        work_size=args.work_size or None,
+        top_k=args.top_k,
+    )
+    regs = pp.regions(am)  # aquece (aloca os buffers)
+    scores = ", ".join(f"{r['score']:.2f}" for r in regs)
+    t0 = time.perf_counter()
+    for _ in range(args.iters):
+        pp.regions(am)
+    dt = (time.perf_counter() - t0) * 1000.0 / max(1, args.iters)
+    print(
+        f"mapa={am.shape} frame={fh}x{fw} work={pp.get_status()['work_shape']} "
+        f"| {dt:.3f} ms/mapa | {len(regs)} região(ões) "
+        f"({scores}) | buffers alocados={pp.buffer_allocs}"
+    )
+
+
+if __name__ == "__main__":
+    main()
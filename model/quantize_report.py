@@ -0,0 +1,142 @@
+# quantize_report.py
+# Mede o impacto da PTQ INT8 (utils.quantization) contra o fp32 em frames
+# held-out do dataset: drift do score do Patchcore, concordância de detecção,
+# similaridade do embedding do ResNetFeature e speedup do backbone.
+#
+# Uso:
+#   python -m model.quantize_report --ckpt model/.../model.ckpt --dataset dataset/teste1
+
+from __future__ import annotations
+
+import argparse
+import time
+from typing import Dict, List
+
+import numpy as np
+import torch
+
+from model.anomaly_runner import PatchcoreRunner
+from utils.feature_extractor import ResNetFeature
+from utils.logger import logger
+from utils.quantization import load_calibration_frames
+
+
+def _timed_scores(runner: PatchcoreRunner, frames: List[np.ndarray]):
+    scores, t0 = [], time.perf_counter()
+    for fr in frames:
+        scores.append(runner.predict(fr)["pred_score"])
+    ms = (time.perf_counter() - t0) * 1000.0 / max(1, len(frames))
+    return np.asarray(scores, dtype=np.float64), ms
+
+
+def _timed_backbone(runner: PatchcoreRunner, frames: List[np.ndarray]) -> float:
+    t0 = time.perf_counter()
+    for fr in frames:
+        runner.extract_features([fr])
+    return (time.perf_counter() - t0) * 1000.0 / max(1, len(frames))
+
+
+def _timed_embeddings(extractor: ResNetFeature, frames: List[np.ndarray]):
+    poly = [[0.25, 0.25], [0.75, 0.25], [0.75, 0.75], [0.25, 0.75]]
+    embs, t0 = [], time.perf_counter()
+    for fr in frames:
+        embs.append(extractor.region_embedding(fr, poly))
+    ms = (time.perf_counter() - t0) * 1000.0 / max(1, len(frames))
+    return np.stack(embs, axis=0), ms
+
+
+def quantization_report(
+    ckpt_path: str,
+    dataset_dir: str,
+    max_frames: int = 64,
+    detect_threshold: float = 0.8,
+    include_resnet: bool = True,
+) -> Dict:
+    """Compara fp32 x INT8 nos frames held-out; retorna e loga as métricas."""
+    torch.set_grad_enabled(False)
+    calib, holdout = load_calibration_frames(dataset_dir, max_frames=max_frames)
+    if not holdout:
+        raise RuntimeError("Frames insuficientes para separar held-out.")
+
+    fp32 = PatchcoreRunner(ckpt_path, device="cpu")
+    int8 = PatchcoreRunner(ckpt_path, device="cpu", quantize=True, calib_frames=calib)
+    if not int8.quantized:
+        raise RuntimeError("Quantização do backbone do Patchcore falhou (ver log).")
+    for r in (fp32, int8):
+        r.warmup()
+
+    s32, ms32 = _timed_scores(fp32, holdout)
+    s8, ms8 = _timed_scores(int8, holdout)
+    bb32 = _timed_backbone(fp32, holdout)
+    bb8 = _timed_backbone(int8, holdout)
+    diff = np.abs(s8 - s32)
+
+    report: Dict = {
+        "n_calib": len(calib),
+        "n_holdout": len(holdout),
+        "score_abs_drift_mean": float(diff.mean()),
+        "score_abs_drift_max": float(diff.max()),
+        "score_corr": (float(np.corrcoef(s32, s8)[0, 1]) if len(holdout) > 1 else None),
+        "detect_agreement": float(
+            ((s32 >= detect_threshold) == (s8 >= detect_threshold)).mean()
+        ),
+        "patchcore_ms_fp32": ms32,
+        "patchcore_ms_int8": ms8,
+        "backbone_ms_fp32": bb32,
+        "backbone_ms_int8": bb8,
+        "backbone_speedup": bb32 / max(bb8, 1e-6),
+    }
+
+    if include_resnet:
+        rf32 = ResNetFeature(device="cpu")
+        rf8 = ResNetFeature(device="cpu", quantize=True, calib_frames=calib)
+        e32, ems32 = _timed_embeddings(rf32, holdout)
+        e8, ems8 = _timed_embeddings(rf8, holdout)
+        cos = (e32 * e8).sum(1) / (
+            np.linalg.norm(e32, axis=1) * np.linalg.norm(e8, axis=1) + 1e-12
+        )
+        report.update(
+            {
+                "resnet_cosine_mean": float(cos.mean()),
+                "resnet_cosine_min": float(cos.min()),
+                "resnet_ms_fp32": ems32,
+                "resnet_ms_int8": ems8,
+                "resnet_speedup": ems32 / max(ems8, 1e-6),
+            }
+        )
+
+    logger.info(
+        f"[quant] held-out={report['n_holdout']} | drift médio={report['score_abs_drift_mean']:.4f} "
+        f"máx={report['score_abs_drift_max']:.4f} | concordância@{detect_threshold}="
+        f"{report['detect_agreement']:.2%} | backbone {bb32:.1f}ms -> {bb8:.1f}ms "
+        f"({report['backbone_speedup']:.2f}x)"
+    )
+    if include_resnet:
+        logger.info(
+            f"[quant] ResNetFeature cos médio={report['resnet_cosine_mean']:.4f} "
+            f"mín={report['resnet_cosine_min']:.4f} | {report['resnet_ms_fp32']:.1f}ms -> "
+            f"{report['resnet_ms_int8']:.1f}ms ({report['resnet_speedup']:.2f}x)"
+        )
+    return report
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Drift/speedup da PTQ INT8 vs fp32.")
+    ap.add_argument("--ckpt", required=True, help="model.ckpt do Patchcore")
+    ap.add_argument("--dataset", required=True, help="pasta de frames (create_dataset)")
+    ap.add_argument("--max-frames", type=int, default=64)
+    ap.add_argument("--threshold", type=float, default=0.8)
+    ap.add_argument("--skip-resnet", action="store_true")
+    args = ap.parse_args()
+
+    quantization_report(
+        args.ckpt,
+        args.dataset,
+        max_frames=args.max_frames,
+        detect_threshold=args.threshold,
+        include_resnet=not args.skip_resnet,
+    )
+
+
+if __name__ == "__main__":
+    main()
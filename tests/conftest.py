@@ -0,0 +1,9 @@
+# conftest.py
+# Testes unitários das partes sem câmera/GPU (anel shm, ModelServer,
+# pós-processamento). A raiz do repositório entra no sys.path para que
+# `pytest` funcione de qualquer diretório.
+
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,51 @@
+# test_change_gate.py
+# ChangeGate: frame igual é pulado, mudança ou intervalo forçado re-pontua.
+
+import pytest
+
+np = pytest.importorskip("numpy")
+pytest.importorskip("cv2")
+
+from utils.change_gate import ChangeGate  # noqa: E402
+
+
+def _scene(v: int = 60) -> np.ndarray:
+    frame = np.full((240, 320, 3), v, dtype=np.uint8)
+    frame[60:120, 80:160] = 200
+    return frame
+
+
+@pytest.mark.parametrize("method", ["diff", "dhash"])
+def test_unchanged_frame_is_skipped(method):
+    gate = ChangeGate(method=method, force_interval_sec=60.0)
+    assert gate.check(_scene())  # 1º frame vira a referência
+    assert not gate.check(_scene())
+    assert gate.get_status()["skipped"] == 1
+
+
+@pytest.mark.parametrize("method", ["diff", "dhash"])
+def test_changed_frame_is_scored_and_becomes_reference(method):
+    gate = ChangeGate(method=method, force_interval_sec=60.0)
+    gate.check(_scene())
+    moved = _scene()
+    moved[150:230, 200:300] = 255
+    assert gate.check(moved)
+    assert not gate.check(moved.copy())
+
+
+def test_force_interval_rescores_static_scene(monkeypatch):
+    now = [100.0]
+    monkeypatch.setattr("utils.change_gate.time.monotonic", lambda: now[0])
+    gate = ChangeGate(force_interval_sec=2.0)
+    assert gate.check(_scene())
+    now[0] += 1.0
+    assert not gate.check(_scene())
+    now[0] += 1.5
+    assert gate.check(_scene())
+
+
+def test_reset_forces_next_check():
+    gate = ChangeGate(force_interval_sec=60.0)
+    gate.check(_scene())
+    gate.reset()
+    assert gate.check(_scene())
@@ -0,0 +1,25 @@
+# test_knn_search.py
+# ChunkedExactSearch devolve os mesmos vizinhos que a busca exata (recall 1),
+# inclusive com blocos menores que k e memory bank que não divide o bloco.
+
+import pytest
+
+torch = pytest.importorskip("torch")
+pytest.importorskip("cv2")
+
+from model.knn_search import ChunkedExactSearch, ExactSearch  # noqa: E402
+
+
+@pytest.mark.parametrize("n_neighbors", [1, 3])
+@pytest.mark.parametrize("chunk_size", [2, 7, 64, 1000])
+def test_chunked_matches_exact(n_neighbors, chunk_size):
+    gen = torch.Generator().manual_seed(0)
+    bank = torch.randn(203, 16, generator=gen)
+    query = torch.randn(31, 16, generator=gen)
+
+    d_ref, i_ref = ExactSearch(bank).search(query, n_neighbors)
+    d, i = ChunkedExactSearch(bank, chunk_size=chunk_size).search(query, n_neighbors)
+
+    assert d.shape == d_ref.shape and i.shape == i_ref.shape
+    torch.testing.assert_close(d, d_ref)
+    assert torch.equal(i, i_ref)
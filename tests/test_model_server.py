@@ -0,0 +1,124 @@
+# test_model_server.py
+# Semântica das filas do ModelServer sem carregar modelos: 1 frame pendente
+# por PO (o novo substitui e cancela o antigo), micro-batching entre POs do
+# mesmo checkpoint e entrega dos resultados pelo worker.
+
+from concurrent.futures import CancelledError
+
+import pytest
+
+np = pytest.importorskip("numpy")
+pytest.importorskip("torch")
+pytest.importorskip("torchvision")
+pytest.importorskip("joblib")
+pytest.importorskip("cv2")
+
+from model.model_server import ModelServer  # noqa: E402
+
+
+class _FakeRunner:
+    def __init__(self):
+        self.batches = []
+
+    def predict_batch(self, frames):
+        self.batches.append(len(frames))
+        return [{"pred_score": float(f[0, 0, 0])} for f in frames]
+
+
+def _server(**kwargs):
+    server = ModelServer(device="cpu", **kwargs)
+    runner = _FakeRunner()
+    server.get_runner = lambda ckpt_path: runner
+    return server, runner
+
+
+def _frame(v: int) -> np.ndarray:
+    return np.full((2, 2, 3), v, dtype=np.uint8)
+
+
+def test_submit_replaces_pending_frame_of_same_po():
+    server, _ = _server()
+    old = server.submit(1, "a", _frame(1))
+    new = server.submit(1, "a", _frame(2))
+
+    assert old.cancelled()
+    with pytest.raises(CancelledError):
+        old.result(timeout=0)
+    assert not new.done()
+    status = server.get_status()
+    assert status["replaced"] == {1: 1}
+    assert status["pending"] == {1: 1}
+
+
+def test_submit_does_not_touch_other_pos():
+    server, _ = _server()
+    a = server.submit(1, "a", _frame(1))
+    b = server.submit(2, "a", _frame(2))
+    assert not a.cancelled() and not b.cancelled()
+    assert server.get_status()["pending"] == {1: 1, 2: 1}
+
+
+def test_next_batch_groups_pos_of_same_checkpoint():
+    server, _ = _server(max_batch=4, max_wait_ms=0)
+    for po in (1, 2, 3):
+        server.submit(po, "a", _frame(po))
+    server.submit(4, "b", _frame(4))
+
+    batch = server._next_batch()
+    assert [it[0] for it in batch] == [1, 2, 3]
+    assert {it[1] for it in batch} == {"a"}
+    assert [it[0] for it in server._next_batch()] == [4]
+
+
+def test_next_batch_respects_max_batch_in_round_robin_order():
+    server, _ = _server(max_batch=2, max_wait_ms=0)
+    for po in (1, 2, 3):
+        server.submit(po, "a", _frame(po))
+
+    assert [it[0] for it in server._next_batch()] == [1, 2]
+    assert [it[0] for it in server._next_batch()] == [3]
+
+
+def test_run_serves_concurrent_pos_in_one_forward():
+    server, runner = _server(max_batch=4, max_wait_ms=50)
+    futs = [server.submit(po, "a", _frame(po)) for po in (1, 2, 3)]
+    server.start()
+    try:
+        results = [f.result(timeout=5.0) for f in futs]
+    finally:
+        server.stop()
+
+    assert [r["pred_score"] for r in results] == [1.0, 2.0, 3.0]
+    assert all(r["batch_size"] == 3 for r in results)
+    assert runner.batches == [3]
+    assert server.get_status()["served"] == {1: 1, 2: 1, 3: 1}
+
+
+def test_run_skips_replaced_frame_and_serves_newest():
+    server, runner = _server(max_batch=1)
+    old = server.submit(1, "a", _frame(1))
+    new = server.submit(1, "a", _frame(2))
+    server.start()
+    try:
+        assert new.result(timeout=5.0)["pred_score"] == 2.0
+    finally:
+        server.stop()
+    assert old.cancelled()
+    assert runner.batches == [1]
+
+
+def test_runner_error_is_delivered_to_every_future_of_the_batch():
+    server, runner = _server(max_batch=2, max_wait_ms=50)
+
+    def boom(frames):
+        raise RuntimeError("falhou")
+
+    runner.predict_batch = boom
+    futs = [server.submit(po, "a", _frame(po)) for po in (1, 2)]
+    server.start()
+    try:
+        for f in futs:
+            with pytest.raises(RuntimeError, match="falhou"):
+                f.result(timeout=5.0)
+    finally:
+        server.stop()
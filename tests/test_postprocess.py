@@ -0,0 +1,109 @@
+# test_postprocess.py
+# AnomalyPostprocessor: limiar equivalente à regra uint8 de antes, seleção e
+# ranqueamento das regiões, fallback da caixa no pico e reaproveitamento dos
+# buffers (só alocam quando o tamanho do mapa muda).
+
+import pytest
+
+np = pytest.importorskip("numpy")
+cv2 = pytest.importorskip("cv2")
+
+from model.postprocess import AnomalyPostprocessor  # noqa: E402
+
+
+def _blob_map(size=64, center=(40, 20), r=6, peak=0.95, base=0.1) -> np.ndarray:
+    am = np.full((size, size), base, dtype=np.float32)
+    cv2.circle(am, center, r, peak, -1)
+    return am
+
+
+def _bbox(poly):
+    xs = [p[0] for p in poly]
+    ys = [p[1] for p in poly]
+    return min(xs), min(ys), max(xs), max(ys)
+
+
+@pytest.mark.parametrize("tau", [0.3, 0.5, 0.6, 0.8, 0.95])
+def test_threshold_matches_uint8_rule(tau):
+    # regra antiga: (am * 255).astype(uint8) > round(tau * 255)
+    rng = np.random.default_rng(0)
+    levels = (np.arange(255, dtype=np.float32) + 0.5) / 255.0  # meio de cada degrau
+    am = np.concatenate([rng.random(50_000, dtype=np.float32), levels])[None, :]
+
+    pp = AnomalyPostprocessor(tau=tau)
+    got = cv2.compare(am, pp._thr, cv2.CMP_GE) > 0
+    want = (am * 255).astype(np.uint8) > int(round(tau * 255))
+    np.testing.assert_array_equal(got, want)
+
+
+def test_single_blob_polygon_covers_it():
+    pp = AnomalyPostprocessor(frame_shape=(640, 640))
+    regs = pp.regions(_blob_map())
+
+    assert len(regs) == 1
+    reg = regs[0]
+    assert reg["contains_peak"] is True
+    assert reg["score"] == pytest.approx(0.95)
+    assert 0.0 < reg["area_frac"] < 0.05
+    x0, y0, x1, y1 = _bbox(reg["poly_norm"])
+    assert x0 <= 40 / 64 <= x1 and y0 <= 20 / 64 <= y1
+    assert pp(_blob_map()) == reg["poly_norm"]
+
+
+def test_top_k_ranks_the_peak_region_first():
+    am = _blob_map()
+    cv2.circle(am, (12, 48), 6, 0.85, -1)
+
+    regs = AnomalyPostprocessor(top_k=2).regions(am, (64, 64))
+    assert len(regs) == 2
+    assert regs[0]["contains_peak"] and regs[0]["score"] == pytest.approx(0.95)
+    assert not regs[1]["contains_peak"]
+    assert regs[1]["score"] == pytest.approx(0.85)
+    x0, y0, x1, y1 = _bbox(regs[1]["poly_norm"])
+    assert x0 <= 12 / 64 <= x1 and y0 <= 48 / 64 <= y1
+
+
+def test_weak_region_falls_back_to_box_around_peak():
+    # passa por tau, mas o máximo fica abaixo de tau_strong
+    am = _blob_map(peak=0.7)
+    pp = AnomalyPostprocessor(tau=0.6, tau_strong=0.8, min_box_px=32)
+
+    (reg,) = pp.regions(am, (640, 640))
+    assert reg["area_frac"] == 0.0
+    assert reg["score"] == pytest.approx(0.7)
+    x0, y0, x1, y1 = _bbox(reg["poly_norm"])
+    size = max(32, round(640 * pp.min_box_frac)) / 640
+    assert x1 - x0 == pytest.approx(size, abs=1e-6)
+    assert y1 - y0 == pytest.approx(size, abs=1e-6)
+
+
+def test_buffers_are_reused_until_the_map_size_changes():
+    pp = AnomalyPostprocessor(frame_shape=(64, 64))
+    am = _blob_map()
+    for _ in range(5):
+        pp.regions(am)
+    assert pp.buffer_allocs == 1
+
+    pp.regions(np.zeros((32, 32), dtype=np.float32))
+    assert pp.buffer_allocs == 2
+    assert pp.get_status()["work_shape"] == (32, 32)
+
+
+def test_work_size_resizes_float64_maps():
+    pp = AnomalyPostprocessor(work_size=32)
+    (reg,) = pp.regions(_blob_map().astype(np.float64), (64, 64))
+
+    assert pp.get_status()["work_shape"] == (32, 32)
+    x0, y0, x1, y1 = _bbox(reg["poly_norm"])
+    assert x0 <= 40 / 64 <= x1 and y0 <= 20 / 64 <= y1
+
+
+def test_tensor_input_matches_ndarray():
+    torch = pytest.importorskip("torch")
+    am = _blob_map()
+    want = AnomalyPostprocessor().regions(am, (64, 64))
+
+    for t in (torch.from_numpy(am)[None], torch.from_numpy(am).double()):
+        got = AnomalyPostprocessor().regions(t, (64, 64))
+        assert got[0]["poly_norm"] == want[0]["poly_norm"]
+        assert got[0]["score"] == pytest.approx(want[0]["score"])
@@ -0,0 +1,169 @@
+# test_shm_ring.py
+# Anel de frames em shared memory: cópia, seqlock (slot sobrescrito / escrita
+# em curso), anexar pelo nome, recriação do anel e o leitor do lado da
+# inferência. O canal usa fila/evento de threading (determinístico).
+
+import queue
+import threading
+from types import SimpleNamespace
+
+import pytest
+
+np = pytest.importorskip("numpy")
+pytest.importorskip("cv2")
+
+from utils.shm_ring import (  # noqa: E402
+    ShmChannel,
+    ShmFramePublisher,
+    ShmFrameReader,
+    ShmFrameRing,
+)
+
+_THREAD_CTX = SimpleNamespace(Queue=queue.Queue, Event=threading.Event)
+
+
+@pytest.fixture
+def ring():
+    r = ShmFrameRing(n_slots=3, slot_bytes=64)
+    yield r
+    r.close(unlink=True)
+
+
+def _frame(v: int = 0) -> np.ndarray:
+    return (np.arange(12, dtype=np.uint8).reshape(3, 4) + v).astype(np.uint8)
+
+
+def _desc(ring: ShmFrameRing, seq: int, frame: np.ndarray) -> tuple:
+    return (
+        ring.name,
+        ring.n_slots,
+        ring.slot_bytes,
+        seq % ring.n_slots,
+        seq,
+        0.0,
+        frame.shape,
+        frame.dtype.str,
+        None,
+    )
+
+
+def test_write_read_roundtrip_returns_a_copy(ring):
+    f = _frame()
+    slot = ring.write(f, seq=5)
+    assert slot == 5 % ring.n_slots
+
+    out = ring.read(slot, 5, f.shape, f.dtype.str)
+    np.testing.assert_array_equal(out, f)
+    out[0, 0] = 99
+    np.testing.assert_array_equal(ring.read(slot, 5, f.shape, f.dtype.str), f)
+
+
+def test_read_rejects_slot_overwritten_by_newer_seq(ring):
+    f = _frame()
+    ring.write(f, 0)
+    ring.write(_frame(1), ring.n_slots)  # mesma posição, volta seguinte
+
+    assert ring.read(0, 0, f.shape, f.dtype.str) is None
+    np.testing.assert_array_equal(
+        ring.read(0, ring.n_slots, f.shape, f.dtype.str), _frame(1)
+    )
+
+
+def test_read_rejects_slot_being_written(ring):
+    f = _frame()
+    ring.write(f, 1)
+    ring.seqs[1] = -1  # escritor no meio da cópia
+    assert ring.read(1, 1, f.shape, f.dtype.str) is None
+
+
+def test_torn_read_when_writer_laps_during_copy(ring, monkeypatch):
+    f = _frame()
+    ring.write(f, 0)
+
+    orig_view = ring._view
+    lapped = []
+
+    def view(slot, shape, dtype):
+        v = orig_view(slot, shape, dtype)
+        if not lapped:
+            # o escritor dá a volta entre a 1ª checagem do seq e a cópia
+            lapped.append(True)
+            ring.write(_frame(1), ring.n_slots)
+        return v
+
+    monkeypatch.setattr(ring, "_view", view)
+    assert ring.read(0, 0, f.shape, f.dtype.str) is None
+
+
+def test_read_rejects_frame_larger_than_slot(ring):
+    ring.write(_frame(), 0)
+    assert ring.read(0, 0, (ring.slot_bytes + 1,), "|u1") is None
+
+
+def test_attach_by_name_sees_writer_frames(ring):
+    f = _frame(3)
+    ring.write(f, 1)
+    other = ShmFrameRing.attach(ring.name, ring.n_slots, ring.slot_bytes)
+    try:
+        np.testing.assert_array_equal(other.read(1, 1, f.shape, f.dtype.str), f)
+    finally:
+        other.close()
+
+
+def test_publisher_recreates_ring_only_when_frame_grows():
+    channel = ShmChannel(_THREAD_CTX, po=7)
+    pub = ShmFramePublisher(stream=None, channel=channel, n_slots=2)
+    r1 = pub._ensure_ring(64)
+    name1 = r1.name
+    assert pub._ensure_ring(32) is r1
+
+    r2 = pub._ensure_ring(128)
+    try:
+        assert r2.name != name1
+        assert r2.slot_bytes == 128
+        # o anel antigo foi removido: leitores reanexam pelo nome novo
+        with pytest.raises(FileNotFoundError):
+            ShmFrameRing.attach(name1, 2, 64)
+    finally:
+        r2.close(unlink=True)
+
+
+def test_channel_publish_drops_oldest_when_full():
+    channel = ShmChannel(_THREAD_CTX, po=1, max_queue=2)
+    for i in range(3):
+        assert channel.publish(("d", i))
+    assert [channel.descs.get_nowait()[1] for _ in range(2)] == [1, 2]
+
+
+def test_reader_keeps_newest_descriptor(ring):
+    channel = ShmChannel(_THREAD_CTX, po=1, max_queue=4)
+    reader = ShmFrameReader(channel)
+    for seq in (0, 1):
+        ring.write(_frame(seq), seq)
+        channel.publish(_desc(ring, seq, _frame(seq)))
+
+    rec = reader.read_record(timeout=0.5)
+    try:
+        assert rec.seq == 1
+        np.testing.assert_array_equal(rec.frame, _frame(1))
+        assert reader.stale == 1
+        assert reader.read_frames == 1
+    finally:
+        reader.stop()
+
+
+def test_reader_counts_torn_frames_and_keeps_last_record(ring):
+    channel = ShmChannel(_THREAD_CTX, po=1, max_queue=4)
+    reader = ShmFrameReader(channel)
+    ring.write(_frame(0), 0)
+    channel.publish(_desc(ring, 0, _frame(0)))
+    first = reader.read_record(timeout=0.5)
+
+    ring.write(_frame(1), 1)
+    channel.publish(_desc(ring, 1, _frame(1)))
+    ring.write(_frame(2), 1 + ring.n_slots)  # sobrescreve antes da leitura
+    try:
+        assert reader.read_record(timeout=0.5) is first
+        assert reader.torn == 1
+    finally:
+        reader.stop()
@@ -97,6 +97,16 @@ class ApiController:
         except Exception:
             return False
 
+    @staticmethod
+    def _is_success_status(status: int) -> bool:
+        return 200 <= int(status) < 300
+
+    @staticmethod
+    def is_retryable_status(status: int) -> bool:
+        """Vale reenviar depois: rede (599/0), 5xx, 429, 408, 401."""
+        status = int(status)
+        return status in (0, 401, 408, 429) or status >= 500
+
     # -------- auth --------
     def authenticate(self):
         with self._auth_lock:
@@ -206,14 +216,18 @@ class ApiController:
 
     # -------- APIs públicas --------
     def post_event(self, payload: list[dict]) -> bool:
+        return self._is_success_status(self.post_event_status(payload))
+
+    def post_event_status(self, payload: list[dict]) -> int:
+        """Como post_event, mas retorna o status HTTP (599 = falha de rede)."""
         r = self._request("POST", "/Coletor", json=payload)
         if self._is_success(r):
             logger.info(f"Evento enviado com sucesso: {getattr(r, 'text', '')}")
-            return True
-        logger.error(
-            f"Falha ao enviar evento ({getattr(r, 'status_code', '???')}): {getattr(r, 'text', '')}"
-        )
-        return False
+        else:
+            logger.error(
+                f"Falha ao enviar evento ({getattr(r, 'status_code', '???')}): {getattr(r, 'text', '')}"
+            )
+        return int(getattr(r, "status_code", 0) or 0)
 
     def get_state(self, id_po: int) -> bool:
         r = self._request(
@@ -240,6 +254,10 @@ class ApiController:
         Envia frame para /anomalias/upload.
         Sucesso = qualquer 2xx. Em caso de 201, loga o Location.
         """
+        return self._is_success_status(self.send_frame_status(files, data))
+
+    def send_frame_status(self, files, data) -> int:
+        """Como send_frame, mas retorna o status HTTP (599 = falha de rede)."""
         r = self._request(
             "POST", "/anomalias/upload", data=data, files=files, allow_retry_post=True
         )
@@ -259,11 +277,11 @@ class ApiController:
                 logger.info(
                     f"Imagem enviada com sucesso [{r.status_code}]{loc}: {getattr(r, 'text', '')}"
                 )
-            return True
-        logger.error(
-            f"Falha ao enviar imagem ({getattr(r, 'status_code', '???')}): {getattr(r, 'text', '')}"
-        )
-        return False
+        else:
+            logger.error(
+                f"Falha ao enviar imagem ({getattr(r, 'status_code', '???')}): {getattr(r, 'text', '')}"
+            )
+        return int(getattr(r, "status_code", 0) or 0)
 
     # --- paginação ---
     def list_images_page(
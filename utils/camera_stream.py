@@ -1,17 +1,30 @@
 # unified_stream.py
 # coding: utf-8
-import time, queue, threading, random, ctypes, platform
+import time, queue, threading, random, ctypes, platform, sys, os
 from typing import Optional, Tuple, Union
 import numpy as np
 
 # OpenCV é comum aos dois backends
 import cv2
 
+from utils.logger import logger
+
 try:
-    cv2.setNumThreads(1)  # ajuda no jitter em máquinas fracas
+    # ajuda no jitter em máquinas fracas; vale para as funções do OpenCV, não
+    # para o decode do FFmpeg (por captura: decode_threads do _OpenCVBackend)
+    cv2.setNumThreads(1)
 except Exception:
     pass
 
+# OPENCV_FFMPEG_CAPTURE_OPTIONS é global ao processo: troca/restaura sob lock
+_FFMPEG_OPTS_LOCK = threading.Lock()
+_HW_ACCEL = {
+    "any": "VIDEO_ACCELERATION_ANY",
+    "d3d11": "VIDEO_ACCELERATION_D3D11",
+    "vaapi": "VIDEO_ACCELERATION_VAAPI",
+    "mfx": "VIDEO_ACCELERATION_MFX",
+}
+
 # mvsdk é opcional; só importaremos quando necessário
 _HAS_MVSDK = False
 try:
@@ -22,11 +35,45 @@ except Exception:
     _HAS_MVSDK = False
 
 
+class CameraConfigError(RuntimeError):
+    """Configuração rejeitada pela câmera (ROI, binning, trigger): reconectar não resolve."""
+
+
+class FrameRecord:
+    """
+    Frame + metadados de captura (o que o buffer do stream carrega).
+
+    seq: contador do stream (lacunas = frames descartados antes do consumidor)
+    ts: time.monotonic() na chegada do frame ao host
+    head: cabeçalho da fonte (tSdkFrameHead no mvsdk; None no OpenCV)
+    """
+
+    __slots__ = ("frame", "seq", "ts", "head")
+
+    def __init__(self, frame: np.ndarray, seq: int, ts: float, head=None):
+        self.frame = frame
+        self.seq = seq
+        self.ts = ts
+        self.head = head
+
+    def copy(self) -> "FrameRecord":
+        return FrameRecord(self.frame.copy(), self.seq, self.ts, self.head)
+
+    @property
+    def age_ms(self) -> float:
+        return (time.monotonic() - self.ts) * 1000.0
+
+
 class _BaseBackend:
     """Contrato mínimo para backends de captura."""
 
     name: str = "Unknown"
     is_connected: bool = False
+    trigger_mode: str = "continuous"
+    supports_skip: bool = False  # grab_raw()/retrieve() separados
+    # metadados do último frame do grab() (monotonic na chegada, cabeçalho)
+    last_ts: float = 0.0
+    last_head = None
 
     def connect(self) -> bool:
         raise NotImplementedError
@@ -38,20 +85,97 @@ class _BaseBackend:
     def close(self) -> None:
         raise NotImplementedError
 
+    def soft_trigger(self) -> bool:
+        """Dispara 1 frame (trigger por software). False se não suportado."""
+        return False
+
+    def get_stats(self) -> dict:
+        """Métricas específicas do backend (entram em get_status())."""
+        return {}
+
 
 # -----------------------
 # Backend OpenCV (video/rtsp/usb genérico)
 # -----------------------
 class _OpenCVBackend(_BaseBackend):
-    def __init__(self, source: Union[str, int]):
+    """
+    decode_threads: threads de decodificação do FFmpeg desta captura
+      (CAP_PROP_N_THREADS), independente do cv2.setNumThreads global.
+    hw_accel: "any" | "d3d11" | "vaapi" | "mfx" (CAP_PROP_HW_ACCELERATION).
+    decode_size (w,h): pede a resolução ao dispositivo (USB) e, se o frame
+      ainda vier maior, reduz com INTER_AREA no retrieve().
+    lowres: 1..3 -> opção "lowres" do decoder FFmpeg (decodifica a 1/2^n;
+      só codecs que suportam, ex. MJPEG). O VideoCapture não expõe o filtro
+      scale do FFmpeg, então este é o caminho de decode reduzido disponível.
+
+    grab_raw()/retrieve(): grab sem decodificar/converter (descartar frames
+    custa pouco) e retrieve só para o frame que será entregue.
+    """
+
+    supports_skip = True
+
+    def __init__(
+        self,
+        source: Union[str, int],
+        decode_threads: Optional[int] = None,
+        hw_accel: Optional[str] = None,
+        decode_size: Optional[Tuple[int, int]] = None,
+        lowres: int = 0,
+    ):
         super().__init__()
         self.source = source
         self.cap: Optional[cv2.VideoCapture] = None
         self.name = f"OpenCV:{source}"
+        self.decode_threads = decode_threads
+        self.hw_accel = hw_accel.lower() if hw_accel else None
+        if self.hw_accel is not None and self.hw_accel not in _HW_ACCEL:
+            raise ValueError(f"hw_accel deve ser um de {tuple(_HW_ACCEL)}")
+        self.decode_size = tuple(int(v) for v in decode_size) if decode_size else None
+        self.lowres = max(0, min(3, int(lowres)))
+
+    def _open_params(self) -> list:
+        params = []
+        if self.decode_threads and hasattr(cv2, "CAP_PROP_N_THREADS"):
+            params += [cv2.CAP_PROP_N_THREADS, int(self.decode_threads)]
+        if self.hw_accel and hasattr(cv2, "CAP_PROP_HW_ACCELERATION"):
+            accel = getattr(cv2, _HW_ACCEL[self.hw_accel], None)
+            if accel is not None:
+                params += [cv2.CAP_PROP_HW_ACCELERATION, accel]
+        return params
+
+    def _open(self) -> Optional[cv2.VideoCapture]:
+        params = self._open_params()
+        is_device = isinstance(self.source, int)
+        # opções do FFmpeg via env: lidas no open, então trocadas sob lock
+        ffmpeg_opts = (
+            "lowres;%d" % self.lowres if self.lowres and not is_device else None
+        )
+        with _FFMPEG_OPTS_LOCK:
+            old = os.environ.get("OPENCV_FFMPEG_CAPTURE_OPTIONS")
+            if ffmpeg_opts:
+                os.environ["OPENCV_FFMPEG_CAPTURE_OPTIONS"] = ffmpeg_opts
+            try:
+                cap = None
+                if params:
+                    api = cv2.CAP_ANY if is_device else cv2.CAP_FFMPEG
+                    try:
+                        cap = cv2.VideoCapture(self.source, api, params)
+                    except Exception:
+                        cap = None
+                if cap is None or not cap.isOpened():
+                    # OpenCV antigo/backend sem suporte aos params: abre simples
+                    cap = cv2.VideoCapture(self.source)
+            finally:
+                if ffmpeg_opts:
+                    if old is None:
+                        os.environ.pop("OPENCV_FFMPEG_CAPTURE_OPTIONS", None)
+                    else:
+                        os.environ["OPENCV_FFMPEG_CAPTURE_OPTIONS"] = old
+        return cap
 
     def connect(self) -> bool:
         self.close()
-        cap = cv2.VideoCapture(self.source)
+        cap = self._open()
         if not cap or not cap.isOpened():
             self.is_connected = False
             return False
@@ -66,20 +190,46 @@ class _OpenCVBackend(_BaseBackend):
             cap.set(cv2.CAP_PROP_READ_TIMEOUT_MSEC, 3000)
         except Exception:
             pass
+        if self.decode_size and isinstance(self.source, int):
+            try:
+                cap.set(cv2.CAP_PROP_FRAME_WIDTH, self.decode_size[0])
+                cap.set(cv2.CAP_PROP_FRAME_HEIGHT, self.decode_size[1])
+            except Exception:
+                pass
 
         self.cap = cap
         self.is_connected = True
         return True
 
-    def grab(self) -> Optional[np.ndarray]:
+    def grab_raw(self) -> bool:
+        """Avança 1 frame sem decodificar/converter (cap.grab)."""
+        if not self.cap:
+            return False
+        if not self.cap.grab():
+            # sinalizar perda de conexão; quem chama decide reconectar
+            self.is_connected = False
+            return False
+        self.last_ts = time.monotonic()
+        return True
+
+    def retrieve(self) -> Optional[np.ndarray]:
+        """Decodifica/converte o frame do último grab_raw()."""
         if not self.cap:
             return None
-        ok, frame = self.cap.read()
+        ok, frame = self.cap.retrieve()
         if not ok or frame is None:
-            # sinalizar perda de conexão; quem chama decide reconectar
             self.is_connected = False
             return None
-        return frame  # já é ndarray
+        if self.decode_size is not None:
+            w, h = self.decode_size
+            if frame.shape[1] > w or frame.shape[0] > h:
+                frame = cv2.resize(frame, (w, h), interpolation=cv2.INTER_AREA)
+        return frame
+
+    def grab(self) -> Optional[np.ndarray]:
+        if not self.grab_raw():
+            return None
+        return self.retrieve()
 
     def close(self) -> None:
         try:
@@ -91,16 +241,123 @@ class _OpenCVBackend(_BaseBackend):
             self.cap = None
             self.is_connected = False
 
+    @property
+    def is_file(self) -> bool:
+        return isinstance(self.source, str) and os.path.isfile(self.source)
+
+    def native_fps(self) -> float:
+        try:
+            fps = float(self.cap.get(cv2.CAP_PROP_FPS)) if self.cap else 0.0
+        except Exception:
+            fps = 0.0
+        return fps if 0.0 < fps < 1000.0 else 0.0
+
+    def get_stats(self) -> dict:
+        return {
+            "decode_threads": self.decode_threads,
+            "hw_accel": self.hw_accel,
+            "decode_size": self.decode_size,
+        }
+
+
+# -----------------------
+# Anel de buffers alinhados (mvsdk): o ISP escreve direto no slot e o frame
+# sai como view numpy, sem alocação/cópia por frame
+# -----------------------
+class _RingSlot:
+    __slots__ = ("ptr", "arr", "idle_refs")
+
+    def __init__(self, size: int):
+        self.ptr = mvsdk.CameraAlignMalloc(size, 16)
+        cbuf = (ctypes.c_ubyte * size).from_address(self.ptr)
+        # views (e views de views) do numpy apontam .base para este array
+        self.arr = np.frombuffer(cbuf, dtype=np.uint8)
+        self.idle_refs = self.refs()
+
+    def refs(self) -> int:
+        return sys.getrefcount(self.arr)
+
+    def in_use(self) -> bool:
+        # alguma view viva (fila, last_frame, consumidor) segura o slot
+        return self.refs() > self.idle_refs
+
+
+class _FrameRing:
+    """
+    Slots reaproveitados em ordem circular. Um slot só volta para o ISP quando
+    nenhuma view dele está viva, então o consumidor pode segurar o frame o
+    tempo que quiser sem copiar; com todos ocupados, acquire() devolve None.
+    """
+
+    def __init__(self, n_slots: int, slot_size: int):
+        self.slot_size = int(slot_size)
+        self.slots = [_RingSlot(self.slot_size) for _ in range(max(1, int(n_slots)))]
+        self._next = 0
+
+    def acquire(self) -> Optional[_RingSlot]:
+        n = len(self.slots)
+        for i in range(n):
+            slot = self.slots[(self._next + i) % n]
+            if not slot.in_use():
+                self._next = (self._next + i + 1) % n
+                return slot
+        return None
+
+    def in_use(self) -> int:
+        return sum(1 for s in self.slots if s.in_use())
+
+    def free(self) -> list:
+        """Libera os slots ociosos; devolve os ainda em uso (liberar depois)."""
+        busy = []
+        for slot in self.slots:
+            if slot.in_use():
+                busy.append(slot)
+            else:
+                mvsdk.CameraAlignFree(slot.ptr)
+        self.slots = []
+        return busy
+
 
 # -----------------------
 # Backend mvsdk (câmera industrial USB)
 # -----------------------
+# enumerate/init/uninit do SDK não são thread-safe entre câmeras
+_SDK_LOCK = threading.Lock()
+# serial -> backend dono: duas threads nunca abrem a mesma câmera
+_CLAIMED_DEVICES: dict = {}
+
+_TRIGGER_MODES = {"continuous": 0, "software": 1, "hardware": 2}
+# campo do tSdkImageResolution para cada modo; valor = fator - 1 (1 = 2x2),
+# suportado se o bit (fator - 2) da máscara correspondente estiver ligado
+_BIN_MODES = {
+    "sum": ("uBinSumMode", "uBinSumModeMask"),
+    "average": ("uBinAverageMode", "uBinAverageModeMask"),
+    "skip": ("uSkipMode", "uSkipModeMask"),
+}
+_EXT_TRIG_SIGNALS = {
+    "rising": 0,  # EXT_TRIG_LEADING_EDGE
+    "falling": 1,  # EXT_TRIG_TRAILING_EDGE
+    "high": 2,  # EXT_TRIG_HIGH_LEVEL
+    "low": 3,  # EXT_TRIG_LOW_LEVEL
+    "double": 4,  # EXT_TRIG_DOUBLE_EDGE
+}
+
+
 class _MvSdkBackend(_BaseBackend):
     def __init__(
         self,
         force_mono: bool = False,
         exposure_us: Optional[int] = 30000,
         resolution: Optional[Tuple[int, int]] = None,  # (w,h)
+        ring_size: int = 4,
+        capture_mode: str = "poll",
+        trigger: Optional[dict] = None,
+        roi: Optional[Tuple[int, int, int, int]] = None,  # (x,y,w,h) no sensor
+        binning: int = 1,
+        bin_mode: str = "average",
+        isp_format: Optional[str] = None,
+        serial: Optional[str] = None,
+        device_name: Optional[str] = None,
     ):
         if not _HAS_MVSDK:
             raise RuntimeError("mvsdk não disponível: verifique instalação do SDK.")
@@ -116,22 +373,110 @@ class _MvSdkBackend(_BaseBackend):
         self.p_frame = None
         self._buf_size = 0
         self.name = "MV-USB"
+        self.config_error: Optional[str] = None
+
+        # ring_size >= buffer do stream + last_frame + frames em uso no consumidor;
+        # 0 desliga (volta ao buffer único + cópia)
+        self.ring_size = max(0, int(ring_size))
+        self._ring: Optional[_FrameRing] = None
+        self._orphans: list = []  # slots liberados com views ainda vivas
+        self.ring_frames = 0
+        self.copy_frames = 0
+
+        # "poll": CameraGetImageBuffer num loop Python (grab)
+        # "grabber": thread do SDK (CameraGrabber) + callback RGB -> sink
+        self.capture_mode = capture_mode.lower().strip()
+        if self.capture_mode not in ("poll", "grabber"):
+            raise ValueError("capture_mode deve ser 'poll' ou 'grabber'")
+        self.grabber = None
+        self._rgb_cb = None
+        self._sink = None
+        self._last_cb_ts = 0.0
+
+        # trigger: {"mode": continuous|software|hardware, "signal", "delay_us",
+        #           "jitter_us", "count"} (signal/delay/jitter só no hardware)
+        self.trigger = dict(trigger or {})
+        self.trigger_mode = str(self.trigger.get("mode", "continuous")).lower()
+        if self.trigger_mode not in _TRIGGER_MODES:
+            raise ValueError(f"trigger mode deve ser um de {tuple(_TRIGGER_MODES)}")
+        signal = str(self.trigger.get("signal", "rising")).lower()
+        if signal not in _EXT_TRIG_SIGNALS:
+            raise ValueError(
+                f"trigger signal deve ser um de {tuple(_EXT_TRIG_SIGNALS)}"
+            )
+        self.soft_triggers = 0
+
+        # ROI/binning no sensor: a câmera só transfere os pixels que usamos
+        self.roi = tuple(int(v) for v in roi) if roi else None
+        self.binning = max(1, int(binning))
+        self.bin_mode = str(bin_mode).lower()
+        if self.bin_mode not in _BIN_MODES:
+            raise ValueError(f"bin_mode deve ser um de {tuple(_BIN_MODES)}")
+        self.isp_format = isp_format.lower() if isp_format else None
+        if self.isp_format not in (None, "mono8", "bgr8"):
+            raise ValueError("isp_format deve ser 'mono8' ou 'bgr8'")
+        self.out_size: Optional[Tuple[int, int]] = None
+
+        # seleção do dispositivo: serial > nome amigável > primeiro livre.
+        # Depois do 1º connect o serial fica fixo: reconexão volta à mesma câmera.
+        self.serial = str(serial) if serial else None
+        self.device_name = device_name
+        self._bound_sn: Optional[str] = self.serial
+
+    def _select_device(self, devs):
+        """Chamado com _SDK_LOCK. Devolve o tSdkCameraDevInfo ou None."""
+        for dev in devs:
+            sn = dev.GetSn()
+            if self._bound_sn is not None:
+                if sn == self._bound_sn:
+                    return dev
+                continue
+            if (
+                self.device_name is not None
+                and dev.GetFriendlyName() != self.device_name
+            ):
+                continue
+            owner = _CLAIMED_DEVICES.get(sn)
+            if owner is None or owner is self:
+                return dev
+        return None
+
+    def release_device(self) -> None:
+        """Libera o serial reservado (fim do stream, não em reconexões)."""
+        with _SDK_LOCK:
+            for sn, owner in list(_CLAIMED_DEVICES.items()):
+                if owner is self:
+                    del _CLAIMED_DEVICES[sn]
 
     def connect(self) -> bool:
         self.close()
+        self.config_error = None
         try:
-            devs = mvsdk.CameraEnumerateDevice()
-            if not devs:
-                self.is_connected = False
-                return False
+            with _SDK_LOCK:
+                devs = mvsdk.CameraEnumerateDevice()
+                dev = self._select_device(devs or [])
+                if dev is None:
+                    self.is_connected = False
+                    return False
 
-            dev = devs[0]
-            self.name = dev.GetFriendlyName()
+                sn = dev.GetSn()
+                self.name = f"{dev.GetFriendlyName()} ({sn})"
 
-            self.h = mvsdk.CameraInit(dev, -1, -1)
+                if self.capture_mode == "grabber":
+                    # o grabber abre a câmera e roda a captura numa thread do SDK
+                    self.grabber = mvsdk.CameraGrabber_Create(dev)
+                    self.h = mvsdk.CameraGrabber_GetCameraHandle(self.grabber)
+                else:
+                    self.h = mvsdk.CameraInit(dev, -1, -1)
+                _CLAIMED_DEVICES[sn] = self
+                self._bound_sn = sn
             self.cap = mvsdk.CameraGetCapability(self.h)
             hw_mono = self.cap.sIspCapacity.bMonoSensor != 0
-            self.is_mono = bool(self.force_mono or hw_mono)
+            if self.isp_format is not None:
+                # sensor mono não gera BGR útil; MONO8 em sensor colorido é válido
+                self.is_mono = hw_mono or self.isp_format == "mono8"
+            else:
+                self.is_mono = bool(self.force_mono or hw_mono)
 
             # Formato de saída no ISP (ideal pro OpenCV)
             if self.is_mono:
@@ -139,61 +484,210 @@ class _MvSdkBackend(_BaseBackend):
             else:
                 mvsdk.CameraSetIspOutFormat(self.h, mvsdk.CAMERA_MEDIA_TYPE_BGR8)
 
-            # Contínuo, exposição manual simples
-            mvsdk.CameraSetTriggerMode(self.h, 0)
+            # contínuo ou por trigger (software/hardware); exposição manual simples
+            self._apply_trigger()
             mvsdk.CameraSetAeState(self.h, 0)
             if self.exposure_us is not None:
                 mvsdk.CameraSetExposureTime(self.h, int(self.exposure_us))
 
-            # (Opcional) reduzir resolução na própria câmera
-            if self.resolution:
+            # (Opcional) ROI/binning no sensor ou reduzir resolução na câmera
+            if self.roi or self.binning > 1:
+                self._apply_roi()
+            elif self.resolution:
                 w, h = self.resolution
-                res = mvsdk.tSdkImageResolution()
-                mvsdk.CameraGetImageResolution(self.h, res)
+                res = mvsdk.CameraGetImageResolution(self.h)
                 res.iWidth, res.iHeight = int(w), int(h)
-                mvsdk.CameraSetImageResolution(self.h, res)
-
-            mvsdk.CameraPlay(self.h)
+                if mvsdk.CameraSetImageResolution(self.h, res) != 0:
+                    raise CameraConfigError(f"câmera não aceitou resolução {w}x{h}")
 
             # buffer alinhado do tamanho máximo possível
             max_w = self.cap.sResolutionRange.iWidthMax
             max_h = self.cap.sResolutionRange.iHeightMax
             channels = 1 if self.is_mono else 3
             self._buf_size = max_w * max_h * channels
-            self.p_frame = mvsdk.CameraAlignMalloc(self._buf_size, 16)
+            if self.grabber is None:
+                # no grabber o callback do SDK entrega direto nos slots do anel
+                self.p_frame = mvsdk.CameraAlignMalloc(self._buf_size, 16)
+            if self.ring_size:
+                self._ring = _FrameRing(self.ring_size, self._buf_size)
 
+            if self.grabber is not None:
+                # a referência ao CFUNCTYPE precisa viver enquanto o grabber existir
+                self._rgb_cb = mvsdk.pfnCameraGrabberFrameCallback(self._on_rgb_frame)
+                mvsdk.CameraGrabber_SetRGBCallback(self.grabber, self._rgb_cb, 0)
+                mvsdk.CameraGrabber_StartLive(self.grabber)
+            else:
+                mvsdk.CameraPlay(self.h)
+
+            self._last_cb_ts = time.monotonic()
             self.is_connected = True
             return True
 
-        except mvsdk.CameraException:
+        except CameraConfigError as e:
+            # o stream para de tentar (ver BufferedVideoStream.run)
+            self.config_error = str(e)
+            logger.error(f"[{self.name}] configuração inválida: {e}")
             self.close()
             return False
-        except Exception:
+        except mvsdk.CameraException as e:
+            logger.warning(
+                f"[{self.name}] falha ao conectar: {e.message} ({e.error_code})"
+            )
             self.close()
             return False
+        except Exception as e:
+            logger.warning(f"[{self.name}] falha ao conectar: {e}")
+            self.close()
+            return False
+
+    def _apply_roi(self, align: int = 16) -> None:
+        """Resolução customizada (iIndex 0xFF): janela no sensor + bin/skip."""
+        rng = self.cap.sResolutionRange
+        max_w, max_h = rng.iWidthMax, rng.iHeightMax
+        x, y, w, h = self.roi or (0, 0, max_w, max_h)
+
+        # offsets/tamanhos múltiplos de `align` e dentro do sensor
+        x = max(0, min(int(x) // align * align, max_w - align))
+        y = max(0, min(int(y) // align * align, max_h - align))
+        w = max(align, min(int(w), max_w - x) // align * align)
+        h = max(align, min(int(h), max_h - y) // align * align)
+
+        f = self.binning
+        mode_field, mask_field = _BIN_MODES[self.bin_mode]
+        if f > 1 and not (getattr(rng, mask_field) >> (f - 2)) & 1:
+            raise CameraConfigError(f"câmera não suporta {self.bin_mode} {f}x{f}")
+
+        res = mvsdk.CameraGetImageResolution(self.h)
+        res.iIndex = 0xFF
+        res.uBinSumMode = res.uBinAverageMode = res.uSkipMode = 0
+        res.uResampleMask = 0
+        if f > 1:
+            setattr(res, mode_field, f - 1)
+        res.iHOffsetFOV, res.iVOffsetFOV = x, y
+        res.iWidthFOV, res.iHeightFOV = w, h
+        res.iWidth, res.iHeight = w // f, h // f
+        res.iWidthZoomHd = res.iHeightZoomHd = 0
+        res.iWidthZoomSw = res.iHeightZoomSw = 0
+        if mvsdk.CameraSetImageResolution(self.h, res) != 0:
+            raise CameraConfigError(
+                f"câmera não aceitou ROI {(x, y, w, h)} com {self.bin_mode} {f}x{f}"
+            )
+        self.out_size = (w // f, h // f)
+
+    def _apply_trigger(self) -> None:
+        if mvsdk.CameraSetTriggerMode(self.h, _TRIGGER_MODES[self.trigger_mode]) != 0:
+            raise CameraConfigError(f"câmera não aceitou trigger '{self.trigger_mode}'")
+        if self.trigger_mode == "continuous":
+            return
+        # frames por trigger; parâmetros opcionais: nem todo modelo suporta todos
+        mvsdk.CameraSetTriggerCount(self.h, int(self.trigger.get("count", 1)))
+        if self.trigger_mode == "hardware":
+            t = self.trigger
+            signal = _EXT_TRIG_SIGNALS[str(t.get("signal", "rising")).lower()]
+            mvsdk.CameraSetExtTrigSignalType(self.h, signal)
+            if t.get("delay_us") is not None:
+                mvsdk.CameraSetExtTrigDelayTime(self.h, int(t["delay_us"]))
+            if t.get("jitter_us") is not None:
+                mvsdk.CameraSetExtTrigJitterTime(self.h, int(t["jitter_us"]))
+
+    def soft_trigger(self) -> bool:
+        if self.trigger_mode != "software" or not self.h or not self.is_connected:
+            return False
+        try:
+            ok = mvsdk.CameraSoftTrigger(self.h) == 0
+        except Exception:
+            ok = False
+        if ok:
+            self.soft_triggers += 1
+        return ok
+
+    def set_sink(self, sink) -> None:
+        """Modo grabber: destino dos frames entregues pelo callback do SDK."""
+        self._sink = sink
+
+    def _on_rgb_frame(self, grabber, p_frame_buffer, p_frame_head, context):
+        # thread do grabber do SDK; o buffer só vale durante o callback
+        try:
+            ts = time.monotonic()
+            head = p_frame_head[0]
+            size = head.uBytes
+            if head.uiMediaType == mvsdk.CAMERA_MEDIA_TYPE_MONO8:
+                shape = (head.iHeight, head.iWidth)
+            else:
+                shape = (head.iHeight, head.iWidth, 3)
+
+            slot = self._ring.acquire() if self._ring is not None else None
+            if slot is not None and size <= self._ring.slot_size:
+                ctypes.memmove(slot.ptr, p_frame_buffer, size)
+                if platform.system() == "Windows":
+                    mvsdk.CameraFlipFrameBuffer(slot.ptr, head, 1)
+                frame = slot.arr[:size].reshape(shape)
+                self.ring_frames += 1
+            else:
+                if platform.system() == "Windows":
+                    mvsdk.CameraFlipFrameBuffer(p_frame_buffer, head, 1)
+                cbuf = (ctypes.c_ubyte * size).from_address(p_frame_buffer)
+                frame = np.frombuffer(cbuf, dtype=np.uint8).reshape(shape).copy()
+                self.copy_frames += 1
+
+            self._last_cb_ts = ts
+            sink = self._sink
+            if sink is not None:
+                # o cabeçalho também é do SDK: vai uma cópia junto com o frame
+                sink(frame, mvsdk.tSdkFrameHead.from_buffer_copy(head), ts)
+        except Exception:
+            # exceção não pode escapar para dentro do SDK
+            pass
+
+    def _supervise(self) -> None:
+        # modo grabber: os frames chegam pelo callback; aqui só checa a conexão
+        time.sleep(0.2)
+        if time.monotonic() - self._last_cb_ts < 1.0:
+            return
+        try:
+            if mvsdk.CameraConnectTest(self.h) != 0:
+                self.is_connected = False
+        except Exception:
+            self.is_connected = False
 
     def grab(self) -> Optional[np.ndarray]:
-        if not self.h or not self.p_frame:
+        if not self.h:
+            return None
+        if self.grabber is not None:
+            self._supervise()
+            return None
+        if not self.p_frame:
             return None
         try:
+            # slot livre do anel (ISP escreve direto nele); anel esgotado ->
+            # buffer de rascunho + cópia, como antes
+            slot = self._ring.acquire() if self._ring is not None else None
+            dst = slot.ptr if slot is not None else self.p_frame
+
             # timeout curto evita travar se não houver frame
             p_raw, head = mvsdk.CameraGetImageBuffer(self.h, 200)
-            mvsdk.CameraImageProcess(self.h, p_raw, self.p_frame, head)
+            self.last_ts = time.monotonic()
+            self.last_head = head
+            mvsdk.CameraImageProcess(self.h, p_raw, dst, head)
             mvsdk.CameraReleaseImageBuffer(self.h, p_raw)
 
             if platform.system() == "Windows":
-                mvsdk.CameraFlipFrameBuffer(self.p_frame, head, 1)
+                mvsdk.CameraFlipFrameBuffer(dst, head, 1)
 
             size = head.uBytes
-            cbuf = (ctypes.c_ubyte * size).from_address(self.p_frame)
-            arr = np.frombuffer(cbuf, dtype=np.uint8)
-
             if head.uiMediaType == mvsdk.CAMERA_MEDIA_TYPE_MONO8:
-                frame = arr.reshape(head.iHeight, head.iWidth).copy()
+                shape = (head.iHeight, head.iWidth)
             else:
-                frame = arr.reshape(head.iHeight, head.iWidth, 3).copy()
+                shape = (head.iHeight, head.iWidth, 3)
 
-            return frame
+            if slot is not None:
+                self.ring_frames += 1
+                return slot.arr[:size].reshape(shape)
+
+            cbuf = (ctypes.c_ubyte * size).from_address(self.p_frame)
+            arr = np.frombuffer(cbuf, dtype=np.uint8)
+            self.copy_frames += 1
+            return arr.reshape(shape).copy()
 
         except mvsdk.CameraException as e:
             if e.error_code == mvsdk.CAMERA_STATUS_TIME_OUT:
@@ -208,12 +702,26 @@ class _MvSdkBackend(_BaseBackend):
 
     def close(self) -> None:
         try:
-            if self.h is not None:
+            if self.grabber is not None:
+                # Destroy também faz o UnInit da câmera
                 try:
-                    mvsdk.CameraUnInit(self.h)
+                    mvsdk.CameraGrabber_StopLive(self.grabber)
                 except Exception:
                     pass
+                with _SDK_LOCK:
+                    try:
+                        mvsdk.CameraGrabber_Destroy(self.grabber)
+                    except Exception:
+                        pass
+            elif self.h is not None:
+                with _SDK_LOCK:
+                    try:
+                        mvsdk.CameraUnInit(self.h)
+                    except Exception:
+                        pass
         finally:
+            self.grabber = None
+            self._rgb_cb = None
             self.h = None
             self.cap = None
             self.is_connected = False
@@ -224,6 +732,55 @@ class _MvSdkBackend(_BaseBackend):
             pass
         finally:
             self.p_frame = None
+        self._free_ring()
+
+    def _free_ring(self) -> None:
+        # slots com views vivas não podem ser liberados agora (use-after-free)
+        try:
+            if self._ring is not None:
+                self._orphans.extend(self._ring.free())
+            still = []
+            for slot in self._orphans:
+                if slot.in_use():
+                    still.append(slot)
+                else:
+                    mvsdk.CameraAlignFree(slot.ptr)
+            self._orphans = still
+        except Exception:
+            pass
+        finally:
+            self._ring = None
+
+    def get_stats(self) -> dict:
+        ring = self._ring
+        stats = {
+            "capture_mode": self.capture_mode,
+            "trigger_mode": self.trigger_mode,
+            "out_size": self.out_size,
+            "soft_triggers": self.soft_triggers,
+            "ring_size": len(ring.slots) if ring is not None else 0,
+            "ring_in_use": ring.in_use() if ring is not None else 0,
+            "ring_frames": self.ring_frames,
+            "copy_frames": self.copy_frames,
+            "orphan_slots": len(self._orphans),
+        }
+        grabber = self.grabber
+        if grabber is not None:
+            try:
+                st = mvsdk.CameraGrabber_GetStat(grabber)
+                stats["grabber"] = {
+                    "width": st.Width,
+                    "height": st.Height,
+                    "captured": st.Capture,
+                    "displayed": st.Disp,
+                    "lost": st.Lost,
+                    "error": st.Error,
+                    "cap_fps": round(float(st.CapFps), 2),
+                    "disp_fps": round(float(st.DispFps), 2),
+                }
+            except Exception:
+                pass
+        return stats
 
 
 # -----------------------
@@ -234,6 +791,41 @@ class BufferedVideoStream(threading.Thread):
     backend:
       - "opencv": usa cv2.VideoCapture em `source` (arquivo, rtsp, índice USB genérico)
       - "mvsdk": usa SDK da câmera industrial (ignora `source`)
+
+    mvsdk: os frames são views de um anel de mv_ring_size buffers alinhados
+    (sem cópia). O slot só é reescrito depois que todas as views dele morrem,
+    então segurar o frame é seguro; read(copy=True) só se for alterá-lo.
+
+    mv_capture_mode:
+      - "poll": esta thread chama CameraGetImageBuffer em loop
+      - "grabber": a thread do CameraGrabber do SDK entrega os frames por
+        callback (sem polling); esta thread só supervisiona a conexão
+
+    mv_trigger: {"mode": "continuous" | "software" | "hardware", ...}
+      - "software": cada read() dispara CameraSoftTrigger quando não há frame
+        pronto (a câmera só expõe o que vamos processar); "prefetch": True
+        dispara o próximo logo após entregar um frame; "timeout_sec" re-dispara
+        se o frame não chegar
+      - "hardware": trigger externo; "signal" (rising|falling|high|low|double),
+        "delay_us", "jitter_us", "count"
+
+    mv_roi (x, y, w, h em pixels do sensor), mv_binning (1/2/3...) com
+    mv_bin_mode (sum|average|skip) e mv_isp_format (mono8|bgr8) são aplicados
+    na câmera: só os pixels úteis trafegam no USB e passam pelo ISP.
+
+    mv_serial / mv_device_name escolhem a câmera (uma thread por dispositivo);
+    sem eles, pega a primeira ainda não aberta por outro stream. A reconexão
+    sempre volta ao mesmo serial.
+
+    opencv: cv_decode_threads (threads do decode FFmpeg desta captura),
+    cv_hw_accel, cv_decode_size (w,h) e cv_lowres (ver _OpenCVBackend).
+
+    read_record() devolve o FrameRecord (seq, ts monotonic, cabeçalho da fonte);
+    read() continua devolvendo só o ndarray.
+
+    target_fps: ritmo de leitura da fonte (None = FPS nativo para arquivo,
+    0 = sem limite). skip_undelivered: mede o ritmo de read() e, para frames
+    que seriam descartados pelo buffer, faz só grab() (sem decode/conversão).
     """
 
     def __init__(
@@ -248,17 +840,50 @@ class BufferedVideoStream(threading.Thread):
         mv_force_mono: bool = False,
         mv_exposure_us: Optional[int] = 30000,
         mv_resolution: Optional[Tuple[int, int]] = None,
+        mv_ring_size: int = 4,
+        mv_capture_mode: str = "poll",
+        mv_trigger: Optional[dict] = None,
+        mv_roi: Optional[Tuple[int, int, int, int]] = None,
+        mv_binning: int = 1,
+        mv_bin_mode: str = "average",
+        mv_isp_format: Optional[str] = None,
+        mv_serial: Optional[str] = None,
+        mv_device_name: Optional[str] = None,
+        # opções específicas do opencv:
+        cv_decode_threads: Optional[int] = None,
+        cv_hw_accel: Optional[str] = None,
+        cv_decode_size: Optional[Tuple[int, int]] = None,
+        cv_lowres: int = 0,
+        target_fps: Optional[float] = None,
+        skip_undelivered: bool = True,
     ):
         super().__init__(daemon=True)
         self.backend_name = backend.lower().strip()
         if self.backend_name == "opencv":
-            self.backend = _OpenCVBackend(source)
+            self.backend = _OpenCVBackend(
+                source,
+                decode_threads=cv_decode_threads,
+                hw_accel=cv_hw_accel,
+                decode_size=cv_decode_size,
+                lowres=cv_lowres,
+            )
         elif self.backend_name == "mvsdk":
             self.backend = _MvSdkBackend(
                 force_mono=mv_force_mono,
                 exposure_us=mv_exposure_us,
                 resolution=mv_resolution,
+                ring_size=mv_ring_size,
+                capture_mode=mv_capture_mode,
+                trigger=mv_trigger,
+                roi=mv_roi,
+                binning=mv_binning,
+                bin_mode=mv_bin_mode,
+                isp_format=mv_isp_format,
+                serial=mv_serial,
+                device_name=mv_device_name,
             )
+            # modo grabber: o callback do SDK entrega direto no buffer do stream
+            self.backend.set_sink(self._push_frame)
         else:
             raise ValueError("backend deve ser 'opencv' ou 'mvsdk'")
 
@@ -272,11 +897,36 @@ class BufferedVideoStream(threading.Thread):
         self._pause_event.set() if start_paused else self._pause_event.clear()
 
         self._last_frame_lock = threading.Lock()
-        self.last_frame: Optional[np.ndarray] = None
+        self.last_record: Optional[FrameRecord] = None
         self.last_frame_ts: float = 0.0
+        self._seq = 0  # todo frame da fonte conta, inclusive os pulados
 
         self._retry_count = 0
 
+        # trigger por software: read() pede o frame (CameraSoftTrigger) sob demanda;
+        # prefetch dispara o próximo assim que um frame é entregue
+        trig = dict(mv_trigger or {}) if self.backend_name == "mvsdk" else {}
+        self.trigger_mode = self.backend.trigger_mode
+        self._trigger_prefetch = bool(trig.get("prefetch", False))
+        self._trigger_timeout = float(trig.get("timeout_sec", 1.0))
+        self._trigger_lock = threading.Lock()
+        self._trigger_pending_ts = 0.0
+        self.trigger_timeouts = 0
+
+        # ritmo da fonte: None = FPS nativo para arquivos (ao vivo para o resto),
+        # 0 = o mais rápido possível
+        self.target_fps = target_fps
+        self._pace_interval = 0.0
+        self._next_due: Optional[float] = None
+        # frames que o consumidor não vai ler: só grab (sem decode/conversão)
+        self.skip_undelivered = bool(skip_undelivered)
+        self._read_interval: Optional[float] = None  # EMA entre leituras (s)
+        self._last_read_ts = 0.0
+        self._src_interval: Optional[float] = None  # EMA entre frames da fonte (s)
+        self._last_src_ts = 0.0
+        self.frames_delivered = 0
+        self.frames_skipped = 0
+
     # ===== infra =====
     def _sleep_with_backoff(self, mini: bool = False):
         lo, hi = self.reconnect_backoff
@@ -288,8 +938,49 @@ class BufferedVideoStream(threading.Thread):
         ok = self.backend.connect()
         if ok:
             self._retry_count = 0
+            fps = self.target_fps
+            if fps is None and getattr(self.backend, "is_file", False):
+                fps = self.backend.native_fps()
+            self._pace_interval = 1.0 / float(fps) if fps and fps > 0 else 0.0
+            self._next_due = None
         return ok
 
+    def _pace(self) -> None:
+        """Arquivo/fonte com target_fps: segura o loop no ritmo da câmera real."""
+        if not self._pace_interval:
+            return
+        now = time.monotonic()
+        if self._next_due is None or now - self._next_due > 1.0:
+            self._next_due = now  # início ou atraso grande: não tenta compensar
+        wait = self._next_due - now
+        if wait > 0:
+            self._stop_event.wait(wait)
+        self._next_due += self._pace_interval
+
+    def _note_source_frame(self) -> None:
+        now = time.monotonic()
+        if self._last_src_ts:
+            dt = now - self._last_src_ts
+            self._src_interval = (
+                dt
+                if self._src_interval is None
+                else 0.9 * self._src_interval + 0.1 * dt
+            )
+        self._last_src_ts = now
+
+    def _will_be_read(self) -> bool:
+        """
+        O frame atual chega ao consumidor? Com o buffer já cheio, só se a
+        próxima leitura prevista vier antes do próximo frame da fonte; senão
+        ele seria descartado (drop-oldest) e não vale decodificar.
+        """
+        if not self.skip_undelivered or not self.backend.supports_skip:
+            return True
+        if self._read_interval is None or not self.frame_buffer.full():
+            return True
+        eta = self._last_read_ts + self._read_interval
+        return time.monotonic() + (self._src_interval or 0.0) >= eta
+
     def _safe_release(self):
         self.backend.close()
 
@@ -302,6 +993,12 @@ class BufferedVideoStream(threading.Thread):
 
             if not self.backend.is_connected:
                 if not self._connect():
+                    if getattr(self.backend, "config_error", None):
+                        logger.error(
+                            f"[{self.backend.name}] captura encerrada: "
+                            f"{self.backend.config_error}"
+                        )
+                        break
                     self._retry_count += 1
                     if (
                         self.max_retries is not None
@@ -311,7 +1008,17 @@ class BufferedVideoStream(threading.Thread):
                     self._sleep_with_backoff()
                     continue
 
-            frame = self.backend.grab()
+            self._pace()
+            if self._will_be_read():
+                frame = self.backend.grab()
+            elif self.backend.grab_raw():
+                # avança a fonte sem decodificar: ninguém leria este frame
+                self._note_source_frame()
+                self._seq += 1
+                self.frames_skipped += 1
+                continue
+            else:
+                frame = None
             if frame is None:
                 # timeout/erro → tentar reconectar (quando backend sinaliza desconectado)
                 if not self.backend.is_connected:
@@ -328,43 +1035,108 @@ class BufferedVideoStream(threading.Thread):
                     time.sleep(0.001)
                 continue
 
-            # push (drop oldest)
-            if self.frame_buffer.full():
-                try:
-                    self.frame_buffer.get_nowait()
-                except queue.Empty:
-                    pass
+            self._note_source_frame()
+            self.frames_delivered += 1
+            self._push_frame(frame, self.backend.last_head, self.backend.last_ts)
+
+        self._cleanup()
+
+    def _push_frame(
+        self, frame: np.ndarray, head=None, ts: Optional[float] = None
+    ) -> None:
+        # chamado pela thread do stream ou pelo callback do grabber do SDK
+        self._trigger_pending_ts = 0.0
+        self._seq += 1
+        if self._pause_event.is_set() or self._stop_event.is_set():
+            return
+        rec = FrameRecord(frame, self._seq, ts or time.monotonic(), head)
+
+        # push (drop oldest)
+        if self.frame_buffer.full():
             try:
-                self.frame_buffer.put_nowait(frame)
-            except queue.Full:
+                self.frame_buffer.get_nowait()
+            except queue.Empty:
                 pass
+        try:
+            self.frame_buffer.put_nowait(rec)
+        except queue.Full:
+            pass
 
-            with self._last_frame_lock:
-                self.last_frame = frame
-                self.last_frame_ts = time.time()
+        with self._last_frame_lock:
+            self.last_record = rec
+            self.last_frame_ts = time.time()
 
-        self._cleanup()
+    def _request_frame(self) -> None:
+        """Trigger por software: 1 disparo por vez (re-dispara se o frame se perdeu)."""
+        if self._pause_event.is_set() or not self.frame_buffer.empty():
+            return
+        with self._trigger_lock:
+            now = time.monotonic()
+            if self._trigger_pending_ts:
+                if now - self._trigger_pending_ts < self._trigger_timeout:
+                    return
+                self.trigger_timeouts += 1
+            if self.backend.soft_trigger():
+                self._trigger_pending_ts = now
 
     # ===== API pública (compatível) =====
     def read(self, copy: bool = False, timeout: float = 0.0) -> Optional[np.ndarray]:
+        """
+        continuous: frame mais novo (ou o último, se não chegou outro).
+        software/hardware: só frames novos; None se nenhum chegou no timeout.
+        """
+        rec = self.read_record(copy=copy, timeout=timeout)
+        return rec.frame if rec is not None else None
+
+    def read_record(
+        self, copy: bool = False, timeout: float = 0.0
+    ) -> Optional[FrameRecord]:
+        """Como read(), mas com seq/ts/head (repetição do último = mesmo seq)."""
+        soft = self.trigger_mode == "software"
+        if soft:
+            self._request_frame()
         try:
-            frame = (
+            rec = (
                 self.frame_buffer.get(timeout=timeout)
                 if timeout and timeout > 0
                 else self.frame_buffer.get_nowait()
             )
         except queue.Empty:
+            if self.trigger_mode != "continuous":
+                return None
             with self._last_frame_lock:
-                frame = self.last_frame
+                rec = self.last_record
+        else:
+            self._note_read()
+            if soft and self._trigger_prefetch:
+                # expõe o próximo enquanto o consumidor processa este
+                self._request_frame()
 
-        if frame is None:
+        if rec is None:
             return None
-        return frame.copy() if copy else frame
+        return rec.copy() if copy else rec
+
+    @property
+    def last_frame(self) -> Optional[np.ndarray]:
+        rec = self.last_record
+        return rec.frame if rec is not None else None
+
+    def _note_read(self) -> None:
+        # ritmo real do consumidor (só leituras de frames novos)
+        now = time.monotonic()
+        if self._last_read_ts:
+            dt = now - self._last_read_ts
+            self._read_interval = (
+                dt
+                if self._read_interval is None
+                else 0.8 * self._read_interval + 0.2 * dt
+            )
+        self._last_read_ts = now
 
     def pause(self):
         self._pause_event.set()
         with self._last_frame_lock:
-            self.last_frame = None
+            self.last_record = None
             self.last_frame_ts = 0.0
         try:
             while not self.frame_buffer.empty():
@@ -383,6 +1155,10 @@ class BufferedVideoStream(threading.Thread):
 
     def _cleanup(self):
         self._safe_release()
+        # fim do stream: o dispositivo fica livre para outro stream
+        release = getattr(self.backend, "release_device", None)
+        if release is not None:
+            release()
         try:
             while not self.frame_buffer.empty():
                 self.frame_buffer.get_nowait()
@@ -404,8 +1180,22 @@ class BufferedVideoStream(threading.Thread):
                 else None
             ),
             "buffer_len": self.frame_buffer.qsize(),
+            "seq": self._seq,
             "device": getattr(self.backend, "name", self.backend_name),
             "backend": self.backend_name,
+            "trigger_timeouts": self.trigger_timeouts,
+            "consumer_fps": (
+                round(1.0 / self._read_interval, 2) if self._read_interval else None
+            ),
+            "source_fps": (
+                round(1.0 / self._src_interval, 2) if self._src_interval else None
+            ),
+            "target_fps": (
+                round(1.0 / self._pace_interval, 2) if self._pace_interval else None
+            ),
+            "frames_delivered": self.frames_delivered,
+            "frames_skipped": self.frames_skipped,
+            **self.backend.get_stats(),
         }
 
     def __enter__(self):
@@ -0,0 +1,111 @@
+# change_gate.py
+# Pré-filtro barato antes do Patchcore: se a cena não mudou em relação ao
+# último frame pontuado, o loop reaproveita o score anterior.
+
+from __future__ import annotations
+
+import time
+from typing import Optional, Tuple
+
+import cv2
+import numpy as np
+
+
+class ChangeGate:
+    """
+    Compara o frame atual (reduzido e em cinza) com o ÚLTIMO frame pontuado.
+
+    method:
+      - "diff": fração de pixels com |Δ| > pixel_delta; mudou se
+        >= min_changed_frac
+      - "dhash": hash perceptual (difference hash de hash_size² bits); mudou se
+        a distância de Hamming > max_hamming
+
+    force_interval_sec garante re-score periódico mesmo com a cena parada.
+    check(frame) -> True quando o frame deve ser pontuado (e vira a nova referência).
+    """
+
+    def __init__(
+        self,
+        method: str = "diff",
+        size: Tuple[int, int] = (96, 96),
+        pixel_delta: int = 10,
+        min_changed_frac: float = 0.001,
+        hash_size: int = 16,
+        max_hamming: int = 4,
+        force_interval_sec: float = 2.0,
+    ):
+        self.method = method.lower().strip()
+        if self.method not in ("diff", "dhash"):
+            raise ValueError("method deve ser 'diff' ou 'dhash'")
+        self.size = (int(size[0]), int(size[1]))
+        self.pixel_delta = int(pixel_delta)
+        self.min_changed_frac = float(min_changed_frac)
+        self.hash_size = int(hash_size)
+        self.max_hamming = int(max_hamming)
+        self.force_interval_sec = float(force_interval_sec)
+
+        self._ref: Optional[np.ndarray] = None
+        self._ref_ts: float = 0.0
+        self.checked = 0
+        self.skipped = 0
+        self.last_change: Optional[float] = None
+
+    # ===== assinaturas =====
+    def _small_gray(self, frame: np.ndarray, size: Tuple[int, int]) -> np.ndarray:
+        # reduz antes de converter: o cvtColor roda sobre poucos pixels
+        small = cv2.resize(frame, size, interpolation=cv2.INTER_AREA)
+        if small.ndim == 3:
+            small = cv2.cvtColor(small, cv2.COLOR_BGR2GRAY)
+        return small
+
+    def _signature(self, frame: np.ndarray) -> np.ndarray:
+        if self.method == "dhash":
+            g = self._small_gray(frame, (self.hash_size + 1, self.hash_size))
+            return (g[:, 1:] > g[:, :-1]).reshape(-1)
+        return self._small_gray(frame, self.size)
+
+    def _changed(self, sig: np.ndarray) -> bool:
+        if self.method == "dhash":
+            dist = int(np.count_nonzero(sig != self._ref))
+            self.last_change = float(dist)
+            return dist > self.max_hamming
+        diff = cv2.absdiff(sig, self._ref)
+        frac = float(np.count_nonzero(diff > self.pixel_delta)) / diff.size
+        self.last_change = frac
+        return frac >= self.min_changed_frac
+
+    # ===== API =====
+    def check(self, frame: np.ndarray) -> bool:
+        self.checked += 1
+        sig = self._signature(frame)
+        now = time.monotonic()
+        if (
+            self._ref is None
+            or self._ref.shape != sig.shape
+            or (now - self._ref_ts) >= self.force_interval_sec
+            or self._changed(sig)
+        ):
+            self._ref = sig
+            self._ref_ts = now
+            return True
+        self.skipped += 1
+        return False
+
+    def reset(self):
+        """Descarta a referência (ex.: stream pausado/retomado)."""
+        self._ref = None
+        self._ref_ts = 0.0
+
+    @property
+    def skip_rate(self) -> float:
+        return self.skipped / self.checked if self.checked else 0.0
+
+    def get_status(self) -> dict:
+        return {
+            "method": self.method,
+            "checked": self.checked,
+            "skipped": self.skipped,
+            "skip_rate": self.skip_rate,
+            "last_change": self.last_change,
+        }
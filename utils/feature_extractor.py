@@ -5,19 +5,27 @@ import io
 import json
 import os
 import time
-from typing import Dict, List, Optional, Tuple
+from typing import Dict, List, Optional, Sequence, Tuple, Union
 
 import cv2
 import numpy as np
 import requests
 import torch
 from PIL import Image
-from torchvision import models, transforms
+from torchvision import models
+
+from utils.logger import logger
+from utils.quantization import static_quantize_fx
 
 # ----------------- Configs globais do backbone -----------------
 BACKBONE_INPUT = 224  # lado para o preprocess da ResNet
 FEATURE_LAYER = "layer4"
 FEATURE_DIM = 2048
+IMAGENET_MEAN = (0.485, 0.456, 0.406)
+IMAGENET_STD = (0.229, 0.224, 0.225)
+
+# imagem PIL ou ndarray uint8 [H,W,3] (RGB) / [H,W]
+ImageLike = Union[Image.Image, np.ndarray]
 
 # ----------------- I/O helpers -----------------
 _HTTP_TIMEOUT = 15
@@ -96,28 +104,16 @@ def normalize_polygon(poly) -> List[List[float]] | None:
 
 
 # ----------------- Máscaras no feature map (otimizada) -----------------
-def polygon_to_mask_on_feature_map(
-    poly_norm: List[List[float]],
-    feat_h: int,
-    feat_w: int,
-    input_w: int = BACKBONE_INPUT,
-    input_h: int = BACKBONE_INPUT,
+def polygons_to_masks_on_feature_map(
+    polys: List[List[List[float]]], feat_h: int, feat_w: int
 ) -> np.ndarray:
-    """
-    Converte poly (0..1) em máscara [feat_h, feat_w] de forma vetorizada:
-    1) Escala para o grid do feature map diretamente (mais rápido).
-    2) Preenche polígono com cv2.fillPoly.
-    """
-    # Escala para coordenadas do feature map
-    poly_fm = np.array(
-        [[x * feat_w, y * feat_h] for (x, y) in poly_norm],
-        dtype=np.float32,
-    ).reshape((-1, 1, 2))
-    poly_fm_i = poly_fm.astype(np.int32)
-
-    mask = np.zeros((feat_h, feat_w), dtype=np.uint8)
-    cv2.fillPoly(mask, [poly_fm_i], 1)
-    return mask
+    """K polígonos (0..1) -> máscaras empilhadas [K, feat_h, feat_w] (uint8)."""
+    masks = np.zeros((len(polys), feat_h, feat_w), dtype=np.uint8)
+    scale = np.array([feat_w, feat_h], dtype=np.float32)
+    for k, poly in enumerate(polys):
+        pts = (np.asarray(poly, dtype=np.float32) * scale).astype(np.int32)
+        cv2.fillPoly(masks[k], [pts.reshape(-1, 1, 2)], 1)
+    return masks
 
 
 def dilate_mask(mask: np.ndarray, k: int = 1) -> np.ndarray:
@@ -127,21 +123,93 @@ def dilate_mask(mask: np.ndarray, k: int = 1) -> np.ndarray:
     return cv2.dilate(mask.astype(np.uint8), kernel, iterations=1)
 
 
+def _stack_polygon_masks(
+    polys_per_img: List[List[List[List[float]]]], feat_h: int, feat_w: int
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Máscaras de todos os polígonos num bloco [N, M_max, h, w] (zeros nas
+    posições sem polígono) + valid [N, M_max].
+    """
+    n = len(polys_per_img)
+    m_max = max((len(p) for p in polys_per_img), default=0)
+    masks = np.zeros((n, m_max, feat_h, feat_w), dtype=np.uint8)
+    valid = np.zeros((n, m_max), dtype=bool)
+    for i, polys in enumerate(polys_per_img):
+        if polys:
+            masks[i, : len(polys)] = polygons_to_masks_on_feature_map(
+                polys, feat_h=feat_h, feat_w=feat_w
+            )
+            valid[i, : len(polys)] = True
+    return masks, valid
+
+
+def _background_masks(
+    masks: np.ndarray, valid: np.ndarray, margin_cells: int
+) -> np.ndarray:
+    """Fundo de cada polígono: fora da máscara dilatada por margin_cells."""
+    bg = np.zeros_like(masks)
+    for n, m in zip(*np.nonzero(valid)):
+        bg[n, m] = 1 - dilate_mask(masks[n, m], k=margin_cells)
+    return bg
+
+
+def _empty_masks(masks: np.ndarray, valid: np.ndarray) -> np.ndarray:
+    """[ΣM_válidos] bool: máscaras sem nenhuma célula (caem no GAP)."""
+    return ~masks.any(axis=(2, 3))[valid]
+
+
+def _batched_masked_means(
+    feat: torch.Tensor, masks: np.ndarray, valid: np.ndarray
+) -> torch.Tensor:
+    """
+    feat [N,C,h,w] x masks [N,M,h,w] -> médias [ΣM_válidos, C] num único einsum;
+    máscaras vazias caem no GAP da própria imagem.
+    """
+    m = torch.from_numpy(masks).to(feat.device, dtype=feat.dtype)
+    cnt = m.sum(dim=(2, 3))  # [N,M]
+    emb = torch.einsum("nchw,nmhw->nmc", feat, m) / (cnt.unsqueeze(-1) + 1e-6)
+    empty = cnt < 1.0
+    if bool(empty.any()):
+        gap = feat.mean(dim=(2, 3))  # [N,C]
+        emb = torch.where(empty.unsqueeze(-1), gap.unsqueeze(1), emb)
+    return emb[torch.from_numpy(valid).to(feat.device)]
+
+
 # ----------------- Extrator de Features -----------------
 class ResNetFeature:
     """
     Hooka o layer4 da ResNet50 e expõe métodos para obter embeddings:
       - region_embedding(img_pil, poly_norm) -> (C,)
       - region_and_background_embeddings(img_pil, poly_norm, margin_cells) -> (C,), (C,)
+      - batch_region_embeddings(imgs, polys_per_img) -> (N·M, C): 1 forward
+        empilhado para as N imagens e pooling de todas as máscaras num einsum
+      - batch_region_and_background_embeddings(...) -> (N·M, C), (N·M, C)
+
+    Preprocess: resize para 224x224 e, por canal, conversão + Normalize num
+    único mul/sub escrito no tensor de entrada preallocado. O resize padrão é
+    o bilinear do PIL (o mesmo do transforms.Resize de antes), então as
+    features são as mesmas com que o svm_model.joblib foi treinado.
+    fast_resize=True usa cv2.resize (INTER_AREA ao reduzir), mais rápido, mas
+    muda as features: o SVM precisa ser retreinado com o mesmo ajuste.
 
     Extras:
       - use_half (CUDA): ativa autocast para reduzir latência/memória
       - warmup(): faz um forward de aquecimento
       - close(): remove o hook do modelo (bom para long-running apps)
+      - quantize (CPU): tronco conv1..layer4 em INT8 (PTQ estática) calibrado
+        com calib_frames (RGB uint8); use_half só vale em CUDA
     """
 
-    def __init__(self, device: Optional[str] = None, use_half: bool = True):
+    def __init__(
+        self,
+        device: Optional[str] = None,
+        use_half: bool = True,
+        quantize: bool = False,
+        calib_frames: Optional[List[np.ndarray]] = None,
+        fast_resize: bool = False,
+    ):
         self.device = device or ("cuda" if torch.cuda.is_available() else "cpu")
+        self.fast_resize = bool(fast_resize)
         self.use_half = bool(use_half and self.device.startswith("cuda"))
 
         model = models.resnet50(weights=models.ResNet50_Weights.IMAGENET1K_V2)
@@ -153,18 +221,76 @@ class ResNetFeature:
         layer = getattr(self.model, FEATURE_LAYER)
         self._hook_handle = layer.register_forward_hook(self._hook_capture)
 
-        self.preproc = transforms.Compose(
-            [
-                transforms.Resize((BACKBONE_INPUT, BACKBONE_INPUT)),
-                transforms.ToTensor(),
-                transforms.Normalize(
-                    mean=[0.485, 0.456, 0.406], std=[0.229, 0.224, 0.225]
-                ),
-            ]
+        # (x/255 - mean)/std = x*scale - shift, por canal RGB
+        std = np.array(IMAGENET_STD, dtype=np.float64)
+        self._scale = (1.0 / (255.0 * std)).tolist()
+        self._shift = (np.array(IMAGENET_MEAN, dtype=np.float64) / std).tolist()
+        # entrada [N,3,S,S] preallocada (cresce até o maior lote visto)
+        self._pin = self.device.startswith("cuda")
+        self._input = self._alloc_input(1)
+        self._small = np.empty((BACKBONE_INPUT, BACKBONE_INPUT, 3), dtype=np.uint8)
+
+        # tronco INT8 (conv1..layer4): substitui forward+hook quando ativo
+        self._qtrunk: Optional[torch.nn.Module] = None
+        if quantize:
+            self._quantize(calib_frames or [])
+
+    def _quantize(self, calib_frames: List[np.ndarray]):
+        if not self.device.startswith("cpu"):
+            logger.warning("[quant] INT8 só em CPU; ResNetFeature segue fp32.")
+            return
+        if not calib_frames:
+            logger.warning(
+                "[quant] sem frames de calibração; ResNetFeature segue fp32."
+            )
+            return
+        m = self.model
+        trunk = torch.nn.Sequential(
+            m.conv1, m.bn1, m.relu, m.maxpool, m.layer1, m.layer2, m.layer3, m.layer4
+        )
+        calib = [self._fill_input([fr]).clone() for fr in calib_frames]
+        try:
+            self._qtrunk = static_quantize_fx(trunk, calib)
+        except Exception as e:
+            logger.warning(f"[quant] falha ao quantizar ResNetFeature: {e}")
+
+    def _alloc_input(self, n: int) -> torch.Tensor:
+        return torch.empty(
+            (n, 3, BACKBONE_INPUT, BACKBONE_INPUT),
+            dtype=torch.float32,
+            pin_memory=self._pin,
         )
 
+    def _resize_into_small(self, im: ImageLike) -> None:
+        S = BACKBONE_INPUT
+        if self.fast_resize and not isinstance(im, Image.Image):
+            arr = cv2.cvtColor(im, cv2.COLOR_GRAY2RGB) if im.ndim == 2 else im
+            h, w = arr.shape[:2]
+            interp = cv2.INTER_AREA if (h > S or w > S) else cv2.INTER_LINEAR
+            cv2.resize(arr, (S, S), dst=self._small, interpolation=interp)
+            return
+        # bilinear do PIL (com antialias), igual ao transforms.Resize((S, S))
+        pil = im if isinstance(im, Image.Image) else Image.fromarray(im)
+        small = pil.convert("RGB").resize((S, S), Image.BILINEAR)
+        np.copyto(self._small, np.asarray(small))
+
+    def _fill_input(self, imgs: Sequence[ImageLike]) -> torch.Tensor:
+        """Imagens RGB -> tensor normalizado [N,3,S,S] (view do buffer preallocado)."""
+        n = len(imgs)
+        if self._input.shape[0] < n:
+            self._input = self._alloc_input(n)
+        src = torch.from_numpy(self._small)  # [S,S,3] uint8
+        for i, im in enumerate(imgs):
+            self._resize_into_small(im)
+            dst = self._input[i]
+            for c in range(3):
+                # uint8 -> float, /255 e Normalize no mesmo passo
+                torch.mul(src[:, :, c], self._scale[c], out=dst[c])
+                dst[c].sub_(self._shift[c])
+        return self._input[:n]
+
     def _hook_capture(self, _module, _inp, out):
-        # out: [B,C,Hf,Wf]; usamos apenas B=1
+        # out: [B,C,Hf,Wf] (B = imagens do forward em lote)
         # detach + contiguous para evitar guardar grafo
         self._feat_buf = out.detach()
 
@@ -179,7 +305,7 @@ class ResNetFeature:
 
     def warmup(self):
         """Faz um forward rápido só para compilar/cuDNN autotune etc."""
-        img = Image.new("RGB", (BACKBONE_INPUT, BACKBONE_INPUT), (0, 0, 0))
+        img = np.zeros((BACKBONE_INPUT, BACKBONE_INPUT, 3), dtype=np.uint8)
         _ = self._forward_and_get(img)
 
     def last_feat_shape(self) -> Optional[Tuple[int, int, int]]:
@@ -187,11 +313,11 @@ class ResNetFeature:
         return tuple(t.shape[1:]) if t is not None else None  # (C,Hf,Wf)
 
     @torch.inference_mode()
-    def _forward_and_get(self, img_pil: Image.Image) -> torch.Tensor:
+    def _forward_batch(self, imgs: Sequence[ImageLike]) -> torch.Tensor:
         self._feat_buf = None
-        x = (
-            self.preproc(img_pil).unsqueeze(0).to(self.device, non_blocking=True)
-        )  # [1,3,224,224]
+        x = self._fill_input(imgs).to(self.device, non_blocking=True)  # [N,3,224,224]
+        if self._qtrunk is not None:
+            return self._qtrunk(x).contiguous()  # [N,C,Hf,Wf]
         if self.use_half:
             # autocast fp16 em CUDA
             with torch.autocast(device_type="cuda", dtype=torch.float16):
@@ -201,70 +327,243 @@ class ResNetFeature:
         feat: torch.Tensor | None = self._feat_buf
         if feat is None:
             raise RuntimeError("Feature map não capturado; verifique o hook do layer4.")
-        return feat.squeeze(0).contiguous()  # [C,Hf,Wf]
+        return feat.contiguous()  # [N,C,Hf,Wf]
+
+    def _forward_and_get(self, img: ImageLike) -> torch.Tensor:
+        return self._forward_batch([img])[0]  # [C,Hf,Wf]
 
     @torch.inference_mode()
-    def region_embedding(
-        self, img_pil: Image.Image, poly_norm: List[List[float]]
+    def batch_region_embeddings(
+        self,
+        imgs: Sequence[ImageLike],
+        polys_per_img: List[List[List[List[float]]]],
     ) -> np.ndarray:
-        feat = self._forward_and_get(img_pil)  # [C,Hf,Wf]
-        _, Hf, Wf = feat.shape
-        mask = polygon_to_mask_on_feature_map(poly_norm, feat_h=Hf, feat_w=Wf)
-        mask_t = torch.from_numpy(mask).to(self.device).float()  # [Hf,Wf]
+        """
+        N imagens, M_i polígonos por imagem -> (ΣM_i, C), na ordem
+        imagem a imagem, polígono a polígono. Máscara vazia -> GAP.
+        """
+        feat = self._forward_batch(imgs).float()  # [N,C,Hf,Wf]
+        masks, valid = _stack_polygon_masks(polys_per_img, *feat.shape[2:])
+        emb = _batched_masked_means(feat, masks, valid)
+        return emb.detach().cpu().numpy()
+
+    def batch_region_and_background_embeddings(
+        self,
+        imgs: Sequence[ImageLike],
+        polys_per_img: List[List[List[List[float]]]],
+        margin_cells: int = 1,
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """Versão poly + fundo (fora do polígono dilatado) de batch_region_embeddings."""
+        emb_poly, emb_bg, _, _ = self._region_and_background(
+            imgs, polys_per_img, margin_cells
+        )
+        return emb_poly, emb_bg
 
-        if mask_t.sum() < 1.0:
-            emb = feat.mean(dim=(1, 2))  # GAP fallback
-        else:
-            m = mask_t.unsqueeze(0)  # [1,Hf,Wf]
-            emb = (feat * m).sum(dim=(1, 2)) / (m.sum() + 1e-6)
+    @torch.inference_mode()
+    def _region_and_background(
+        self,
+        imgs: Sequence[ImageLike],
+        polys_per_img: List[List[List[List[float]]]],
+        margin_cells: int,
+    ) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+        feat = self._forward_batch(imgs).float()  # [N,C,Hf,Wf]
+        masks, valid = _stack_polygon_masks(polys_per_img, *feat.shape[2:])
+        bg = _background_masks(masks, valid, margin_cells)
+        return (
+            _batched_masked_means(feat, masks, valid).detach().cpu().numpy(),
+            _batched_masked_means(feat, bg, valid).detach().cpu().numpy(),
+            _empty_masks(masks, valid),
+            _empty_masks(bg, valid),
+        )
+
+    def region_embedding(
+        self, img_pil: ImageLike, poly_norm: List[List[float]]
+    ) -> np.ndarray:
+        return self.batch_region_embeddings([img_pil], [[poly_norm]])[0]  # (C,)
 
-        return emb.detach().cpu().numpy()  # (C,)
+    def region_embeddings(
+        self, img_pil: ImageLike, polys: List[List[List[float]]]
+    ) -> np.ndarray:
+        """K polígonos da mesma imagem: 1 forward + pooling conjunto -> (K, C)."""
+        return self.batch_region_embeddings([img_pil], [polys])
 
-    @torch.inference_mode()
     def region_and_background_embeddings(
         self,
-        img_pil: Image.Image,
+        img_pil: ImageLike,
         poly_norm: List[List[float]],
         margin_cells: int = 1,
     ) -> Tuple[np.ndarray, np.ndarray, Dict[str, bool]]:
-        feat = self._forward_and_get(img_pil)  # [C,Hf,Wf]
-        _, Hf, Wf = feat.shape
+        emb_poly, emb_bg, poly_empty, bg_empty = self._region_and_background(
+            [img_pil], [[poly_norm]], margin_cells
+        )
+        return (
+            emb_poly[0],
+            emb_bg[0],
+            {"poly_empty": bool(poly_empty[0]), "bg_empty": bool(bg_empty[0])},
+        )
 
-        mask = polygon_to_mask_on_feature_map(poly_norm, feat_h=Hf, feat_w=Wf)
-        bg_mask = 1 - dilate_mask(mask, k=margin_cells)
 
-        mask_t = torch.from_numpy(mask).to(self.device).float()
-        bg_t = torch.from_numpy(bg_mask).to(self.device).float()
+# ----------------- Embeddings a partir dos feature maps do Patchcore -----------------
+@torch.inference_mode()
+def _regions_from_feature_maps(
+    feats: Dict[str, torch.Tensor],
+    polys: List[List[List[float]]],
+    margin_cells: Optional[int] = None,
+) -> Tuple[np.ndarray, Optional[np.ndarray], np.ndarray, np.ndarray]:
+    """
+    K polígonos pooled em cada layer ({layer: [C,h,w]}, na própria resolução)
+    e concatenados na ordem das layers -> (K, D). Com margin_cells, também o
+    fundo. Flags de vazio [K]: vazio em alguma layer.
+    """
+    poly_parts, bg_parts = [], []
+    poly_empty = np.zeros(len(polys), dtype=bool)
+    bg_empty = np.zeros(len(polys), dtype=bool)
+    for feat in feats.values():
+        feat = feat.float().unsqueeze(0)  # [1,C,h,w]
+        masks, valid = _stack_polygon_masks([polys], *feat.shape[2:])
+        poly_parts.append(_batched_masked_means(feat, masks, valid))
+        poly_empty |= _empty_masks(masks, valid)
+        if margin_cells is not None:
+            bg = _background_masks(masks, valid, margin_cells)
+            bg_parts.append(_batched_masked_means(feat, bg, valid))
+            bg_empty |= _empty_masks(bg, valid)
+    emb_poly = torch.cat(poly_parts, dim=1).detach().cpu().numpy()
+    emb_bg = torch.cat(bg_parts, dim=1).detach().cpu().numpy() if bg_parts else None
+    return emb_poly, emb_bg, poly_empty, bg_empty
+
+
+def region_embeddings_from_feature_maps(
+    feats: Dict[str, torch.Tensor], polys: List[List[List[float]]]
+) -> np.ndarray:
+    """Versão em lote de region_embedding_from_feature_maps: K polígonos -> (K, D)."""
+    return _regions_from_feature_maps(feats, polys)[0]
 
-        # poly
-        if mask_t.sum() < 1.0:
-            emb_poly = feat.mean(dim=(1, 2))
-            poly_empty = True
-        else:
-            m = mask_t.unsqueeze(0)
-            emb_poly = (feat * m).sum(dim=(1, 2)) / (m.sum() + 1e-6)
-            poly_empty = False
-
-        # background
-        if bg_t.sum() < 1.0:
-            emb_bg = feat.mean(dim=(1, 2))
-            bg_empty = True
-        else:
-            b = bg_t.unsqueeze(0)
-            emb_bg = (feat * b).sum(dim=(1, 2)) / (b.sum() + 1e-6)
-            bg_empty = False
 
-        return (
-            emb_poly.detach().cpu().numpy(),
-            emb_bg.detach().cpu().numpy(),
-            {"poly_empty": poly_empty, "bg_empty": bg_empty},
+def region_embedding_from_feature_maps(
+    feats: Dict[str, torch.Tensor], poly_norm: List[List[float]]
+) -> np.ndarray:
+    """
+    Embedding da região pooled nos feature maps que o Patchcore já calculou
+    ({layer: [C,h,w]}, ex.: layer2+layer3 -> 512+1024). Cada layer é pooled na
+    própria resolução e os vetores são concatenados na ordem das layers.
+    """
+    return region_embeddings_from_feature_maps(feats, [poly_norm])[0]
+
+
+def regions_and_background_from_feature_maps(
+    feats: Dict[str, torch.Tensor],
+    polys: List[List[List[float]]],
+    margin_cells: int = 1,
+) -> Tuple[np.ndarray, np.ndarray]:
+    """Versão poly + fundo de region_embeddings_from_feature_maps -> (K, D), (K, D)."""
+    emb_poly, emb_bg, _, _ = _regions_from_feature_maps(feats, polys, margin_cells)
+    return emb_poly, emb_bg
+
+
+def region_and_background_from_feature_maps(
+    feats: Dict[str, torch.Tensor],
+    poly_norm: List[List[float]],
+    margin_cells: int = 1,
+) -> Tuple[np.ndarray, np.ndarray, Dict[str, bool]]:
+    """Versão poly + fundo de region_embedding_from_feature_maps (para o treino)."""
+    emb_poly, emb_bg, poly_empty, bg_empty = _regions_from_feature_maps(
+        feats, [poly_norm], margin_cells
+    )
+    return (
+        emb_poly[0],
+        emb_bg[0],
+        {"poly_empty": bool(poly_empty[0]), "bg_empty": bool(bg_empty[0])},
+    )
+
+
+class PatchcoreFeature:
+    """
+    Mesma API do ResNetFeature, mas usando o backbone do Patchcore
+    (feature_source="patchcore"). Recebe um runner com extract_features(frames_rgb)
+    (model.anomaly_runner.PatchcoreRunner), garantindo o mesmo preprocess da
+    inferência online.
+    """
+
+    def __init__(self, runner):
+        self.runner = runner
+
+    def _feats(self, img_pil: Image.Image) -> Dict[str, torch.Tensor]:
+        frame_rgb = np.asarray(img_pil.convert("RGB"))
+        return self.runner.extract_features([frame_rgb])[0]
+
+    def _feats_batch(self, imgs: List[Image.Image]) -> List[Dict[str, torch.Tensor]]:
+        # o runner tem input preallocado para max_batch frames
+        step = max(1, int(getattr(self.runner, "max_batch", 1)))
+        frames = [
+            im if isinstance(im, np.ndarray) else np.asarray(im.convert("RGB"))
+            for im in imgs
+        ]
+        out: List[Dict[str, torch.Tensor]] = []
+        for i in range(0, len(frames), step):
+            out.extend(self.runner.extract_features(frames[i : i + step]))
+        return out
+
+    def batch_region_embeddings(
+        self,
+        imgs: List[Image.Image],
+        polys_per_img: List[List[List[List[float]]]],
+    ) -> np.ndarray:
+        # imagem sem polígono contribui (0, D): tudo vazio -> (0, D), como no ResNet
+        parts = [
+            region_embeddings_from_feature_maps(feats, polys)
+            for feats, polys in zip(self._feats_batch(imgs), polys_per_img)
+        ]
+        if not parts:
+            return np.empty((0, 0), dtype=np.float32)
+        return np.concatenate(parts, axis=0)
+
+    def batch_region_and_background_embeddings(
+        self,
+        imgs: List[Image.Image],
+        polys_per_img: List[List[List[List[float]]]],
+        margin_cells: int = 1,
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        poly_embs, bg_embs = [], []
+        for feats, polys in zip(self._feats_batch(imgs), polys_per_img):
+            e_poly, e_bg = regions_and_background_from_feature_maps(
+                feats, polys, margin_cells=margin_cells
+            )
+            poly_embs.append(e_poly)
+            bg_embs.append(e_bg)
+        if not poly_embs:
+            empty = np.empty((0, 0), dtype=np.float32)
+            return empty, empty
+        return np.concatenate(poly_embs), np.concatenate(bg_embs)
+
+    def region_embedding(
+        self, img_pil: Image.Image, poly_norm: List[List[float]]
+    ) -> np.ndarray:
+        return region_embedding_from_feature_maps(self._feats(img_pil), poly_norm)
+
+    def region_and_background_embeddings(
+        self,
+        img_pil: Image.Image,
+        poly_norm: List[List[float]],
+        margin_cells: int = 1,
+    ) -> Tuple[np.ndarray, np.ndarray, Dict[str, bool]]:
+        return region_and_background_from_feature_maps(
+            self._feats(img_pil), poly_norm, margin_cells=margin_cells
         )
 
+    def close(self):
+        pass
+
 
 # ----------------- Conveniência (opcional) -----------------
 def embed_region_from_frame_rgb(
     frame_rgb: np.ndarray, poly_norm: List[List[float]], extractor: ResNetFeature
 ) -> np.ndarray:
     """Atalho para inferência online: usa o frame RGB (np.uint8) já em memória."""
-    img_pil = Image.fromarray(frame_rgb)
-    return extractor.region_embedding(img_pil, poly_norm)
+    return extractor.batch_region_embeddings([frame_rgb], [[poly_norm]])[0]
+
+
+def embed_regions_from_frame_rgb(
+    frame_rgb: np.ndarray, polys: List[List[List[float]]], extractor: ResNetFeature
+) -> np.ndarray:
+    """Como embed_region_from_frame_rgb, para K polígonos do mesmo frame -> (K, C)."""
+    return extractor.batch_region_embeddings([frame_rgb], [polys])
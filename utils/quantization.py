@@ -0,0 +1,92 @@
+# quantization.py
+# PTQ INT8 (estática, FX graph mode) para os backbones em CPU, calibrada com
+# frames da pasta de dataset criada por create_dataset (dataset/<nome>/*.jpg).
+
+from __future__ import annotations
+
+import copy
+import glob
+import os
+import random
+from typing import List, Sequence, Tuple
+
+import cv2
+import numpy as np
+import torch
+
+from utils.logger import logger
+
+
+def load_calibration_frames(
+    dataset_dir: str,
+    max_frames: int = 64,
+    holdout_frac: float = 0.25,
+    seed: int = 42,
+) -> Tuple[List[np.ndarray], List[np.ndarray]]:
+    """
+    Lê até max_frames imagens da pasta (RGB uint8) e separa em
+    (calibração, held-out) para medir o drift contra o fp32.
+    """
+    paths = sorted(
+        p
+        for ext in ("*.jpg", "*.jpeg", "*.png", "*.bmp")
+        for p in glob.glob(os.path.join(dataset_dir, ext))
+    )
+    if not paths:
+        raise RuntimeError(f"Nenhuma imagem de calibração em '{dataset_dir}'.")
+    random.Random(seed).shuffle(paths)
+    paths = paths[:max_frames]
+
+    frames: List[np.ndarray] = []
+    for p in paths:
+        img = cv2.imread(p)
+        if img is not None:
+            frames.append(cv2.cvtColor(img, cv2.COLOR_BGR2RGB))
+
+    n_hold = int(round(len(frames) * holdout_frac)) if len(frames) > 1 else 0
+    n_hold = min(n_hold, len(frames) - 1)
+    calib = frames[: len(frames) - n_hold]
+    holdout = frames[len(frames) - n_hold :]
+    return calib, holdout
+
+
+def _pick_engine(backend: str) -> str:
+    engines = torch.backends.quantized.supported_engines
+    for eng in (backend, "x86", "fbgemm", "qnnpack"):
+        if eng in engines:
+            return eng
+    raise RuntimeError(f"Nenhum engine de quantização disponível ({engines}).")
+
+
+def static_quantize_fx(
+    module: torch.nn.Module,
+    calib_inputs: Sequence[torch.Tensor],
+    backend: str = "x86",
+) -> torch.nn.Module:
+    """
+    Quantização estática INT8 via FX: prepare_fx -> calibração -> convert_fx.
+    Entradas/saídas continuam float (quant/dequant nas bordas do grafo).
+    Só CPU: os kernels quantizados do PyTorch não rodam em CUDA.
+    """
+    from torch.ao.quantization import get_default_qconfig_mapping
+    from torch.ao.quantization.quantize_fx import convert_fx, prepare_fx
+
+    if not calib_inputs:
+        raise ValueError("calib_inputs vazio.")
+    engine = _pick_engine(backend)
+    torch.backends.quantized.engine = engine
+
+    float_module = copy.deepcopy(module).cpu().eval()
+    example = (calib_inputs[0].cpu(),)
+    prepared = prepare_fx(
+        float_module, get_default_qconfig_mapping(engine), example_inputs=example
+    )
+    # no_grad (não inference_mode): os observers atualizam buffers in-place
+    with torch.no_grad():
+        for x in calib_inputs:
+            prepared(x.cpu())
+    quantized = convert_fx(prepared)
+    logger.info(
+        f"[quant] backbone INT8 ({engine}) calibrado com {len(calib_inputs)} amostras"
+    )
+    return quantized
@@ -0,0 +1,338 @@
+# shm_ring.py
+# Transporte de frames entre processos por memória compartilhada: a captura
+# (BufferedVideoStream, no processo principal) escreve cada frame num anel de
+# slots em multiprocessing.shared_memory e só um descritor pequeno
+# (nome do anel, slot, seq, ts, shape, dtype) atravessa a fronteira, por uma
+# multiprocessing.Queue. O leitor (processo de inferência) expõe a mesma
+# interface do stream (read/read_record/pause/resume/stop/get_status).
+
+from __future__ import annotations
+
+import os
+import queue
+import threading
+import time
+from multiprocessing import shared_memory
+from typing import Optional
+
+import numpy as np
+
+from utils.camera_stream import BufferedVideoStream, FrameRecord
+from utils.logger import logger
+
+_HEADER_ALIGN = 4096
+
+
+def _head_to_dict(head) -> Optional[dict]:
+    """tSdkFrameHead (ctypes) -> dict simples, que atravessa o pickle."""
+    if head is None:
+        return None
+    if isinstance(head, dict):
+        return head
+    fields = getattr(head, "_fields_", None)
+    if not fields:
+        return None
+    out = {}
+    for f in fields:
+        v = getattr(head, f[0])
+        if isinstance(v, (int, float)):
+            out[f[0]] = v
+    return out
+
+
+class ShmFrameRing:
+    """
+    n_slots frames de até slot_bytes cada, num único bloco de shared memory.
+
+    Cabeçalho: int64[n_slots] com o seq do frame em cada slot (-1 durante a
+    escrita). O leitor confere o seq antes e depois da cópia (seqlock): se o
+    escritor deu a volta no anel nesse meio tempo, o frame é descartado.
+    """
+
+    def __init__(
+        self,
+        n_slots: int,
+        slot_bytes: int,
+        name: Optional[str] = None,
+        create: bool = True,
+    ):
+        self.n_slots = max(2, int(n_slots))
+        self.slot_bytes = int(slot_bytes)
+        hdr = self.n_slots * 8
+        self._data_off = (hdr + _HEADER_ALIGN - 1) // _HEADER_ALIGN * _HEADER_ALIGN
+        size = self._data_off + self.n_slots * self.slot_bytes
+        self.owner = create
+        if create:
+            self.shm = shared_memory.SharedMemory(name=name, create=True, size=size)
+        else:
+            try:
+                # 3.13+: quem só anexa não registra no resource_tracker (senão
+                # o tracker do leitor apaga o bloco da captura ao sair)
+                self.shm = shared_memory.SharedMemory(name=name, track=False)
+            except TypeError:
+                self.shm = shared_memory.SharedMemory(name=name)
+        self.name = self.shm.name
+        self.seqs = np.ndarray((self.n_slots,), dtype=np.int64, buffer=self.shm.buf)
+        if create:
+            self.seqs[:] = -1
+
+    @classmethod
+    def attach(cls, name: str, n_slots: int, slot_bytes: int) -> "ShmFrameRing":
+        return cls(n_slots, slot_bytes, name=name, create=False)
+
+    def _view(self, slot: int, shape, dtype) -> Optional[np.ndarray]:
+        dt = np.dtype(dtype)
+        if int(np.prod(shape)) * dt.itemsize > self.slot_bytes:
+            return None
+        off = self._data_off + slot * self.slot_bytes
+        return np.ndarray(shape, dtype=dt, buffer=self.shm.buf, offset=off)
+
+    def write(self, frame: np.ndarray, seq: int) -> int:
+        slot = seq % self.n_slots
+        self.seqs[slot] = -1
+        dst = self._view(slot, frame.shape, frame.dtype)
+        np.copyto(dst, frame)
+        self.seqs[slot] = seq
+        return slot
+
+    def read(self, slot: int, seq: int, shape, dtype) -> Optional[np.ndarray]:
+        """Cópia do frame (ou None se o slot já foi sobrescrito)."""
+        if self.seqs[slot] != seq:
+            return None
+        src = self._view(slot, shape, dtype)
+        if src is None:
+            return None
+        out = src.copy()
+        if self.seqs[slot] != seq:
+            return None
+        return out
+
+    def close(self, unlink: bool = False) -> None:
+        # as views do numpy precisam sumir antes do close do mmap
+        self.seqs = None
+        try:
+            self.shm.close()
+        except Exception:
+            pass
+        if unlink:
+            try:
+                self.shm.unlink()
+            except Exception:
+                pass
+
+
+class ShmChannel:
+    """
+    Par fila de descritores + evento de pausa entre a captura e um leitor.
+    Criado no processo principal e passado ao processo de inferência (spawn).
+    """
+
+    def __init__(self, ctx, po: int, max_queue: int = 2):
+        self.po = po
+        self.descs = ctx.Queue(maxsize=max(1, int(max_queue)))
+        self.paused = ctx.Event()
+        self.paused.set()  # como o stream: começa pausado
+
+    def publish(self, desc: tuple) -> bool:
+        """Fila cheia: descarta o descritor mais antigo (o leitor quer o mais novo)."""
+        for _ in range(2):
+            try:
+                self.descs.put_nowait(desc)
+                return True
+            except queue.Full:
+                try:
+                    self.descs.get_nowait()
+                except queue.Empty:
+                    pass
+        return False
+
+
+class ShmFramePublisher(threading.Thread):
+    """
+    Processo de captura: lê o BufferedVideoStream e publica no anel.
+    O anel é (re)criado no 1º frame e quando o tamanho do frame muda.
+    """
+
+    def __init__(
+        self,
+        stream: BufferedVideoStream,
+        channel: ShmChannel,
+        n_slots: int = 4,
+        name: Optional[str] = None,
+    ):
+        super().__init__(daemon=True, name=name or f"shm_pub_{channel.po}")
+        self.stream = stream
+        self.channel = channel
+        self.n_slots = max(2, int(n_slots))
+        self._stop_event = threading.Event()
+        self._ring: Optional[ShmFrameRing] = None
+        self._gen = 0
+        self.published = 0
+
+    def _ensure_ring(self, nbytes: int) -> ShmFrameRing:
+        ring = self._ring
+        if ring is not None and nbytes <= ring.slot_bytes:
+            return ring
+        if ring is not None:
+            # leitores reanexam pelo nome novo que vem no descritor
+            ring.close(unlink=True)
+        self._gen += 1
+        name = f"tc_po{self.channel.po}_{os.getpid()}_{self._gen}"
+        self._ring = ShmFrameRing(self.n_slots, nbytes, name=name)
+        logger.info(
+            f"[PO {self.channel.po}] anel shm {name}: "
+            f"{self.n_slots} x {nbytes / 1e6:.1f} MB"
+        )
+        return self._ring
+
+    def run(self):
+        last_seq = None
+        paused = None
+        try:
+            while not self._stop_event.is_set():
+                # o leitor (watcher do PO) decide se a captura roda
+                want_pause = self.channel.paused.is_set()
+                if want_pause != paused:
+                    paused = want_pause
+                    if paused:
+                        self.stream.pause()
+                    else:
+                        self.stream.resume()
+                if paused:
+                    last_seq = None
+                    self._stop_event.wait(0.1)
+                    continue
+
+                rec = self.stream.read_record(timeout=0.2)
+                if rec is None or rec.seq == last_seq:
+                    continue
+                last_seq = rec.seq
+
+                frame = rec.frame
+                ring = self._ensure_ring(frame.nbytes)
+                slot = ring.write(frame, rec.seq)
+                self.channel.publish(
+                    (
+                        ring.name,
+                        ring.n_slots,
+                        ring.slot_bytes,
+                        slot,
+                        rec.seq,
+                        rec.ts,
+                        frame.shape,
+                        frame.dtype.str,
+                        _head_to_dict(rec.head),
+                    )
+                )
+                self.published += 1
+        except Exception as e:
+            logger.error(f"[PO {self.channel.po}] erro no publicador shm: {e}")
+        finally:
+            if self._ring is not None:
+                self._ring.close(unlink=True)
+                self._ring = None
+
+    def stop(self, timeout: float = 2.0):
+        self._stop_event.set()
+        self.join(timeout=timeout)
+
+
+class ShmFrameReader:
+    """
+    Processo de inferência: mesma interface do BufferedVideoStream usada pelo
+    run_inference. Cada read copia o frame do slot para a memória local.
+    """
+
+    def __init__(self, channel: ShmChannel):
+        self.channel = channel
+        self._ring: Optional[ShmFrameRing] = None
+        self.last_record: Optional[FrameRecord] = None
+        self.trigger_mode = "continuous"
+        self.read_frames = 0
+        self.torn = 0  # slot sobrescrito antes da cópia
+        self.stale = 0  # descritores pulados para ficar no mais novo
+
+    # ===== ciclo de vida (compatível) =====
+    def start(self):
+        return self
+
+    def pause(self):
+        self.channel.paused.set()
+        self.last_record = None
+        try:
+            while True:
+                self.channel.descs.get_nowait()
+        except queue.Empty:
+            pass
+
+    def resume(self):
+        self.channel.paused.clear()
+
+    def is_reading(self) -> bool:
+        return not self.channel.paused.is_set()
+
+    def stop(self):
+        if self._ring is not None:
+            self._ring.close(unlink=False)
+            self._ring = None
+
+    # ===== leitura =====
+    def _take(self, timeout: float) -> Optional[tuple]:
+        try:
+            desc = (
+                self.channel.descs.get(timeout=timeout)
+                if timeout and timeout > 0
+                else self.channel.descs.get_nowait()
+            )
+        except queue.Empty:
+            return None
+        # fica só com o mais novo
+        while True:
+            try:
+                desc = self.channel.descs.get_nowait()
+                self.stale += 1
+            except queue.Empty:
+                return desc
+
+    def read_record(
+        self, copy: bool = False, timeout: float = 0.0
+    ) -> Optional[FrameRecord]:
+        desc = self._take(timeout)
+        if desc is None:
+            return self.last_record
+        name, n_slots, slot_bytes, slot, seq, ts, shape, dtype, head = desc
+        if self._ring is None or self._ring.name != name:
+            if self._ring is not None:
+                self._ring.close(unlink=False)
+            try:
+                self._ring = ShmFrameRing.attach(name, n_slots, slot_bytes)
+            except FileNotFoundError:
+                # anel recriado pela captura (mudou o tamanho do frame)
+                self._ring = None
+                return self.last_record
+        frame = self._ring.read(slot, seq, shape, dtype)
+        if frame is None:
+            self.torn += 1
+            return self.last_record
+        self.read_frames += 1
+        # já é uma cópia local: copy=True não precisa copiar de novo
+        self.last_record = FrameRecord(frame, seq, ts, head)
+        return self.last_record
+
+    def read(self, copy: bool = False, timeout: float = 0.0) -> Optional[np.ndarray]:
+        rec = self.read_record(copy=copy, timeout=timeout)
+        return rec.frame if rec is not None else None
+
+    def get_status(self) -> dict:
+        rec = self.last_record
+        return {
+            "backend": "shm",
+            "ring": self._ring.name if self._ring is not None else None,
+            "paused": self.channel.paused.is_set(),
+            "read_frames": self.read_frames,
+            "torn": self.torn,
+            "stale": self.stale,
+            "last_frame_age_ms": (
+                int((time.monotonic() - rec.ts) * 1000) if rec is not None else None
+            ),
+        }
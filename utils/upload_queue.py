@@ -0,0 +1,233 @@
+# upload_queue.py
+# Envio assíncrono para a API: o loop de inferência só enfileira e segue.
+# Workers em background usam o ApiController (sessão requests com pool), então
+# retries, 429 e reset de sessão bloqueiam só o worker, nunca a inferência.
+# Com um DetectionSpool, o que falharia/seria descartado vai para o disco.
+
+from __future__ import annotations
+
+import threading
+import time
+from collections import deque
+from typing import Deque, List, Optional, Tuple
+
+from utils.api_controller import ApiController
+from utils.logger import logger
+from utils.upload_spool import DetectionSpool
+
+
+class AsyncUploader:
+    """
+    Fila limitada (descarta a mais antiga quando cheia) + pool de workers.
+
+    - enqueue_frame(files, data): 1 POST multipart em /anomalias/upload por item
+    - enqueue_event(payload): eventos de /Coletor são agrupados; o worker junta
+      até batch_max eventos pendentes (esperando até batch_wait_ms pelo lote)
+      num único post_event(list)
+
+    spool: envios com falha reenviável, itens descartados por fila cheia e
+    pendências no stop() vão para o spool em disco em vez de se perderem.
+    """
+
+    def __init__(
+        self,
+        api: ApiController,
+        workers: int = 2,
+        max_queue: int = 256,
+        batch_max: int = 32,
+        batch_wait_ms: float = 200.0,
+        name: str = "uploader",
+        spool: DetectionSpool | None = None,
+    ):
+        self.api = api
+        self.spool = spool
+        self.workers = max(1, int(workers))
+        self.max_queue = max(1, int(max_queue))
+        self.batch_max = max(1, int(batch_max))
+        self.batch_wait = max(0.0, float(batch_wait_ms)) / 1000.0
+        self.name = name
+
+        # item: ("frame", (files, data)) | ("event", dict)
+        self._q: Deque[Tuple[str, object]] = deque()
+        self._cv = threading.Condition()
+        self._stop_event = threading.Event()
+        self._threads: List[threading.Thread] = []
+        self._busy = 0
+
+        self.sent_frames = 0
+        self.sent_events = 0
+        self.event_batches = 0
+        self.failed = 0
+        self.dropped = 0
+        self.spooled = 0
+        self._send_ms_ema: Optional[float] = None
+
+    # ===== produtor (thread de inferência) =====
+    def _put(self, kind: str, item) -> bool:
+        with self._cv:
+            if self._stop_event.is_set():
+                return False
+            oldest = None
+            if len(self._q) >= self.max_queue:
+                oldest = self._q.popleft()
+                self.dropped += 1
+                if self.dropped == 1 or self.dropped % 100 == 0:
+                    logger.warning(
+                        f"[{self.name}] fila cheia; descartando o mais antigo "
+                        f"(descartados={self.dropped})"
+                    )
+            self._q.append((kind, item))
+            self._cv.notify()
+        if oldest is not None:
+            self._to_spool(*oldest)
+        return True
+
+    def _to_spool(self, kind: str, item) -> None:
+        if self.spool is None:
+            return
+        try:
+            if kind == "frame":
+                files, data = item
+                self.spool.put_frame(files, data)
+            else:
+                self.spool.put_event(item if isinstance(item, list) else [item])
+            with self._cv:
+                self.spooled += 1
+        except Exception as e:
+            logger.error(f"[{self.name}] falha ao gravar no spool: {e}")
+
+    def enqueue_frame(self, files: dict, data: dict) -> bool:
+        """files com bytes (não buffers reaproveitados pelo chamador)."""
+        return self._put("frame", (files, data))
+
+    def enqueue_event(self, payload: dict | list[dict]) -> bool:
+        items = payload if isinstance(payload, list) else [payload]
+        ok = True
+        for p in items:
+            ok = self._put("event", p) and ok
+        return ok
+
+    # ===== workers =====
+    def _take_events(self, first: dict) -> List[dict]:
+        """Chamado com o lock: junta eventos pendentes (em qualquer posição)."""
+        batch = [first]
+        deadline = time.monotonic() + self.batch_wait
+        while len(batch) < self.batch_max:
+            keep: Deque[Tuple[str, object]] = deque()
+            while self._q and len(batch) < self.batch_max:
+                kind, item = self._q.popleft()
+                if kind == "event":
+                    batch.append(item)
+                else:
+                    keep.append((kind, item))
+            # frames continuam na ordem, na frente da fila
+            keep.extend(self._q)
+            self._q = keep
+            remaining = deadline - time.monotonic()
+            if len(batch) >= self.batch_max or remaining <= 0:
+                break
+            if self._stop_event.is_set():
+                break
+            self._cv.wait(timeout=remaining)
+        return batch
+
+    def _worker(self):
+        while True:
+            with self._cv:
+                while not self._q and not self._stop_event.is_set():
+                    self._cv.wait(timeout=0.5)
+                if not self._q:
+                    return  # parado e fila vazia
+                kind, item = self._q.popleft()
+                self._busy += 1
+                if kind == "event":
+                    item = self._take_events(item)
+
+            t0 = time.perf_counter()
+            try:
+                if kind == "frame":
+                    files, data = item
+                    status = self.api.send_frame_status(files=files, data=data)
+                else:
+                    status = self.api.post_event_status(item)
+            except Exception as e:
+                logger.error(f"[{self.name}] erro no envio ({kind}): {e}")
+                status = 0
+            dt = (time.perf_counter() - t0) * 1000.0
+            ok = ApiController._is_success_status(status)
+            if not ok and ApiController.is_retryable_status(status):
+                self._to_spool(kind, item)
+
+            with self._cv:
+                self._busy -= 1
+                self._send_ms_ema = (
+                    dt
+                    if self._send_ms_ema is None
+                    else 0.9 * self._send_ms_ema + 0.1 * dt
+                )
+                if not ok:
+                    self.failed += 1
+                elif kind == "frame":
+                    self.sent_frames += 1
+                else:
+                    self.sent_events += len(item)
+                    self.event_batches += 1
+                self._cv.notify_all()
+
+    # ===== ciclo de vida =====
+    def start(self):
+        for i in range(self.workers):
+            t = threading.Thread(
+                target=self._worker, name=f"{self.name}_{i}", daemon=True
+            )
+            t.start()
+            self._threads.append(t)
+        return self
+
+    def flush(self, timeout: float = 10.0) -> bool:
+        """Espera a fila esvaziar (e os envios em curso terminarem)."""
+        deadline = time.monotonic() + timeout
+        with self._cv:
+            while self._q or self._busy:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return False
+                self._cv.wait(timeout=remaining)
+        return True
+
+    def stop(self, flush: bool = True, timeout: float = 10.0):
+        if flush:
+            self.flush(timeout=timeout)
+        with self._cv:
+            self._stop_event.set()
+            pending = list(self._q)
+            self._q.clear()
+            self._cv.notify_all()
+        for t in self._threads:
+            t.join(timeout=timeout)
+        self._threads.clear()
+        if pending:
+            if self.spool is not None:
+                for kind, item in pending:
+                    self._to_spool(kind, item)
+                logger.info(
+                    f"[{self.name}] {len(pending)} envio(s) pendente(s) no spool"
+                )
+            else:
+                logger.warning(
+                    f"[{self.name}] {len(pending)} envio(s) pendente(s) descartado(s)"
+                )
+
+    def get_status(self) -> dict:
+        with self._cv:
+            return {
+                "queued": len(self._q),
+                "in_flight": self._busy,
+                "sent_frames": self.sent_frames,
+                "sent_events": self.sent_events,
+                "event_batches": self.event_batches,
+                "failed": self.failed,
+                "dropped": self.dropped,
+                "spooled": self.spooled,
+                "send_ms_ema": self._send_ms_ema,
+            }
@@ -0,0 +1,224 @@
+# upload_spool.py
+# Spool em disco (SQLite em WAL) para detecções que não puderam ser enviadas:
+# payload + JPEG ficam gravados e um drainer em background reenvia, em taxa
+# controlada, quando /anomalias/upload volta a responder. Tamanho limitado;
+# ao estourar, os itens mais antigos são descartados primeiro.
+
+from __future__ import annotations
+
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Optional
+
+from utils.api_controller import ApiController
+from utils.logger import logger
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS spool (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    created REAL NOT NULL,
+    kind TEXT NOT NULL,
+    meta TEXT NOT NULL,
+    blob BLOB,
+    size INTEGER NOT NULL,
+    attempts INTEGER NOT NULL DEFAULT 0
+)
+"""
+
+
+class DetectionSpool:
+    """
+    kind "frame": meta = {"data": payload, "field", "filename", "content_type"},
+                  blob = bytes do JPEG -> api.send_frame_status
+    kind "event": meta = lista de eventos -> api.post_event_status
+
+    Falha reenviável (rede/5xx/429/401) mantém o item e aplica backoff
+    exponencial no drainer; rejeição definitiva (4xx) descarta o item.
+    """
+
+    def __init__(
+        self,
+        api: ApiController,
+        path: str = "spool/detections.db",
+        max_mb: float = 512.0,
+        drain_rate_per_sec: float = 2.0,
+        max_backoff_sec: float = 60.0,
+        name: str = "spool",
+    ):
+        self.api = api
+        self.path = path
+        self.max_bytes = int(float(max_mb) * 1024 * 1024)
+        self.drain_interval = 1.0 / max(1e-3, float(drain_rate_per_sec))
+        self.max_backoff = max(1.0, float(max_backoff_sec))
+        self.name = name
+
+        d = os.path.dirname(path)
+        if d:
+            os.makedirs(d, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(
+            path, check_same_thread=False, isolation_level=None
+        )
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(_SCHEMA)
+        row = self._conn.execute(
+            "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM spool"
+        ).fetchone()
+        self._count, self._bytes = int(row[0]), int(row[1])
+
+        self._closed = False
+        self._stop_event = threading.Event()
+        self._wake = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+        self.replayed = 0
+        self.rejected = 0
+        self.evicted = 0
+        self._backoff = 0.0
+
+        if self._count:
+            logger.info(
+                f"[{self.name}] {self._count} item(ns) pendente(s) em {path} "
+                f"({self._bytes / 1e6:.1f} MB)"
+            )
+
+    # ===== escrita =====
+    def _append(self, kind: str, meta, blob: Optional[bytes]) -> None:
+        meta_s = json.dumps(meta, ensure_ascii=False)
+        size = len(meta_s) + (len(blob) if blob else 0)
+        with self._lock:
+            if self._closed:
+                logger.warning(f"[{self.name}] spool fechado; item descartado")
+                return
+            self._conn.execute(
+                "INSERT INTO spool (created, kind, meta, blob, size) VALUES (?, ?, ?, ?, ?)",
+                (time.time(), kind, meta_s, blob, size),
+            )
+            self._count += 1
+            self._bytes += size
+            self._evict_locked()
+        self._wake.set()
+
+    def _evict_locked(self) -> None:
+        while self._bytes > self.max_bytes and self._count > 1:
+            row = self._conn.execute(
+                "SELECT id, size FROM spool ORDER BY id LIMIT 1"
+            ).fetchone()
+            if row is None:
+                break
+            self._conn.execute("DELETE FROM spool WHERE id = ?", (row[0],))
+            self._count -= 1
+            self._bytes -= int(row[1])
+            self.evicted += 1
+            if self.evicted == 1 or self.evicted % 100 == 0:
+                logger.warning(
+                    f"[{self.name}] limite de {self.max_bytes / 1e6:.0f} MB; "
+                    f"descartando os mais antigos (descartados={self.evicted})"
+                )
+
+    def put_frame(self, files: dict, data: dict) -> None:
+        # files no formato do requests: {"campo": (nome, bytes, content_type)}
+        field, (filename, content, content_type) = next(iter(files.items()))
+        meta = {
+            "data": data,
+            "field": field,
+            "filename": filename,
+            "content_type": content_type,
+        }
+        self._append("frame", meta, bytes(content))
+
+    def put_event(self, payload: list[dict]) -> None:
+        self._append("event", list(payload), None)
+
+    # ===== drainer =====
+    def _peek(self):
+        with self._lock:
+            return self._conn.execute(
+                "SELECT id, kind, meta, blob, size FROM spool ORDER BY id LIMIT 1"
+            ).fetchone()
+
+    def _delete(self, item_id: int, size: int) -> None:
+        with self._lock:
+            cur = self._conn.execute("DELETE FROM spool WHERE id = ?", (item_id,))
+            if cur.rowcount:  # pode ter sido despejado pelo limite nesse meio tempo
+                self._count -= 1
+                self._bytes -= int(size)
+
+    def _send(self, kind: str, meta_s: str, blob: Optional[bytes]) -> int:
+        meta = json.loads(meta_s)
+        if kind == "event":
+            return self.api.post_event_status(meta)
+        files = {meta["field"]: (meta["filename"], blob, meta["content_type"])}
+        return self.api.send_frame_status(files=files, data=meta["data"])
+
+    def _drain_loop(self):
+        while not self._stop_event.is_set():
+            row = self._peek()
+            if row is None:
+                self._wake.wait(timeout=1.0)
+                self._wake.clear()
+                continue
+
+            item_id, kind, meta_s, blob, size = row
+            try:
+                status = self._send(kind, meta_s, blob)
+            except Exception as e:
+                logger.error(f"[{self.name}] erro no reenvio: {e}")
+                status = 0
+
+            if ApiController._is_success_status(status):
+                self._delete(item_id, size)
+                self.replayed += 1
+                self._backoff = 0.0
+                self._stop_event.wait(self.drain_interval)
+            elif ApiController.is_retryable_status(status):
+                with self._lock:
+                    self._conn.execute(
+                        "UPDATE spool SET attempts = attempts + 1 WHERE id = ?",
+                        (item_id,),
+                    )
+                # API fora: espera crescente antes de tentar de novo
+                self._backoff = min(self.max_backoff, max(1.0, self._backoff * 2.0))
+                self._stop_event.wait(self._backoff)
+            else:
+                logger.error(
+                    f"[{self.name}] item {item_id} rejeitado ({status}); descartando"
+                )
+                self._delete(item_id, size)
+                self.rejected += 1
+
+    # ===== ciclo de vida =====
+    def start(self):
+        self._thread = threading.Thread(
+            target=self._drain_loop, name=f"{self.name}_drain", daemon=True
+        )
+        self._thread.start()
+        return self
+
+    def stop(self, timeout: float = 5.0):
+        self._stop_event.set()
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join(timeout=timeout)
+            self._thread = None
+        with self._lock:
+            self._closed = True
+            try:
+                self._conn.close()
+            except Exception:
+                pass
+
+    def get_status(self) -> dict:
+        with self._lock:
+            return {
+                "pending": self._count,
+                "bytes": self._bytes,
+                "replayed": self.replayed,
+                "rejected": self.rejected,
+                "evicted": self.evicted,
+                "backoff_sec": self._backoff,
+            }